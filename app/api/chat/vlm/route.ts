@@ -1,5 +1,5 @@
 import { type NextRequest, NextResponse } from "next/server"
-import { saveTempImage, cleanupTempFile, executeSearch } from "@/lib/vlm-service"
+import { executeSearch } from "@/lib/vlm-service"
 import path from "path"
 import fs from "fs"
 
@@ -19,16 +19,13 @@ export async function POST(request: NextRequest) {
   try {
     const { message, imageBase64, searchType } = await request.json()
 
-    let imagePath: string | undefined
+    let imageBuffer: Buffer | undefined
 
     // Process image if provided
     if (imageBase64) {
-      // Extract base64 data
+      // Extract base64 data; the search reads the decoded bytes from stdin
       const base64Data = imageBase64.replace(/^data:image\/\w+;base64,/, "")
-      const buffer = Buffer.from(base64Data, "base64")
-
-      // Save to temp file
-      imagePath = await saveTempImage(buffer)
+      imageBuffer = Buffer.from(base64Data, "base64")
     }
 
     // Check if we have the necessary files for the VLM
@@ -44,7 +41,7 @@ export async function POST(request: NextRequest) {
     // Use the actual VLM search with your dataset
     if (datasetAvailable && embeddingsAvailable && fs.existsSync(CLIP_SEARCH_SCRIPT)) {
       try {
-        const searchResults = await executeSearch(searchType || "text", message, imagePath)
+        const searchResults = await executeSearch(searchType || "text", message, imageBuffer)
         results = searchResults.results || []
 
         if (results.length === 0 && isDev) {
@@ -62,11 +59,6 @@ export async function POST(request: NextRequest) {
       results = []
     }
 
-    // Clean up temp file if it was created
-    if (imagePath) {
-      cleanupTempFile(imagePath)
-    }
-
     // If no results were found, return an appropriate message
     if (results.length === 0) {
       // Try a fallback search with a more general term
@@ -94,7 +86,7 @@ export async function POST(request: NextRequest) {
             generalTerm = terms[0]
           }
 
-          const fallbackResults = await executeSearch("text", generalTerm, imagePath)
+          const fallbackResults = await executeSearch("text", generalTerm)
           results = fallbackResults.results || []
         } catch (fallbackError) {
           if (isDev) console.error("[Server] Error in fallback search:", fallbackError)
@@ -2,9 +2,7 @@ import { type NextRequest, NextResponse } from "next/server"
 import {
   checkDatasetAvailability,
   checkEmbeddingsAvailability,
-  saveTempImage,
   executeSearch,
-  cleanupTempFile,
   validateFashionImage,
   validateTextImageCoherence,
 } from "@/lib/vlm-service"
@@ -22,10 +20,10 @@ export async function POST(request: NextRequest) {
     const datasetAvailable = await checkDatasetAvailability()
     const embeddingsAvailable = await checkEmbeddingsAvailability()
 
-    let imagePath: string | undefined
+    let imageBuffer: Buffer | undefined
     let dominantColors: string[] | undefined
 
-    // Save uploaded image to temp directory if provided
+    // Read the uploaded image into memory if provided
     if (imageFile) {
       const buffer = Buffer.from(await imageFile.arrayBuffer())
 
@@ -67,7 +65,7 @@ export async function POST(request: NextRequest) {
         }
       }
 
-      imagePath = await saveTempImage(buffer)
+      imageBuffer = buffer
     }
 
     // If dataset or embeddings are not available, return an error
@@ -83,12 +81,7 @@ export async function POST(request: NextRequest) {
     }
 
     // Execute search with dominant colors information
-    const results = await executeSearch(searchType, query, imagePath, topK, dominantColors)
-
-    // Clean up temp file if it was created
-    if (imagePath) {
-      cleanupTempFile(imagePath)
-    }
+    const results = await executeSearch(searchType, query, imageBuffer, topK, dominantColors)
 
     // If no results were found, return a specific message
     if (!results.results || results.results.length === 0) {
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Versioned Search Artifacts
+
+Keeps each embeddings build in its own directory so a running search service
+never reads a half-written index:
+
+  embeddings/
+    CURRENT                  name of the live version (replaced atomically)
+    versions/<version>/      fashion_faiss.index, image_matrix.npy, ..., manifest.json
+    user_profiles.sqlite     per-user data stays outside the versions
+
+generate_embeddings.py --publish builds into versions/<version>.partial, writes
+manifest.json (files and sizes, model, dimension), renames the directory and
+only then repoints CURRENT. Long-running clip_search processes watch CURRENT
+and swap the new version in between requests (see ArtifactReloader there).
+Without a CURRENT file the flat embeddings/ layout is used, as before.
+
+Each CLIP model has its own artifact root, laid out as above: embeddings/ itself
+for the default ViT-B/32, embeddings/models/<model>/ (e.g. models/ViT-B-16) for
+any other. Every build records model.json (model, dimension, whether vectors
+are L2-normalized, index metric) so a process never searches one model's
+vectors with another model's queries.
+
+  list      show versions and which one is live (--model for another model's)
+  activate  point CURRENT at an existing version (publish a rebuild, or roll back)
+  prune     delete old versions, keeping the newest N and the live one
+  models    show the models with artifacts and what each was built with
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+CURRENT_POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+MANIFEST = "manifest.json"
+
+DEFAULT_MODEL = "ViT-B/32"
+MODELS_DIR = "models"
+MODEL_INFO = "model.json"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage versioned embedding artifacts")
+    parser.add_argument("--embeddings-path", type=str, required=True, help="Embeddings root directory")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL, help="CLIP model whose artifacts to manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="Show versions and which one is live")
+
+    activate = subparsers.add_parser("activate", help="Point CURRENT at an existing version")
+    activate.add_argument("version", type=str)
+
+    prune = subparsers.add_parser("prune", help="Delete old versions")
+    prune.add_argument("--keep", type=int, default=3, help="Newest versions to keep (the live one is always kept)")
+
+    subparsers.add_parser("models", help="Show the models with artifacts")
+
+    return parser.parse_args()
+
+def model_slug(model):
+    """Directory name for a model ("ViT-B/16" -> "ViT-B-16")"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", model).strip("-")
+
+def model_root(root, model=None):
+    """Artifact root of a model: the embeddings root for the default model, models/<slug> under it otherwise"""
+    if not model or model == DEFAULT_MODEL:
+        return root
+    return os.path.join(root, MODELS_DIR, model_slug(model))
+
+def write_model_info(directory, model, dimension, normalized=True, metric="l2"):
+    info = {"model": model, "dimension": int(dimension), "normalized": normalized, "metric": metric}
+    with open(os.path.join(directory, MODEL_INFO), "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+def read_model_info(directory):
+    """What a build's vectors are: model.json, or for builds that predate it the manifest or the default model"""
+    path = os.path.join(directory, MODEL_INFO)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    info = {"model": DEFAULT_MODEL, "dimension": None, "normalized": True, "metric": "l2"}
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        manifest = read_manifest(directory)
+        info.update({key: manifest[key] for key in ("model", "dimension") if manifest.get(key)})
+    return info
+
+def list_models(root):
+    """Models with artifacts under the embeddings root, as {model: artifact root}"""
+    models = {}
+    if os.path.exists(os.path.join(root, CURRENT_POINTER)) or os.path.exists(os.path.join(root, "fashion_faiss.index")):
+        models[read_model_info(resolve_artifact_dir(root))["model"]] = root
+    models_path = os.path.join(root, MODELS_DIR)
+    if os.path.isdir(models_path):
+        for name in sorted(os.listdir(models_path)):
+            directory = resolve_artifact_dir(os.path.join(models_path, name))
+            if os.path.exists(os.path.join(directory, MODEL_INFO)):
+                models[read_model_info(directory)["model"]] = os.path.join(models_path, name)
+    return models
+
+def current_version(root):
+    """Name of the live version, or None for the flat (unversioned) layout"""
+    try:
+        with open(os.path.join(root, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_dir(root, version):
+    return os.path.join(root, VERSIONS_DIR, version)
+
+def resolve_artifact_dir(root):
+    """The directory search artifacts are read from: the live version, or root itself"""
+    version = current_version(root)
+    return version_dir(root, version) if version else root
+
+def list_versions(root):
+    """Published versions, oldest first (names sort by build time)"""
+    versions_path = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_path):
+        return []
+    return sorted(name for name in os.listdir(versions_path)
+                  if not name.endswith(".partial") and os.path.exists(os.path.join(versions_path, name, MANIFEST)))
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+def verify_version(directory):
+    """Raise ValueError unless every file the manifest lists is present with the recorded size"""
+    manifest = read_manifest(directory)
+    for name, size in manifest["files"].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise ValueError(f"{manifest['version']}: missing {name}")
+        if os.path.getsize(path) != size:
+            raise ValueError(f"{manifest['version']}: {name} is {os.path.getsize(path)} bytes, expected {size}")
+    return manifest
+
+def start_version(root, version=None):
+    """Create the staging directory for a new build and return (version, path)"""
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    if os.path.exists(version_dir(root, version)):
+        raise ValueError(f"Version {version} already exists")
+    staging = version_dir(root, version) + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    return version, staging
+
+def set_current(root, version):
+    """Atomically repoint CURRENT; readers see either the old version or the new one"""
+    if not os.path.exists(os.path.join(version_dir(root, version), MANIFEST)):
+        raise ValueError(f"No published version {version}")
+    pointer = os.path.join(root, CURRENT_POINTER)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+
+def save_array(path, array):
+    """Write an .npy file atomically so running searches never load a partial one"""
+    import numpy as np
+
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+def publish_version(root, version, staging, metadata=None):
+    """Write the manifest, move the staged build into place and make it the live version"""
+    files = {}
+    for directory, _, names in os.walk(staging):
+        for name in names:
+            path = os.path.join(directory, name)
+            files[os.path.relpath(path, staging).replace(os.sep, "/")] = os.path.getsize(path)
+
+    manifest = dict(metadata or {}, version=version, created=time.strftime("%Y-%m-%dT%H:%M:%S"), files=files)
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(staging, version_dir(root, version))
+    set_current(root, version)
+    return manifest
+
+def prune_versions(root, keep=3):
+    """Delete all but the newest `keep` versions, never the live one; return the deleted names"""
+    live = current_version(root)
+    versions = list_versions(root)
+    doomed = [version for version in versions[:max(0, len(versions) - keep)] if version != live]
+    for version in doomed:
+        shutil.rmtree(version_dir(root, version))
+    return doomed
+
+def main():
+    args = parse_args()
+    root = model_root(args.embeddings_path, args.model)
+    try:
+        if args.command == "list":
+            live = current_version(root)
+            versions = []
+            for version in list_versions(root):
+                manifest = read_manifest(version_dir(root, version))
+                versions.append({"version": version, "live": version == live, "created": manifest.get("created"),
+                                 "count": manifest.get("count"), "model": manifest.get("model"),
+                                 "bytes": sum(manifest["files"].values())})
+            print(json.dumps({"current": live, "versions": versions}, indent=2))
+        elif args.command == "activate":
+            verify_version(version_dir(root, args.version))
+            set_current(root, args.version)
+            print(json.dumps({"current": args.version}))
+        elif args.command == "prune":
+            print(json.dumps({"deleted": prune_versions(root, args.keep)}))
+        elif args.command == "models":
+            models = []
+            for model, model_path in list_models(args.embeddings_path).items():
+                info = read_model_info(resolve_artifact_dir(model_path))
+                models.append(dict(info, path=model_path, current=current_version(model_path)))
+            print(json.dumps({"models": models}, indent=2))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
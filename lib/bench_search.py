@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+Search Benchmarks
+
+Measures clip_search latency and throughput under load and prints the results
+as JSON so runs can be compared across machines and settings.
+
+  workers   p50/p99 under concurrent load for different core splits, e.g. 1x8 vs 4x2
+  batching  throughput/latency of the micro-batching scheduler per batch size and wait
+  pipeline  end-to-end run on a synthetic catalogue (10k/100k/1M): build time, startup,
+            throughput, p50/p95/p99 per search type and peak RSS; --encoder stub runs
+            offline in minutes
+  compression  index memory, latency and recall@k of compressed first stages (fp16, sq8,
+            PQ) with exact re-ranking, against the float32 flat index
+  validation  tiered image validation (cheap pre-screen first) vs always running full
+            validation and the rotation sweep: tier mix, agreement and time saved
+  multimodal  cost of each multimodal fusion strategy and over-fetch: latency, per-stage
+            time, index rows searched and overlap with plain early fusion
+  models    the same requests through several CLIP models loaded side by side (request
+            "model" routing): latency per model and search type, and top-k overlap with
+            the primary model
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from search_workers import SearchWorkerPool, available_cpus
+
+LIB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Representative text queries used when no query file is given
+DEFAULT_QUERIES = [
+    "red summer dress", "black leather jacket", "white sneakers", "blue denim jeans",
+    "men's formal shirt", "floral skirt", "brown leather handbag", "sports shoes",
+    "navy blue polo t-shirt", "women's ethnic kurta", "silver analog watch", "grey hoodie",
+    "casual shorts", "pink top", "black heels", "green cotton trousers",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark fashion search")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    workers = subparsers.add_parser("workers", help="Latency under concurrent load for different core splits")
+    workers.add_argument("--splits", type=str, default="1x4,2x2,4x1",
+                         help="Comma-separated WORKERSxTHREADS splits to compare")
+    workers.add_argument("--requests", type=int, default=200, help="Requests to send per split")
+    workers.add_argument("--concurrency", type=int, default=8, help="Concurrent in-flight requests")
+    workers.add_argument("--warmup", type=int, default=10, help="Warmup requests per split (not measured)")
+    workers.add_argument("--top-k", type=int, default=10, help="Number of results per request")
+    workers.add_argument("--query-file", type=str, help="File with one text query per line")
+    workers.add_argument("--image-dir", type=str, help="Directory of query images to mix in as image searches")
+    workers.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    batching = subparsers.add_parser("batching", help="Throughput/latency per micro-batching setting")
+    batching.add_argument("--settings", type=str, default="1:0,4:2,8:5,16:5,32:10",
+                          help="Comma-separated MAX_BATCH:MAX_WAIT_MS settings to compare")
+    batching.add_argument("--requests", type=int, default=200, help="Requests to send per setting")
+    batching.add_argument("--concurrency", type=int, default=16, help="Concurrent in-flight requests")
+    batching.add_argument("--warmup", type=int, default=10, help="Warmup requests per setting (not measured)")
+    batching.add_argument("--top-k", type=int, default=10, help="Number of results per request")
+    batching.add_argument("--query-file", type=str, help="File with one text query per line")
+    batching.add_argument("--image-dir", type=str, help="Directory of query images to mix in as image searches")
+    batching.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    pipeline = subparsers.add_parser("pipeline", help="End-to-end benchmark on a synthetic catalogue")
+    pipeline.add_argument("--scales", type=str, default="10000",
+                          help="Comma-separated catalogue sizes, e.g. 10000,100000,1000000")
+    pipeline.add_argument("--work-dir", type=str, default="bench-data",
+                          help="Where catalogues and indexes are written (reused across runs)")
+    pipeline.add_argument("--encoder", type=str, default="clip", choices=["clip", "stub"],
+                          help="Real CLIP ViT-B/32, or the offline stub encoder (stub_clip.py)")
+    pipeline.add_argument("--seed", type=int, default=0, help="Catalogue random seed")
+    pipeline.add_argument("--requests", type=int, default=200, help="Requests to send per search type")
+    pipeline.add_argument("--concurrency", type=int, default=4, help="Concurrent in-flight requests")
+    pipeline.add_argument("--warmup", type=int, default=10, help="Warmup requests per search type (not measured)")
+    pipeline.add_argument("--top-k", type=int, default=10, help="Number of results per request")
+    pipeline.add_argument("--batch-size", type=int, default=64, help="Embedding batch size for the build")
+    pipeline.add_argument("--reuse-index", action="store_true",
+                          help="Skip the embedding/index build when one already exists for a catalogue")
+    pipeline.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    compression = subparsers.add_parser("compression", help="Compressed first-stage indexes vs the flat index")
+    compression.add_argument("--modes", type=str, default="fp16,sq8,pq", help="Compressed modes to compare")
+    compression.add_argument("--rerank-factors", type=str, default="1,4,10",
+                             help="Candidates re-ranked, as multiples of top-k (0 = no re-ranking)")
+    compression.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers when the index is built here")
+    compression.add_argument("--queries", type=int, default=200, help="Query vectors to time")
+    compression.add_argument("--noise", type=float, default=0.05,
+                             help="Gaussian noise added to sampled catalogue vectors to form queries")
+    compression.add_argument("--top-k", type=int, default=10, help="Number of results per query")
+    compression.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    validation = subparsers.add_parser("validation", help="Tiered image validation vs full validation")
+    validation.add_argument("--image-dir", type=str, required=True, help="Directory of fashion upload images")
+    validation.add_argument("--negative-dir", type=str, help="Directory of non-fashion images to mix in")
+    validation.add_argument("--max-images", type=int, default=100, help="Images taken from each directory")
+    validation.add_argument("--no-rotation-check", action="store_true",
+                            help="Leave the rotation sweep out of both paths")
+    validation.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    multimodal = subparsers.add_parser("multimodal", help="Cost of each multimodal fusion strategy")
+    multimodal.add_argument("--image-dir", type=str, required=True, help="Directory of query images")
+    multimodal.add_argument("--query-file", type=str, help="File with one text query per line, paired with the images")
+    multimodal.add_argument("--strategies", type=str, default="early,adaptive,late", help="Fusion strategies to compare")
+    multimodal.add_argument("--overfetch", type=str, default="1,3,10",
+                            help="Comma-separated over-fetch multiples of top-k to compare")
+    multimodal.add_argument("--text-weight", type=float, default=None, help="Text weight (default: CLIP_MULTIMODAL_TEXT_WEIGHT)")
+    multimodal.add_argument("--max-images", type=int, default=50, help="Query images used")
+    multimodal.add_argument("--top-k", type=int, default=10, help="Number of results per query")
+    multimodal.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    models = subparsers.add_parser("models", help="Latency and result overlap across CLIP models")
+    models.add_argument("--models", type=str, required=True,
+                        help="Comma-separated models to compare with the primary one (CLIP_MODEL)")
+    models.add_argument("--query-file", type=str, help="File with one text query per line")
+    models.add_argument("--image-dir", type=str, help="Directory of query images to include")
+    models.add_argument("--max-images", type=int, default=50, help="Query images used")
+    models.add_argument("--top-k", type=int, default=10, help="Number of results per query")
+    models.add_argument("--output", type=str, help="Write the JSON report here as well as stdout")
+
+    return parser.parse_args()
+
+def percentile_summary(latencies):
+    """Summarize a list of latencies in seconds as milliseconds"""
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+def load_requests(query_file=None, image_dir=None, top_k=10, max_images=None):
+    """Build the request mix used by the load benchmarks (and the search_baseline.py golden sets)"""
+    queries = DEFAULT_QUERIES
+    if query_file:
+        with open(query_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    requests = [{"search_type": "text", "query": q, "top_k": top_k} for q in queries]
+    if image_dir:
+        names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+        # Absolute paths, so recorded requests can be replayed from another directory
+        for name in names[:max_images]:
+            requests.append({"search_type": "image", "image_path": os.path.abspath(os.path.join(image_dir, name)),
+                             "top_k": top_k})
+    return requests
+
+def result_ids(output):
+    """The ranked result ids of a dispatch_request output (none for an error)"""
+    return [result["id"] for result in output.get("results", [])]
+
+def run_load(submit, requests, total, concurrency):
+    """Send `total` requests through `submit` with bounded concurrency and time each one"""
+    def timed(request):
+        start = time.perf_counter()
+        response = submit(request)
+        return time.perf_counter() - start, "error" not in response
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, (requests[i % len(requests)] for i in range(total))))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        "requests": total,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "wall_s": elapsed,
+        "throughput_qps": total / elapsed if elapsed > 0 else None,
+        "latency_ms": percentile_summary(latencies),
+    }
+
+def parse_split(spec):
+    """Parse a WORKERSxTHREADS split such as '2x4'"""
+    workers, threads = spec.lower().split("x")
+    return int(workers), int(threads)
+
+def bench_workers(args):
+    cpus = available_cpus()
+    requests = load_requests(args.query_file, args.image_dir, args.top_k)
+    results = []
+
+    for spec in args.splits.split(","):
+        num_workers, threads = parse_split(spec)
+        needed = num_workers * threads
+        if needed > len(cpus):
+            print(f"Skipping split {spec}: needs {needed} cores, only {len(cpus)} available", file=sys.stderr)
+            continue
+
+        print(f"Benchmarking split {spec}...", file=sys.stderr)
+        started = time.perf_counter()
+        with SearchWorkerPool(num_workers, cpus[:needed]) as pool:
+            startup = time.perf_counter() - started
+            run_load(pool.search, requests, args.warmup, args.concurrency)
+            result = run_load(pool.search, requests, args.requests, args.concurrency)
+
+        result.update({"split": spec, "workers": num_workers, "threads_per_worker": threads, "startup_s": startup})
+        results.append(result)
+
+    return {"benchmark": "workers", "concurrency": args.concurrency, "cpus": len(cpus), "results": results}
+
+def bench_batching(args):
+    import clip_search
+
+    requests = load_requests(args.query_file, args.image_dir, args.top_k)
+    model, preprocess, index, df, image_embeddings, device = clip_search.load_model_and_data(quiet=True)
+    results = []
+
+    for spec in args.settings.split(","):
+        max_batch, max_wait = spec.split(":")
+        print(f"Benchmarking batch setting {spec}...", file=sys.stderr)
+        batcher = clip_search.MicroBatcher(model, preprocess, index, df, image_embeddings, device,
+                                           int(max_batch), float(max_wait), quiet=True)
+        submit = lambda request: batcher.submit(request).result()
+        run_load(submit, requests, args.warmup, args.concurrency)
+        batcher.batches = batcher.batched_requests = 0
+
+        result = run_load(submit, requests, args.requests, args.concurrency)
+        result.update({
+            "setting": spec,
+            "max_batch_size": int(max_batch),
+            "max_wait_ms": float(max_wait),
+            "mean_batch_size": batcher.mean_batch_size,
+        })
+        batcher.close()
+        results.append(result)
+
+    return {"benchmark": "batching", "concurrency": args.concurrency, "results": results}
+
+def peak_rss_mb(pid):
+    """High-water resident set size of a running process, from /proc (None elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def measured_run(command, env=None):
+    """Run a command to completion and return (exit code, wall seconds, peak RSS MB)"""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    if not hasattr(os, "wait4"):
+        return process.wait(), time.perf_counter() - started, None
+
+    # wait4 reports the child's own peak RSS, unlike getrusage(RUSAGE_CHILDREN)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - started
+    scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+    return process.returncode, elapsed, usage.ru_maxrss / scale
+
+def pipeline_env(dataset_path, encoder, work_dir):
+    """Environment for the processes under test, with the stub shadowing `clip` if asked"""
+    env = dict(os.environ, DATASET_PATH=dataset_path)
+    paths = [LIB_DIR]
+    if encoder == "stub":
+        shim_dir = os.path.join(work_dir, "stub_encoder")
+        os.makedirs(shim_dir, exist_ok=True)
+        with open(os.path.join(shim_dir, "clip.py"), "w") as f:
+            f.write("from stub_clip import available_models, load, tokenize\n")
+        paths.insert(0, shim_dir)
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
+
+def pipeline_requests(dataset_path, top_k, limit=64):
+    """Request mixes per search type, drawn from the catalogue's own images"""
+    image_folder = os.path.join(dataset_path, "images")
+    images = [os.path.join(image_folder, name) for name in sorted(os.listdir(image_folder))[:limit]]
+    queries = DEFAULT_QUERIES
+    return {
+        "text": [{"search_type": "text", "query": q, "top_k": top_k} for q in queries],
+        "image": [{"search_type": "image", "image_path": path, "top_k": top_k} for path in images],
+        "multimodal": [
+            {"search_type": "multimodal", "query": queries[i % len(queries)], "image_path": path, "top_k": top_k}
+            for i, path in enumerate(images)
+        ],
+        "validate": [{"search_type": "validate", "image_path": path} for path in images],
+    }
+
+def bench_pipeline_scale(args, size):
+    from synthetic_catalogue import generate_catalogue
+
+    dataset_path = os.path.abspath(os.path.join(args.work_dir, f"catalogue_{size}"))
+    embeddings_path = os.path.join(dataset_path, "embeddings")
+    result = {"scale": size}
+
+    # Catalogue: generated once per size/seed and reused by later runs
+    summary_path = os.path.join(dataset_path, "catalogue.json")
+    summary = None
+    if os.path.exists(summary_path):
+        with open(summary_path) as f:
+            summary = json.load(f)
+    if not summary or summary.get("size") != size or summary.get("seed") != args.seed:
+        print(f"Generating {size}-item catalogue...", file=sys.stderr)
+        summary = generate_catalogue(dataset_path, size, args.seed, workers=len(available_cpus()), quiet=True)
+        result["catalogue"] = {"generate_s": summary["generate_s"], "reused": False}
+    else:
+        result["catalogue"] = {"generate_s": summary["generate_s"], "reused": True}
+    result["catalogue"]["cardinality"] = summary["cardinality"]
+
+    env = pipeline_env(dataset_path, args.encoder, os.path.abspath(args.work_dir))
+
+    # Build: embeddings, memory-mappable matrix and FAISS index
+    index_path = os.path.join(embeddings_path, "fashion_faiss.index")
+    if args.reuse_index and os.path.exists(index_path):
+        result["build"] = {"reused": True}
+    else:
+        print(f"Building embeddings and index for {size} items...", file=sys.stderr)
+        command = [sys.executable, os.path.join(LIB_DIR, "generate_embeddings.py"),
+                   "--dataset-path", dataset_path, "--embeddings-path", embeddings_path,
+                   "--batch-size", str(args.batch_size)]
+        code, wall, rss = measured_run(command, env)
+        if code != 0:
+            raise RuntimeError(f"generate_embeddings.py failed with exit code {code}")
+        result["build"] = {"reused": False, "wall_s": wall, "items_per_s": size / wall, "peak_rss_mb": rss}
+
+    # Cold start: one CLI text search, model and index load included
+    command = [sys.executable, os.path.join(LIB_DIR, "clip_search.py"), "--search-type", "text",
+               "--query", DEFAULT_QUERIES[0], "--top-k", str(args.top_k), "--quiet"]
+    code, wall, rss = measured_run(command, env)
+    result["cold_query"] = {"exit_code": code, "wall_s": wall, "peak_rss_mb": rss}
+
+    # Warm serving: one long-running worker, every search type under load
+    saved_env = dict(os.environ)
+    os.environ.update(env)
+    try:
+        started = time.perf_counter()
+        with SearchWorkerPool(1) as pool:
+            result["startup_s"] = time.perf_counter() - started
+            result["search"] = {}
+            for search_type, requests in pipeline_requests(dataset_path, args.top_k).items():
+                print(f"  {search_type} searches...", file=sys.stderr)
+                run_load(pool.search, requests, args.warmup, args.concurrency)
+                result["search"][search_type] = run_load(pool.search, requests, args.requests, args.concurrency)
+            result["serve_peak_rss_mb"] = peak_rss_mb(pool.workers[0].process.pid)
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+    return result
+
+def bench_pipeline(args):
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = [bench_pipeline_scale(args, int(size)) for size in args.scales.split(",")]
+    return {
+        "benchmark": "pipeline",
+        "encoder": args.encoder,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": len(available_cpus()),
+        },
+        "results": results,
+    }
+
+def bench_compression(args):
+    import faiss
+    import clip_search
+    from generate_embeddings import build_compressed_index
+
+    matrix = np.load(clip_search.IMAGE_MATRIX_PATH, mmap_mode="r")
+    flat = faiss.read_index(clip_search.FAISS_INDEX_PATH)
+    k = args.top_k
+
+    # Queries near catalogue items, like image searches for products we carry
+    rng = np.random.default_rng(0)
+    queries = np.asarray(matrix[rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False)])
+    queries = queries + rng.normal(0.0, args.noise, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    def timed_search(index):
+        latencies, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, indices = index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - started)
+            found.append(indices[0])
+        return percentile_summary(latencies), np.array(found)
+
+    flat_bytes = faiss.serialize_index(flat).nbytes
+    flat_latency, truth = timed_search(flat)
+    results = [{"mode": "flat", "rerank_factor": None, "index_bytes": int(flat_bytes),
+                "bytes_per_vector": flat_bytes / flat.ntotal, "compression": 1.0,
+                "latency_ms": flat_latency, "recall_at_k": 1.0}]
+
+    for mode in args.modes.split(","):
+        path = clip_search.compressed_index_path(mode)
+        if os.path.exists(path):
+            first_stage = faiss.read_index(path)
+        else:
+            print(f"Building {mode} index (not found at {path})...", file=sys.stderr)
+            first_stage = build_compressed_index(np.ascontiguousarray(matrix, dtype=np.float32), mode, args.pq_m)
+        index_bytes = faiss.serialize_index(first_stage).nbytes
+
+        for factor in (int(f) for f in args.rerank_factors.split(",")):
+            print(f"Benchmarking {mode} with rerank factor {factor}...", file=sys.stderr)
+            index = first_stage if factor == 0 else clip_search.RerankedIndex(first_stage, matrix, factor)
+            latency, found = timed_search(index)
+            recall = np.mean([len(set(t) & set(f)) / len(t) for t, f in zip(truth, found)])
+            results.append({
+                "mode": mode,
+                "rerank_factor": factor,
+                "index_bytes": int(index_bytes),
+                "bytes_per_vector": index_bytes / first_stage.ntotal,
+                "compression": flat_bytes / index_bytes,
+                "latency_ms": latency,
+                "recall_at_k": float(recall),
+            })
+
+    return {"benchmark": "compression", "vectors": int(flat.ntotal), "dimension": int(flat.d), "top_k": k,
+            "queries": len(queries), "rerank_matrix_bytes": int(matrix.nbytes), "results": results}
+
+def bench_validation(args):
+    import clip
+    import torch
+    import clip_search
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, preprocess = clip.load(clip_search.CLIP_MODEL, device=device)
+    model.eval()
+
+    images = []
+    for directory, expected in ((args.image_dir, True), (args.negative_dir, False)):
+        if not directory:
+            continue
+        names = sorted(name for name in os.listdir(directory) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+        images.extend((os.path.join(directory, name), expected) for name in names[:args.max_images])
+
+    rotation_check = not args.no_rotation_check
+    # Warm up (prompt features, allocator) outside the timed runs
+    clip_search.validate_image_tiered(images[0][0], model, preprocess, device, rotation_check, True, quiet=True)
+
+    runs = {"full": [], "tiered": []}
+    tiers, agree, correct = {}, 0, {"full": 0, "tiered": 0}
+    thresholds = None
+    for path, expected in images:
+        verdicts = {}
+        for name, prescreen in (("full", False), ("tiered", True)):
+            started = time.perf_counter()
+            result = clip_search.validate_image_tiered(path, model, preprocess, device, rotation_check,
+                                                       prescreen, quiet=True)
+            runs[name].append(time.perf_counter() - started)
+            # A rescued rotation counts as fashion, as the web app treats it
+            verdicts[name] = bool(result.get("is_fashion_related") or result.get("rotatedValidation"))
+            correct[name] += verdicts[name] == expected
+            if prescreen:
+                tiers[result["tier"]] = tiers.get(result["tier"], 0) + 1
+                if "prescreen" in result:
+                    screened = result["prescreen"]
+                    thresholds = {key: screened[key] for key in ("source", "accept", "reject")}
+        agree += verdicts["full"] == verdicts["tiered"]
+
+    full_total, tiered_total = sum(runs["full"]), sum(runs["tiered"])
+    return {
+        "benchmark": "validation",
+        "images": len(images),
+        "rotation_check": rotation_check,
+        "thresholds": thresholds,
+        "tiers": tiers,
+        "agreement": agree / len(images),
+        "accuracy": {name: count / len(images) for name, count in correct.items()},
+        "latency_ms": {name: percentile_summary(latencies) for name, latencies in runs.items()},
+        "time_saved_s": full_total - tiered_total,
+        "time_saved_fraction": (full_total - tiered_total) / full_total if full_total else None,
+    }
+
+def bench_multimodal(args):
+    import clip_search
+
+    model, preprocess, index, df, image_embeddings, device = clip_search.load_model_and_data(quiet=True)
+    queries = [request["query"] for request in load_requests(args.query_file, top_k=args.top_k)]
+    names = sorted(name for name in os.listdir(args.image_dir) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    pairs = [(queries[i % len(queries)], os.path.join(args.image_dir, name))
+             for i, name in enumerate(names[:args.max_images])]
+
+    def run(strategy, overfetch):
+        latencies, stages, found = [], {}, []
+        for query, path in pairs:
+            request = {"search_type": "multimodal", "query": query, "image_path": path, "top_k": args.top_k,
+                       "fusion": strategy, "overfetch": overfetch, "text_weight": args.text_weight}
+            with clip_search.tracing() as trace:
+                output = clip_search.dispatch_request(request, model, preprocess, index, df, image_embeddings,
+                                                      device, quiet=True)
+            assert trace is not None
+            timings = trace.timings_ms()
+            latencies.append(timings.pop("total") / 1000.0)
+            for stage, ms in timings.items():
+                stages[stage] = stages.get(stage, 0.0) + ms
+            found.append(result_ids(output))
+        return latencies, {stage: ms / len(pairs) for stage, ms in stages.items()}, found
+
+    # Warm up (allocator, caches) outside the timed runs
+    run("early", 1)
+    baseline = run("early", clip_search.MULTIMODAL_OVERFETCH)[2]
+
+    results = []
+    for strategy in args.strategies.split(","):
+        for overfetch in (int(value) for value in args.overfetch.split(",")):
+            print(f"Benchmarking {strategy} fusion with over-fetch {overfetch}...", file=sys.stderr)
+            latencies, stages, found = run(strategy, overfetch)
+            overlap = [len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(found, baseline)]
+            rows = 2 if strategy == "late" else 1
+            results.append({
+                "strategy": strategy,
+                "overfetch": overfetch,
+                "index_rows_per_query": rows,
+                "candidates_per_query": rows * overfetch * args.top_k,
+                "latency_ms": percentile_summary(latencies),
+                "stage_mean_ms": stages,
+                "overlap_with_early": float(np.mean(overlap)),
+            })
+
+    return {"benchmark": "multimodal", "queries": len(pairs), "top_k": args.top_k,
+            "baseline": {"strategy": "early", "overfetch": clip_search.MULTIMODAL_OVERFETCH}, "results": results}
+
+def bench_models(args):
+    import clip_search
+
+    search_args = clip_search.load_model_and_data(quiet=True)
+    models = clip_search.load_extra_models(clip_search.parse_list(args.models), quiet=True)
+    requests = load_requests(args.query_file, top_k=args.top_k)
+    if args.image_dir:
+        images = [request for request in load_requests(image_dir=args.image_dir, top_k=args.top_k)
+                  if request["search_type"] == "image"]
+        requests.extend(images[:args.max_images])
+
+    def run(name):
+        latencies, found = {}, []
+        for request in requests:
+            routed, routed_args = clip_search.route_request(dict(request, model=name), search_args, models)
+            start = time.perf_counter()
+            output = clip_search.dispatch_request(routed, *routed_args, quiet=True)
+            latencies.setdefault(request["search_type"], []).append(time.perf_counter() - start)
+            found.append(result_ids(output))
+        return latencies, found
+
+    names = [clip_search.CLIP_MODEL] + list(models)
+    # Warm up (allocators, prompt features) outside the timed runs
+    for name in names:
+        run(name)
+
+    results, baseline = [], None
+    for name in names:
+        print(f"Benchmarking {name}...", file=sys.stderr)
+        latencies, found = run(name)
+        baseline = baseline or found
+        overlap = [len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(found, baseline)]
+        model_search_args = models.get(name, search_args)
+        results.append({
+            "model": name,
+            "dimension": int(model_search_args[2].d),
+            "latency_ms": percentile_summary([value for values in latencies.values() for value in values]),
+            "latency_ms_by_type": {search_type: percentile_summary(values) for search_type, values in latencies.items()},
+            "overlap_with_primary": float(np.mean(overlap)),
+        })
+
+    return {"benchmark": "models", "primary": clip_search.CLIP_MODEL, "requests": len(requests),
+            "top_k": args.top_k, "results": results}
+
+def main():
+    args = parse_args()
+
+    if args.benchmark == "workers":
+        report = bench_workers(args)
+    elif args.benchmark == "batching":
+        report = bench_batching(args)
+    elif args.benchmark == "pipeline":
+        report = bench_pipeline(args)
+    elif args.benchmark == "compression":
+        report = bench_compression(args)
+    elif args.benchmark == "validation":
+        report = bench_validation(args)
+    elif args.benchmark == "multimodal":
+        report = bench_multimodal(args)
+    elif args.benchmark == "models":
+        report = bench_models(args)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ It can be called from the Next.js application to perform text, image, or multimo
 """
 
 import argparse
+import base64
+import io
 import json
 import sys
 import os
@@ -17,14 +19,66 @@ import clip
 import faiss
 import pandas as pd
 import colorsys
-from collections import Counter
+import contextvars
+import functools
+import queue
+import secrets
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from artifact_versions import (DEFAULT_MODEL, current_version, model_root, read_model_info, resolve_artifact_dir,
+                               verify_version, version_dir)
 
 # Define paths - using the actual dataset location
 DATASET_PATH = os.environ.get('DATASET_PATH', 'D:/project/kaatchi-fashion-vlm/data/fashion-dataset')
 IMAGE_FOLDER = os.path.join(DATASET_PATH, 'images')
 METADATA_FILE = os.path.join(DATASET_PATH, 'styles.csv')
-EMBEDDINGS_PATH = os.path.join(DATASET_PATH, 'embeddings')
+# CLIP model this process searches with; each model has its own artifacts (embeddings/ for
+# ViT-B/32, embeddings/models/<model> for others, see artifact_versions.py)
+EMBEDDINGS_ROOT = os.path.join(DATASET_PATH, 'embeddings')
+CLIP_MODEL = os.environ.get('CLIP_MODEL', DEFAULT_MODEL)
+# More models loaded side by side in long-running processes, chosen by a request's "model"
+EXTRA_MODELS = os.environ.get('CLIP_EXTRA_MODELS', '')
+# Search artifacts: the model's live published version (<root>/versions/<CURRENT>), or the
+# model's root itself for unversioned builds
+ARTIFACTS_ROOT = model_root(EMBEDDINGS_ROOT, CLIP_MODEL)
+EMBEDDINGS_PATH = resolve_artifact_dir(ARTIFACTS_ROOT)
 FAISS_INDEX_PATH = os.path.join(EMBEDDINGS_PATH, 'fashion_faiss.index')
+IMAGE_MATRIX_PATH = os.path.join(EMBEDDINGS_PATH, 'image_matrix.npy')
+IMAGE_IDS_PATH = os.path.join(EMBEDDINGS_PATH, 'image_ids.npy')
+
+# Long-running processes poll the CURRENT pointer this often and hot-swap new versions (0 disables)
+RELOAD_INTERVAL = float(os.environ.get('CLIP_RELOAD_INTERVAL', '5'))
+
+# Optional sharded index (see generate_embeddings.py --num-shards and shard_server.py)
+SHARD_MANIFEST_PATH = os.environ.get('CLIP_SHARD_MANIFEST')
+SHARD_ADDRESSES = os.environ.get('CLIP_SHARD_ADDRESSES')
+SHARD_TIMEOUT_MS = float(os.environ.get('CLIP_SHARD_TIMEOUT_MS', '500'))
+
+# Optional compressed first-stage index, re-ranked exactly against image_matrix.npy
+# (see generate_embeddings.py --compressed); "flat" is the exact float32 index
+INDEX_MODES = ["flat", "fp16", "sq8", "pq"]
+INDEX_MODE = os.environ.get('CLIP_INDEX_MODE', 'flat')
+RERANK_FACTOR = int(os.environ.get('CLIP_RERANK_FACTOR', '4'))
+
+# Near-duplicate cluster id per image_ids.npy row (see near_duplicates.py); results keep one per cluster
+DUPLICATE_CLUSTERS_PATH = os.path.join(EMBEDDINGS_PATH, 'duplicate_clusters.npy')
+DIVERSIFY = os.environ.get('CLIP_DIVERSIFY', '1') != '0'
+
+# Precomputed "more like this" neighbours per image_ids.npy row (see similar_items.py)
+SIMILAR_NEIGHBORS_PATH = os.path.join(EMBEDDINGS_PATH, 'similar_neighbors.npy')
+SIMILAR_SCORES_PATH = os.path.join(EMBEDDINGS_PATH, 'similar_scores.npy')
+
+# Per-user preference vectors (see user_profiles.py), used for requests with a "user_id";
+# they outlive catalogue rebuilds, so they sit beside the versions rather than in one, and
+# are in the model's embedding space, so each model root has its own
+USER_PROFILES_PATH = os.environ.get('CLIP_USER_PROFILES', os.path.join(ARTIFACTS_ROOT, 'user_profiles.sqlite'))
+
+PERSONALIZATION_WEIGHT = float(os.environ.get('CLIP_PERSONALIZATION_WEIGHT', '0.2'))
+PERSONALIZATION_MODES = ["rerank", "blend", "off"]
 
 # Define color ranges for better matching
 COLOR_RANGES = {
@@ -116,25 +170,342 @@ NON_FASHION_KEYWORDS = set([
     "basketball", "tennis", "rugby", "volleyball", "badminton", "hockey", "cricket", "wrestling"
 ])
 
+# Fashion-related categories used to validate uploaded images (focused list)
+FASHION_CATEGORIES = [
+    "clothing", "fashion", "apparel", "wear", "dress", "shirt", "pants", 
+    "jeans", "t-shirt", "jacket", "coat", "sweater", "skirt", "blouse", 
+    "suit", "tie", "scarf", "hat", "cap", "shoes", "boots", "sneakers", 
+    "heels", "sandals", "accessories", "jewelry", "watch", "bag", "purse", 
+    "handbag", "backpack", "sunglasses", "glasses", "belt", "wallet"
+]
+
+# Accessory-specific categories accepted with a lower threshold
+ACCESSORY_CATEGORIES = [
+    "bag", "purse", "handbag", "backpack", "wallet", "accessories", 
+    "watch", "jewelry", "belt", "sunglasses", "glasses"
+]
+
+# Non-fashion categories
+NON_FASHION_CATEGORIES = [
+    "car", "vehicle", "landscape", "building", "food", "animal", "pet", 
+    "plant", "tree", "flower", "technology", "device", "furniture", 
+    "scenery", "nature", "mountain", "beach", "ocean", "river", "lake", 
+    "sky", "cloud", "road", "street", "city", "house", "apartment", 
+    "office", "restaurant", "cafe", "park", "garden", "forest", "desert",
+    "logo", "symbol", "icon", "sign", "text", "diagram", "chart", "graph",
+    "abstract", "pattern", "texture", "background", "wallpaper"
+]
+
+# All categories scored during image validation
+VALIDATION_CATEGORIES = FASHION_CATEGORIES + NON_FASHION_CATEGORIES
+
+# Tiered image validation: a cheap pass accepts or rejects clear-cut uploads, and only ambiguous
+# ones get full validation and the rotation sweep. Image files (bench_search.py) are
+# screened from a draft (downscaled) decode; requests screen their in-memory decode.
+# Scores are the fashion share of the prompt softmax, or the linear probe's probability
+# when validation_probe.py has trained one (the probe carries its own thresholds).
+# The probe lives at the model's artifact root, not in a version: rebuilds keep the embedding space
+VALIDATION_PROBE_PATH = os.path.join(ARTIFACTS_ROOT, 'validation_probe.npz')
+PRESCREEN = os.environ.get('CLIP_PRESCREEN', '1') != '0'
+PRESCREEN_ACCEPT = float(os.environ.get('CLIP_PRESCREEN_ACCEPT', '0.85'))
+PRESCREEN_REJECT = float(os.environ.get('CLIP_PRESCREEN_REJECT', '0.05'))
+PRESCREEN_SIZE = 224
+
+# Query images can come from a path, raw bytes, base64 in JSON or a shared-memory segment;
+# each is decoded once, in memory, after checking these limits
+IMAGE_SOURCE_FIELDS = ["image_path", "image_bytes", "image_base64", "image_shm"]
+MAX_IMAGE_BYTES = int(os.environ.get('CLIP_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get('CLIP_MAX_IMAGE_PIXELS', str(40 * 1000 * 1000)))
+
+# Minimum text-image similarity for a multimodal query to count as coherent (adjust based on testing)
+COHERENCE_THRESHOLD = 0.2
+
+# How multimodal queries combine their text and image features:
+#   early     one search for the weighted mean of the two features
+#   adaptive  early, with the text weight scaled down as text-image coherence drops
+#   late      both features in one batched search, ranked lists merged on weighted distance
+FUSION_STRATEGIES = ["early", "adaptive", "late"]
+FUSION_STRATEGY = os.environ.get('CLIP_FUSION', 'early')
+MULTIMODAL_TEXT_WEIGHT = float(os.environ.get('CLIP_MULTIMODAL_TEXT_WEIGHT', '0.5'))
+# Candidates fetched per query (and per modality for late fusion), as multiples of top_k;
+# more recall for colour re-ranking and merging, at the cost of search and hydrate time
+MULTIMODAL_OVERFETCH = int(os.environ.get('CLIP_MULTIMODAL_OVERFETCH', '3'))
+
+# Facet counts for the UI's filters, over the top FACET_K candidates of a search
+FACET_COLUMNS = ["gender", "articleType", "baseColour", "usage"]
+FACET_K = int(os.environ.get('CLIP_FACET_K', '1000'))
+FACETED_SEARCH_TYPES = ["text", "image", "multimodal", "product"]
+
+# Cursor pagination in long-running processes: a "paginate" request keeps its query vectors and
+# candidate buffer under a token for CURSOR_TTL seconds after its last page
+CURSOR_TTL = float(os.environ.get('CLIP_CURSOR_TTL', '300'))
+CURSOR_CAPACITY = int(os.environ.get('CLIP_CURSOR_CAPACITY', '10000'))
+PAGINATED_SEARCH_TYPES = ["text", "image", "multimodal", "product"]
+
+# Search types understood by the CLI and by --serve requests
+SEARCH_TYPES = ["text", "image", "multimodal", "validate", "coherence", "similar", "product"]
+
+# Search types that start from stored catalogue embeddings, so never need the CLIP model;
+# "similar" is a table lookup that doesn't need the FAISS index either
+MODEL_FREE_SEARCH_TYPES = ["similar", "product"]
+INDEX_FREE_SEARCH_TYPES = ["similar"]
+
+def env_int(name):
+    """Read an optional integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Fashion Search using CLIP")
-    parser.add_argument("--search-type", type=str, required=True, 
-                        choices=["text", "image", "multimodal", "validate", "coherence"],
+    parser.add_argument("--search-type", type=str,
+                        choices=SEARCH_TYPES,
                         help="Type of search to perform")
     parser.add_argument("--query", type=str, help="Text query for search")
-    parser.add_argument("--image-path", type=str, help="Path to image for search")
+    parser.add_argument("--image-path", type=str, help="Path to image for search ('-' reads the image bytes from stdin)")
+    parser.add_argument("--product-id", type=str,
+                        help="Catalogue product id for similar search, or comma-separated ids for product search")
+    parser.add_argument("--weights", type=str, help="Comma-separated weight per --product-id for product search")
+    parser.add_argument("--user-id", type=str, help="Personalize results with this user's preference profile")
+    parser.add_argument("--personalization", type=str, default="rerank", choices=PERSONALIZATION_MODES,
+                        help="Re-rank candidates by user preference, or blend it into the query vector")
+    parser.add_argument("--personalization-weight", type=float, default=PERSONALIZATION_WEIGHT,
+                        help="Strength of the user preference (env: CLIP_PERSONALIZATION_WEIGHT)")
+    parser.add_argument("--fusion", type=str, default=FUSION_STRATEGY, choices=FUSION_STRATEGIES,
+                        help="How multimodal search combines text and image (env: CLIP_FUSION)")
+    parser.add_argument("--text-weight", type=float, default=MULTIMODAL_TEXT_WEIGHT,
+                        help="Weight of the text in multimodal search, 0-1 (env: CLIP_MULTIMODAL_TEXT_WEIGHT)")
+    parser.add_argument("--overfetch", type=int, default=MULTIMODAL_OVERFETCH,
+                        help="Multimodal candidates fetched per modality, as multiples of --top-k "
+                             "(env: CLIP_MULTIMODAL_OVERFETCH)")
+    parser.add_argument("--facets", type=str, nargs="?", const=True,
+                        help="Add facet counts over the top --facet-k candidates; optionally only these "
+                             f"comma-separated columns of {','.join(FACET_COLUMNS)}")
+    parser.add_argument("--facet-k", type=int, default=FACET_K,
+                        help="Candidates counted for --facets (env: CLIP_FACET_K)")
     parser.add_argument("--top-k", type=int, default=5, help="Number of results to return")
+    parser.add_argument("--model", type=str, default=CLIP_MODEL,
+                        help="CLIP model to search with, over the artifacts built with it (env: CLIP_MODEL)")
+    parser.add_argument("--extra-models", type=str, default=EXTRA_MODELS,
+                        help="In --serve mode, also load these comma-separated models and their artifacts; requests "
+                             "choose one with \"model\" (env: CLIP_EXTRA_MODELS)")
     parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
     parser.add_argument("--color-detection", action="store_true", help="Enable color detection")
     parser.add_argument("--dominant-colors", type=str, help="Comma-separated list of dominant colors")
     parser.add_argument("--rotation-check", action="store_true", help="Check different rotations of the image")
+    parser.add_argument("--no-prescreen", action="store_true", default=not PRESCREEN,
+                        help="Always run full image validation instead of deciding clear-cut images "
+                             "from a cheap first pass (env: CLIP_PRESCREEN=0)")
+    parser.add_argument("--timings", action="store_true",
+                        help="Add per-stage timings (ms) to the JSON output")
+    parser.add_argument("--serve", action="store_true",
+                        help="Keep the model loaded and answer JSON requests (one per line) from stdin")
+    parser.add_argument("--max-batch-size", type=int, default=env_int("CLIP_MAX_BATCH_SIZE") or 1,
+                        help="In --serve mode, encode up to this many concurrent queries together (1 disables batching)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="In --serve mode, how long to wait for a micro-batch to fill")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="In --serve mode, check for a newly published artifact version this often, "
+                             "in seconds (0 disables; env: CLIP_RELOAD_INTERVAL)")
+    parser.add_argument("--shard-manifest", type=str, default=SHARD_MANIFEST_PATH,
+                        help="Search a sharded index described by this manifest (env: CLIP_SHARD_MANIFEST)")
+    parser.add_argument("--shard-addresses", type=str, default=SHARD_ADDRESSES,
+                        help="Comma-separated host:port per shard, in manifest order (env: CLIP_SHARD_ADDRESSES)")
+    parser.add_argument("--shard-timeout-ms", type=float, default=SHARD_TIMEOUT_MS,
+                        help="Skip shards that don't answer within this time (env: CLIP_SHARD_TIMEOUT_MS)")
+    parser.add_argument("--index-mode", type=str, default=INDEX_MODE, choices=INDEX_MODES,
+                        help="First-stage index: exact float32, or compressed with exact re-ranking (env: CLIP_INDEX_MODE)")
+    parser.add_argument("--rerank-factor", type=int, default=RERANK_FACTOR,
+                        help="Compressed modes re-rank this many times top-k candidates (env: CLIP_RERANK_FACTOR)")
+    parser.add_argument("--no-diversify", action="store_true", default=not DIVERSIFY,
+                        help="Don't collapse near-duplicate results even if duplicate_clusters.npy exists "
+                             "(env: CLIP_DIVERSIFY=0)")
+    parser.add_argument("--torch-threads", type=int, default=env_int("CLIP_TORCH_THREADS"),
+                        help="Intra-op threads for torch (env: CLIP_TORCH_THREADS)")
+    parser.add_argument("--torch-interop-threads", type=int, default=env_int("CLIP_TORCH_INTEROP_THREADS"),
+                        help="Inter-op threads for torch (env: CLIP_TORCH_INTEROP_THREADS)")
+    parser.add_argument("--faiss-threads", type=int, default=env_int("CLIP_FAISS_THREADS"),
+                        help="OpenMP threads for FAISS (env: CLIP_FAISS_THREADS)")
+    parser.add_argument("--cpu-affinity", type=str, default=os.environ.get("CLIP_CPU_AFFINITY"),
+                        help="Pin the process to these cores, e.g. '0-3,8' (env: CLIP_CPU_AFFINITY)")
+
+    args = parser.parse_args()
+    if not args.serve and not args.search_type:
+        parser.error("--search-type is required unless --serve is given")
+    return args
+
+def parse_cpu_list(spec):
+    """Parse a CPU list such as '0-3,8' into a sorted list of core ids"""
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+def configure_threads(torch_threads=None, interop_threads=None, faiss_threads=None, cpu_affinity=None, quiet=False):
+    """Pin the process to a set of cores and size the torch and FAISS thread pools"""
+    cpus = None
+    if cpu_affinity:
+        cpus = parse_cpu_list(cpu_affinity)
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        elif not quiet:
+            print("CPU affinity is not supported on this platform, ignoring it", file=sys.stderr)
+    
+    # Size the pools to the pinned cores by default so parallel workers don't oversubscribe
+    if cpus:
+        torch_threads = torch_threads or len(cpus)
+        faiss_threads = faiss_threads or len(cpus)
+    
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Torch only allows this before any inter-op parallel work has started
+            if not quiet:
+                print(f"Could not set torch inter-op threads: {e}", file=sys.stderr)
+    if faiss_threads:
+        faiss.omp_set_num_threads(faiss_threads)
+    
+    return {
+        "cpus": cpus,
+        "torch_threads": torch.get_num_threads(),
+        "torch_interop_threads": torch.get_num_interop_threads(),
+        "faiss_threads": faiss_threads
+    }
+
+# The trace collecting span timings for the current request (None when tracing is off)
+_active_trace = contextvars.ContextVar('clip_search_trace', default=None)
 
-    return parser.parse_args()
+class Trace:
+    """Per-stage wall time for one request; stages may nest (e.g. validate includes clip_encode_image)"""
+    
+    def __init__(self):
+        self.stages = {}
+    
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+    
+    def merge(self, other):
+        """Add another trace's stages (except its total), e.g. a shared micro-batch's"""
+        for stage, seconds in other.stages.items():
+            if stage != "total":
+                self.add(stage, seconds)
+    
+    def timings_ms(self):
+        return {stage: round(seconds * 1000.0, 3) for stage, seconds in self.stages.items()}
+
+@contextmanager
+def tracing(enabled=True):
+    """Collect span timings for the with-block into a new Trace (yields None when disabled)"""
+    if not enabled:
+        yield None
+        return
+    
+    trace = Trace()
+    token = _active_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.add("total", time.perf_counter() - start)
+        _active_trace.reset(token)
+
+class span:
+    """Time a stage into the active trace; costs one context lookup when tracing is off"""
+    
+    __slots__ = ('stage', 'trace', 'start')
+    
+    def __init__(self, stage):
+        self.stage = stage
+    
+    def __enter__(self):
+        self.trace = _active_trace.get()
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self.trace.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+def traced(stage):
+    """Decorator timing every call of a function as a stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _active_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.add(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class StageHistograms:
+    """Prometheus-style latency histograms per stage, fed from finished traces"""
+    
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, metric="clip_search_stage_seconds", labels=None):
+        self.metric = metric
+        self.labels = "".join(f',{name}="{value}"' for name, value in (labels or {}).items())
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.sums = {}
+        self.counts = {}
+    
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.buckets:
+                self.buckets[stage] = [0] * len(self.BUCKETS)
+                self.sums[stage] = 0.0
+                self.counts[stage] = 0
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self.buckets[stage][i] += 1
+                    break
+            self.sums[stage] += seconds
+            self.counts[stage] += 1
+    
+    def observe_trace(self, trace):
+        for stage, seconds in trace.stages.items():
+            self.observe(stage, seconds)
+    
+    def render(self):
+        """Render in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.metric} Time spent per clip_search stage.",
+            f"# TYPE {self.metric} histogram",
+        ]
+        with self.lock:
+            for stage in sorted(self.buckets):
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS, self.buckets[stage]):
+                    cumulative += count
+                    lines.append(f'{self.metric}_bucket{{stage="{stage}"{self.labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.metric}_bucket{{stage="{stage}"{self.labels},le="+Inf"}} {self.counts[stage]}')
+                lines.append(f'{self.metric}_sum{{stage="{stage}"{self.labels}}} {self.sums[stage]}')
+                lines.append(f'{self.metric}_count{{stage="{stage}"{self.labels}}} {self.counts[stage]}')
+        return "\n".join(lines) + "\n"
 
+@traced("colour_extraction")
 def extract_dominant_colors(image_path, num_colors=3):
     """Extract dominant colors from an image"""
     try:
-        img = Image.open(image_path).convert('RGB')
+        with span("image_decode"):
+            img = open_image(image_path)
         
         # Resize image to speed up processing
         img = img.resize((100, 100))
@@ -172,6 +543,12 @@ def extract_dominant_colors(image_path, num_colors=3):
         print(f"Error extracting colors: {e}", file=sys.stderr)
         return []
 
+def open_image(image):
+    """Return an RGB PIL image for an already-decoded image, a path or a file object"""
+    if isinstance(image, Image.Image):
+        return image if image.mode == "RGB" else image.convert("RGB")
+    return Image.open(image).convert("RGB")
+
 def identify_color(h, s, v):
     """Identify color name from HSV values"""
 
@@ -200,8 +577,392 @@ def identify_color(h, s, v):
 
     return None
 
-def load_model_and_data(quiet=False):
+@traced("embeddings_load")
+def load_image_embeddings(directory=None):
+    """Load image embeddings as an id -> vector dict, memory-mapping the matrix when available"""
+    directory = directory or EMBEDDINGS_PATH
+    matrix_path = os.path.join(directory, 'image_matrix.npy')
+    ids_path = os.path.join(directory, 'image_ids.npy')
+    if os.path.exists(matrix_path) and os.path.exists(ids_path):
+        matrix = np.load(matrix_path, mmap_mode='r')
+        ids = np.load(ids_path)
+        # Rows are views into the mapped file: no copy, and the pages are shared between processes
+        return dict(zip(ids.tolist(), matrix))
+    
+    # Older artifact layout: a pickled dict (run generate_embeddings.py --matrix-only to convert)
+    image_embeddings_path = os.path.join(directory, 'image_embeddings.npy')
+    return np.load(image_embeddings_path, allow_pickle=True).item()
+
+def shard_embeddings(ids, directory):
+    """id -> vector in the shards' position order, for a process whose index lives on shard servers
+    
+    Search only needs the ids; the vectors (for product search and re-ranking) are mapped from
+    the version's matrix where this host has a copy, and are None otherwise.
+    """
+    embeddings = dict.fromkeys(ids)
+    matrix_path = os.path.join(directory, 'image_matrix.npy')
+    ids_path = os.path.join(directory, 'image_ids.npy')
+    if os.path.exists(matrix_path) and os.path.exists(ids_path):
+        matrix = np.load(matrix_path, mmap_mode='r')
+        for row, img_id in enumerate(np.load(ids_path).tolist()):
+            if img_id in embeddings:
+                embeddings[img_id] = matrix[row]
+    return embeddings
+
+def process_memory():
+    """Return this process's resident memory in MB (RSS, plus PSS/USS where Linux exposes them)"""
+    memory = {}
+    try:
+        # smaps_rollup splits shared pages fairly (PSS) and shows what is private to us (USS)
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        kb = lambda name: int(fields[name].split()[0]) if name in fields else 0
+        memory["rss_mb"] = kb('Rss') / 1024.0
+        memory["pss_mb"] = kb('Pss') / 1024.0
+        memory["uss_mb"] = (kb('Private_Clean') + kb('Private_Dirty')) / 1024.0
+    except (OSError, ValueError):
+        try:
+            import resource
+        except ImportError:  # Windows
+            return memory
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["rss_mb"] = peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+    return memory
+
+class ShardConnection:
+    """A persistent connection to one shard server"""
+    
+    def __init__(self, address, timeout):
+        self.address = address
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.reader = None
+    
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+    
+    def search(self, request):
+        """Send one request line and wait for the reply, reconnecting if needed"""
+        import socket
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.address, timeout=self.timeout)
+                    self.reader = self.sock.makefile('rb')
+                self.sock.settimeout(self.timeout)
+                self.sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError(f"Shard {self.address} closed the connection")
+                return json.loads(line)
+            except Exception:
+                # A late reply would corrupt the next exchange, so start afresh
+                self.close()
+                raise
+
+class ShardedIndex:
+    """FAISS-compatible search() that scatters queries to shard servers and merges the top-k exactly"""
+    
+    def __init__(self, manifest_path, addresses=None, timeout_ms=500.0, quiet=False):
+        from concurrent.futures import ThreadPoolExecutor
+        from shard_server import default_addresses, load_manifest
+        
+        self.manifest = load_manifest(manifest_path)
+        shards = self.manifest["shards"]
+        self.d = self.manifest["dimension"]
+        self.quiet = quiet
+        self.timeout = timeout_ms / 1000.0
+        self.missing_shards = []
+        
+        if addresses:
+            parsed = []
+            for address in addresses.split(','):
+                host, port = address.strip().rsplit(':', 1)
+                parsed.append((host, int(port)))
+            addresses = parsed
+        else:
+            addresses = default_addresses(len(shards))
+        if len(addresses) != len(shards):
+            raise ValueError(f"Got {len(addresses)} shard addresses for {len(shards)} shards")
+        
+        # Global positions are shard offset + position within the shard
+        self.ids = []
+        self.offsets = []
+        for shard in shards:
+            self.offsets.append(len(self.ids))
+            self.ids.extend(np.load(os.path.join(shard["path"], 'image_ids.npy')).tolist())
+        self.ntotal = len(self.ids)
+        
+        self.connections = [ShardConnection(address, self.timeout) for address in addresses]
+        self.executor = ThreadPoolExecutor(max_workers=len(shards))
+    
+    def search(self, vectors, k):
+        """Search every shard and merge; shards that time out or fail are skipped"""
+        from concurrent.futures import wait
+        from shard_server import decode_array, encode_array
+        
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        count = vectors.shape[0]
+        request = {"k": int(k), "count": count, "dim": vectors.shape[1], "vectors": encode_array(vectors, np.float32)}
+        futures = [self.executor.submit(conn.search, request) for conn in self.connections]
+        done, _ = wait(futures, timeout=self.timeout)
+        
+        all_distances = []
+        all_indices = []
+        self.missing_shards = []
+        for shard_no, (future, offset) in enumerate(zip(futures, self.offsets)):
+            try:
+                if future not in done:
+                    raise TimeoutError("timed out")
+                response = future.result()
+                if "error" in response:
+                    raise RuntimeError(response["error"])
+            except Exception as e:
+                self.missing_shards.append(shard_no)
+                if not self.quiet:
+                    print(f"Warning: skipping shard {shard_no} ({self.connections[shard_no].address}): {e}", file=sys.stderr)
+                continue
+            
+            distances = decode_array(response["distances"], np.float32, (count, response["k"]))
+            indices = decode_array(response["indices"], np.int64, (count, response["k"]))
+            all_distances.append(distances)
+            # Keep FAISS's -1 padding as-is
+            all_indices.append(np.where(indices >= 0, indices + offset, -1))
+        
+        if not all_distances:
+            raise RuntimeError("No shard answered in time")
+        
+        # Each shard's top-k contains its share of the global top-k, so merging them is exact
+        distances = np.concatenate(all_distances, axis=1)
+        indices = np.concatenate(all_indices, axis=1)
+        distances = np.where(indices >= 0, distances, np.inf)
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+class RerankedIndex:
+    """FAISS-compatible search() over a compressed index, re-ranked exactly in float32
+    
+    The compressed index (fp16/int8 scalar quantizer or PQ codes) stays in memory and
+    proposes rerank_factor * k candidates; their exact L2 distances are computed from
+    the memory-mapped float32 matrix, so only the candidates' rows are paged in.
+    """
+    
+    def __init__(self, index, matrix, rerank_factor=4):
+        if index.ntotal != len(matrix):
+            raise ValueError(f"Compressed index has {index.ntotal} vectors, embedding matrix has {len(matrix)}")
+        self.index = index
+        self.matrix = matrix
+        self.rerank_factor = max(1, rerank_factor)
+        self.ntotal = index.ntotal
+        self.d = index.d
+    
+    def search(self, vectors, k):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        fetch = min(k * self.rerank_factor, self.ntotal)
+        with span("index_search_compressed"):
+            _, candidates = self.index.search(vectors, fetch)
+        
+        # Same padding as FAISS when fewer than k results exist
+        distances = np.full((len(vectors), k), np.finfo(np.float32).max, dtype=np.float32)
+        indices = np.full((len(vectors), k), -1, dtype=np.int64)
+        with span("rerank"):
+            for row, (query, row_candidates) in enumerate(zip(vectors, candidates)):
+                # Sorted positions turn the gather into forward reads of the mapped file
+                row_candidates = np.sort(row_candidates[row_candidates >= 0])
+                exact = ((np.asarray(self.matrix[row_candidates], dtype=np.float32) - query) ** 2).sum(axis=1)
+                top = np.argsort(exact, kind='stable')[:k]
+                distances[row, :len(top)] = exact[top]
+                indices[row, :len(top)] = row_candidates[top]
+        return distances, indices
+
+def load_duplicate_clusters(index_ids=None, directory=None):
+    """Load cluster ids, re-ordered to match index positions when those differ from image_ids.npy (shards)"""
+    directory = directory or EMBEDDINGS_PATH
+    clusters = np.load(os.path.join(directory, 'duplicate_clusters.npy'), mmap_mode='r')
+    if index_ids is None:
+        return clusters
+    
+    row_of = {img_id: row for row, img_id in enumerate(np.load(os.path.join(directory, 'image_ids.npy')).tolist())}
+    return np.array([clusters[row_of[img_id]] for img_id in index_ids], dtype=np.int32)
+
+class DiversifiedIndex:
+    """FAISS-compatible search() returning at most one result per near-duplicate cluster
+    
+    Callers already over-fetch for colour re-ranking, so the wrapper only adds the rows
+    duplicates are expected to take: k times the catalogue's mean cluster size (1.0 with
+    no duplicates). It searches again only for the queries whose candidates still collapse
+    to fewer than k distinct clusters, doubling the k each time.
+    """
+    
+    def __init__(self, index, clusters, expansion=None):
+        if len(clusters) != index.ntotal:
+            raise ValueError(f"Duplicate clusters cover {len(clusters)} items, index has {index.ntotal}")
+        self.index = index
+        self.clusters = clusters
+        if expansion is None:
+            expansion = len(clusters) / max(1, len(np.unique(clusters)))
+        self.expansion = expansion
+        self.ntotal = index.ntotal
+        self.d = index.d
+    
+    @property
+    def missing_shards(self):
+        return getattr(self.index, 'missing_shards', [])
+    
+    def search(self, vectors, k):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        distances = np.full((len(vectors), k), np.finfo(np.float32).max, dtype=np.float32)
+        indices = np.full((len(vectors), k), -1, dtype=np.int64)
+        
+        pending = np.arange(len(vectors))
+        fetch = min(int(np.ceil(k * self.expansion)), self.ntotal)
+        while len(pending):
+            found_distances, found_indices = self.index.search(vectors[pending], fetch)
+            unfinished = []
+            for row, query in enumerate(pending):
+                valid = np.flatnonzero(found_indices[row] >= 0)
+                # First (closest) hit of each cluster, in rank order
+                _, first = np.unique(self.clusters[found_indices[row][valid]], return_index=True)
+                keep = valid[np.sort(first)][:k]
+                if len(keep) < k and fetch < self.ntotal:
+                    unfinished.append(query)
+                    continue
+                distances[query, :len(keep)] = found_distances[row][keep]
+                indices[query, :len(keep)] = found_indices[row][keep]
+            pending = np.array(unfinished, dtype=np.int64)
+            fetch = min(fetch * 2, self.ntotal)
+        return distances, indices
+
+class FacetIndex:
+    """Facet columns of styles.csv as integer codes aligned with index positions"""
+    
+    def __init__(self, df, ids, columns=FACET_COLUMNS):
+        # One metadata row per index position; positions without metadata get code -1
+        rows = df.assign(id=df['id'].astype(str)).drop_duplicates('id').set_index('id')
+        rows = rows.reindex([str(img_id) for img_id in ids])
+        self.size = len(ids)
+        self.codes = {}
+        self.labels = {}
+        for column in columns:
+            codes, labels = pd.factorize(rows[column])
+            self.codes[column] = codes.astype(np.int16 if len(labels) < np.iinfo(np.int16).max else np.int32)
+            self.labels[column] = [str(label) for label in labels]
+    
+    def counts(self, positions, columns=None):
+        """{column: {value: count}} over index positions (a row, or rows whose union is counted), most frequent first"""
+        positions = np.asarray(positions)
+        positions = np.unique(positions) if positions.ndim > 1 and len(positions) > 1 else positions.reshape(-1)
+        positions = positions[positions >= 0]
+        facets = {}
+        for column in columns or self.codes:
+            codes = self.codes[column][positions]
+            counts = np.bincount(codes[codes >= 0], minlength=len(self.labels[column]))
+            present = np.flatnonzero(counts)
+            order = present[np.argsort(-counts[present], kind='stable')]
+            facets[column] = {self.labels[column][code]: int(counts[code]) for code in order}
+        return facets
+
+class FacetedIndex:
+    """FAISS-compatible search() that also counts facets over the top `facet_k` candidates of each call"""
+    
+    def __init__(self, index, facets, facet_k=FACET_K, columns=None):
+        self.index = index
+        self.facets = facets
+        self.facet_k = facet_k
+        self.columns = columns
+        self.counts = None
+        self.ntotal = index.ntotal
+        self.d = index.d
+    
+    @property
+    def missing_shards(self):
+        return getattr(self.index, 'missing_shards', [])
+    
+    def search(self, vectors, k):
+        distances, indices = self.index.search(vectors, max(k, min(self.facet_k, self.ntotal)))
+        with span("facets"):
+            self.counts = self.facets.counts(indices[:, :self.facet_k], self.columns)
+        return distances[:, :k], indices[:, :k]
+
+# FacetIndex per loaded catalogue, dropped when its DataFrame is
+_facet_indexes = {}
+
+def facet_index(df, image_embeddings):
+    """The FacetIndex for a loaded catalogue, in the position order of its index"""
+    entry = _facet_indexes.get(id(df))
+    if entry is not None and entry[0]() is df and entry[1].size == len(image_embeddings):
+        return entry[1]
+    with span("facet_codes"):
+        facets = FacetIndex(df, list(image_embeddings.keys()))
+    _facet_indexes[id(df)] = (weakref.ref(df), facets)
+    weakref.finalize(df, _facet_indexes.pop, id(df), None)
+    return facets
+
+def request_facets(request):
+    """Return (columns, facet_k) when a request asks for facet counts, else None"""
+    facets = request.get("facets")
+    if not facets or request.get("search_type") not in FACETED_SEARCH_TYPES:
+        return None
+    columns = FACET_COLUMNS if facets is True or facets in ("1", "true") else parse_list(facets)
+    unknown = [column for column in columns if column not in FACET_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown facet: {', '.join(unknown)}")
+    facet_k = int(request.get("facet_k") or FACET_K)
+    if facet_k < 1:
+        raise ValueError("facet_k must be at least 1")
+    return columns, facet_k
+
+def metadata_file(directory=None):
+    """styles.csv as snapshotted into a published version, else the dataset's own"""
+    snapshot = os.path.join(directory or EMBEDDINGS_PATH, 'styles.csv')
+    return snapshot if os.path.exists(snapshot) else METADATA_FILE
+
+@traced("csv_parse")
+def load_metadata(quiet=False, path=None):
+    """Load styles.csv with error handling for CSV parsing"""
+    path = path or metadata_file()
+    try:
+        # First attempt: try with default settings
+        df = pd.read_csv(path)
+    except pd.errors.ParserError:
+        if not quiet:
+            print("CSV parsing error with default settings, trying with on_bad_lines='skip'...", file=sys.stderr)
+        try:
+            # Second attempt: skip bad lines
+            df = pd.read_csv(path, on_bad_lines='skip')
+        except:
+            if not quiet:
+                print("Still having CSV parsing issues, trying with engine='python'...", file=sys.stderr)
+            try:
+                # Third attempt: use Python engine which is more flexible
+                df = pd.read_csv(path, engine='python')
+            except:
+                if not quiet:
+                    print("Final attempt with most flexible settings...", file=sys.stderr)
+                # Last resort: use Python engine with very flexible settings
+                df = pd.read_csv(path, engine='python', sep=',', quotechar='"', 
+                                escapechar='\\', on_bad_lines='skip')
+    
+    return df
+
+def compressed_index_path(index_mode, directory=None):
+    """Where generate_embeddings.py --compressed writes the first-stage index for a mode"""
+    return os.path.join(directory or EMBEDDINGS_PATH, f'fashion_faiss_{index_mode}.index')
+
+def load_model_and_data(quiet=False, shard_manifest=None, shard_addresses=None, shard_timeout_ms=None,
+                        index_mode=None, rerank_factor=None, diversify=None, load_model=True):
     """Load CLIP model, FAISS index, and metadata"""
+    shard_manifest = shard_manifest or SHARD_MANIFEST_PATH
+    index_mode = index_mode or INDEX_MODE
+    index_path = FAISS_INDEX_PATH if index_mode == 'flat' else compressed_index_path(index_mode)
     try:
         # Check if paths exist
         if not os.path.exists(DATASET_PATH):
@@ -220,44 +981,21 @@ def load_model_and_data(quiet=False):
             if not quiet:
                 print(f"Embeddings path does not exist: {EMBEDDINGS_PATH}", file=sys.stderr)
             sys.exit(1)
-        if not os.path.exists(FAISS_INDEX_PATH):
+        if not shard_manifest and not os.path.exists(index_path):
             if not quiet:
-                print(f"FAISS index does not exist: {FAISS_INDEX_PATH}", file=sys.stderr)
+                print(f"FAISS index does not exist: {index_path}", file=sys.stderr)
             sys.exit(1)
             
-        # Load CLIP model
+        # Load CLIP model (product searches start from stored embeddings and skip it)
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        model, preprocess = clip.load("ViT-B/32", device=device)
+        model, preprocess = None, None
+        if load_model:
+            with span("model_load"):
+                model, preprocess = clip.load(CLIP_MODEL, device=device)
         
-        # Load FAISS index
-        index = faiss.read_index(FAISS_INDEX_PATH)
-        
-        # Load metadata with error handling for CSV parsing
-        try:
-            # First attempt: try with default settings
-            df = pd.read_csv(METADATA_FILE)
-        except pd.errors.ParserError:
-            if not quiet:
-                print("CSV parsing error with default settings, trying with on_bad_lines='skip'...", file=sys.stderr)
-            try:
-                # Second attempt: skip bad lines
-                df = pd.read_csv(METADATA_FILE, on_bad_lines='skip')
-            except:
-                if not quiet:
-                    print("Still having CSV parsing issues, trying with engine='python'...", file=sys.stderr)
-                try:
-                    # Third attempt: use Python engine which is more flexible
-                    df = pd.read_csv(METADATA_FILE, engine='python')
-                except:
-                    if not quiet:
-                        print("Final attempt with most flexible settings...", file=sys.stderr)
-                    # Last resort: use Python engine with very flexible settings
-                    df = pd.read_csv(METADATA_FILE, engine='python', sep=',', quotechar='"', 
-                                    escapechar='\\', on_bad_lines='skip')
-        
-        # Load image embeddings
-        image_embeddings_path = os.path.join(EMBEDDINGS_PATH, 'image_embeddings.npy')
-        image_embeddings = np.load(image_embeddings_path, allow_pickle=True).item()
+        index, df, image_embeddings = load_search_data(EMBEDDINGS_PATH, shard_manifest, shard_addresses,
+                                                       shard_timeout_ms, index_mode, rerank_factor, diversify, quiet,
+                                                       CLIP_MODEL)
         
         return model, preprocess, index, df, image_embeddings, device
     except Exception as e:
@@ -265,6 +1003,209 @@ def load_model_and_data(quiet=False):
             print(f"Error loading model and data: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
+def load_search_data(directory=None, shard_manifest=None, shard_addresses=None, shard_timeout_ms=None,
+                     index_mode=None, rerank_factor=None, diversify=None, quiet=False, model_name=None):
+    """Load one artifact version's index (or shard client), metadata and image embeddings
+    
+    With `model_name`, refuse artifacts that model.json says another model built.
+    """
+    directory = directory or EMBEDDINGS_PATH
+    index_mode = index_mode or INDEX_MODE
+    model_info = read_model_info(directory)
+    if model_name and model_info["model"] != model_name:
+        raise ValueError(f"{directory} holds {model_info['model']} embeddings, not {model_name}")
+    
+    # Load FAISS index, or connect to the shard servers (whose position order is the shards', not image_ids.npy's)
+    index_ids = None
+    if shard_manifest:
+        with span("index_load"):
+            index = ShardedIndex(shard_manifest, shard_addresses or SHARD_ADDRESSES,
+                                 shard_timeout_ms or SHARD_TIMEOUT_MS, quiet)
+        index_ids = index.ids
+    elif index_mode != 'flat':
+        with span("index_load"):
+            index = RerankedIndex(faiss.read_index(compressed_index_path(index_mode, directory)),
+                                  np.load(os.path.join(directory, 'image_matrix.npy'), mmap_mode='r'),
+                                  rerank_factor or RERANK_FACTOR)
+    else:
+        with span("index_load"):
+            index = faiss.read_index(os.path.join(directory, 'fashion_faiss.index'))
+    if model_info.get("dimension") and model_info["dimension"] != index.d:
+        raise ValueError(f"{directory}: model.json says {model_info['dimension']} dimensions, the index has {index.d}")
+    
+    # Collapse near-duplicates when the clustering job has been run
+    if (DIVERSIFY if diversify is None else diversify) and os.path.exists(os.path.join(directory, 'duplicate_clusters.npy')):
+        with span("index_load"):
+            index = DiversifiedIndex(index, load_duplicate_clusters(index_ids, directory))
+    
+    # Load metadata
+    df = load_metadata(quiet, metadata_file(directory))
+    
+    # Load image embeddings
+    if index_ids is not None:
+        image_embeddings = shard_embeddings(index_ids, directory)
+    else:
+        image_embeddings = load_image_embeddings(directory)
+    
+    return index, df, image_embeddings
+
+def use_artifact_dir(directory):
+    """Point the module's artifact paths at another version and drop caches read from the old one"""
+    global EMBEDDINGS_PATH, FAISS_INDEX_PATH, IMAGE_MATRIX_PATH, IMAGE_IDS_PATH, DUPLICATE_CLUSTERS_PATH
+    global SIMILAR_NEIGHBORS_PATH, SIMILAR_SCORES_PATH
+    EMBEDDINGS_PATH = directory
+    FAISS_INDEX_PATH = os.path.join(directory, 'fashion_faiss.index')
+    IMAGE_MATRIX_PATH = os.path.join(directory, 'image_matrix.npy')
+    IMAGE_IDS_PATH = os.path.join(directory, 'image_ids.npy')
+    DUPLICATE_CLUSTERS_PATH = os.path.join(directory, 'duplicate_clusters.npy')
+    SIMILAR_NEIGHBORS_PATH = os.path.join(directory, 'similar_neighbors.npy')
+    SIMILAR_SCORES_PATH = os.path.join(directory, 'similar_scores.npy')
+    for cached in (catalogue_rows, catalogue_matrix, load_similar_table, load_validation_probe):
+        cached.cache_clear()
+
+def use_model(name):
+    """Make `name` the process's model: its artifact root, live version and user profiles"""
+    global CLIP_MODEL, ARTIFACTS_ROOT, USER_PROFILES_PATH, VALIDATION_PROBE_PATH
+    CLIP_MODEL = name
+    ARTIFACTS_ROOT = model_root(EMBEDDINGS_ROOT, name)
+    USER_PROFILES_PATH = os.environ.get('CLIP_USER_PROFILES', os.path.join(ARTIFACTS_ROOT, 'user_profiles.sqlite'))
+    VALIDATION_PROBE_PATH = os.path.join(ARTIFACTS_ROOT, 'validation_probe.npz')
+    profile_store.cache_clear()
+    use_artifact_dir(resolve_artifact_dir(ARTIFACTS_ROOT))
+
+def load_extra_models(names, index_mode=None, rerank_factor=None, diversify=None, quiet=False):
+    """Load models to serve beside CLIP_MODEL, each with its own artifacts
+    
+    Returns {name: (model, preprocess, index, df, image_embeddings, device)}.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    models = {}
+    for name in names:
+        if name == CLIP_MODEL or name in models:
+            continue
+        directory = resolve_artifact_dir(model_root(EMBEDDINGS_ROOT, name))
+        if not os.path.exists(os.path.join(directory, 'fashion_faiss.index')):
+            raise ValueError(f"No artifacts for {name} in {directory}; run generate_embeddings.py --model {name}")
+        with span("model_load"):
+            model, preprocess = clip.load(name, device=device)
+        index, df, image_embeddings = load_search_data(directory, None, None, None, index_mode, rerank_factor,
+                                                       diversify, quiet, name)
+        models[name] = (model, preprocess, index, df, image_embeddings, device)
+    return models
+
+def release_index(index):
+    """Free a replaced FAISS index's vectors now rather than when its last reference goes"""
+    while index is not None and not isinstance(index, faiss.Index):
+        index = getattr(index, 'index', None)
+    if index is not None:
+        index.reset()
+
+def release_memory():
+    """Collect dropped artifacts and hand freed heap pages back to the OS where libc allows it"""
+    import gc
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+class ArtifactReloader:
+    """Loads newly published artifact versions in the background for a long-running process
+    
+    A watcher thread polls embeddings/CURRENT. When it names a new version, that version's
+    index, metadata and embeddings are loaded on the watcher thread while the old ones keep
+    serving; the search loop calls swap() between requests to put them in service. Reloaders
+    of extra models leave the module's artifact paths (those of CLIP_MODEL) alone.
+    """
+    
+    def __init__(self, load, root=ARTIFACTS_ROOT, interval=RELOAD_INTERVAL, quiet=False, rebind_paths=True):
+        self.load = load
+        self.root = root
+        self.rebind_paths = rebind_paths
+        self.interval = interval
+        self.quiet = quiet
+        self.version = current_version(root)
+        self.reloads = 0
+        self._ready = None
+        self._failed = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+    
+    def close(self):
+        self._stop.set()
+    
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            version = current_version(self.root)
+            ready = self._ready
+            if version is None or version in (self.version, self._failed) or (ready and ready[0] == version):
+                continue
+            
+            started = time.perf_counter()
+            try:
+                directory = version_dir(self.root, version)
+                verify_version(directory)
+                loaded = self.load(directory)
+            except Exception as e:
+                # Don't retry a broken version every interval; a newer one will be picked up
+                self._failed = version
+                if not self.quiet:
+                    print(f"Error loading artifact version {version}: {str(e)}", file=sys.stderr)
+                continue
+            
+            with self._lock:
+                self._ready = (version, directory, loaded)
+            if not self.quiet:
+                print(f"Loaded artifact version {version} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    
+    def swap(self, search_args):
+        """Return search_args with a newly loaded version in place of the old one, if one is waiting
+        
+        Only call this between requests on the thread that searches: the old index is freed here.
+        """
+        if self._ready is None:
+            return search_args
+        with self._lock:
+            version, directory, loaded = self._ready
+            self._ready = None
+        
+        previous = self.version
+        old_index = search_args[2]
+        if self.rebind_paths:
+            use_artifact_dir(directory)
+        search_args = search_args[:2] + loaded + search_args[5:]
+        self.version = version
+        self.reloads += 1
+        release_index(old_index)
+        release_memory()
+        if not self.quiet:
+            print(f"Switched artifacts from version {previous} to {version}", file=sys.stderr)
+        return search_args
+
+def artifact_reloader(interval=None, shard_manifest=None, shard_addresses=None, shard_timeout_ms=None,
+                      index_mode=None, rerank_factor=None, diversify=None, quiet=False, model_name=None):
+    """An ArtifactReloader for a long-running process, or None when reloading is off or shards serve the index
+    
+    `model_name` watches an extra model's artifacts instead of CLIP_MODEL's.
+    """
+    interval = RELOAD_INTERVAL if interval is None else interval
+    if interval <= 0 or (model_name is None and (shard_manifest or SHARD_MANIFEST_PATH)):
+        return None
+    def load(directory):
+        index, df, image_embeddings = load_search_data(directory, None, None, None, index_mode, rerank_factor,
+                                                       diversify, quiet, model_name or CLIP_MODEL)
+        # Encode the new version's facets off the request path too
+        facet_index(df, image_embeddings)
+        return index, df, image_embeddings
+    
+    if model_name is not None:
+        return ArtifactReloader(load, model_root(EMBEDDINGS_ROOT, model_name), interval, quiet, rebind_paths=False)
+    return ArtifactReloader(load, ARTIFACTS_ROOT, interval, quiet)
+
+@traced("enrich")
 def enrich_product_results(product_results, dominant_colors=None, quiet=False):
     """Add additional metadata to product results and prioritize color matches"""
     try:
@@ -331,8 +1272,8 @@ def enrich_product_results(product_results, dominant_colors=None, quiet=False):
         if dominant_colors:
             # Map any color name to our standardized color names
             for color in dominant_colors:
-                if color.capitalize() in COLOR_MAPPING:
-                    mapped_color = COLOR_MAPPING[color.capitalize()]
+                if color.title() in COLOR_MAPPING:
+                    mapped_color = COLOR_MAPPING[color.title()]
                     if mapped_color not in target_colors:
                         target_colors.append(mapped_color)
         
@@ -398,12 +1339,169 @@ def enrich_product_results(product_results, dominant_colors=None, quiet=False):
             print(f"Error enriching product results: {e}", file=sys.stderr)
         return product_results
 
-def search_by_text(query, model, index, df, image_embeddings, device, top_k=5, quiet=False):
+@functools.lru_cache(maxsize=1)
+def profile_store():
+    """The process's user profile store, or None when no profiles have been recorded"""
+    if not os.path.exists(USER_PROFILES_PATH):
+        return None
+    from user_profiles import UserProfileStore
+    return UserProfileStore(USER_PROFILES_PATH)
+
+def user_personalization(request):
+    """Return (preference vector, mode, weight) for a request's user, or None"""
+    user_id = request.get("user_id")
+    mode = request.get("personalization") or "rerank"
+    if not user_id or mode == "off":
+        return None
+    store = profile_store()
+    vector = store.get(str(user_id)) if store is not None else None
+    if vector is None:
+        return None
+    weight = request.get("personalization_weight")
+    return vector, mode, PERSONALIZATION_WEIGHT if weight is None else float(weight)
+
+def personalize_query(query_embedding, personalization):
+    """Blend the user's preference into a (1, d) or (d,) query vector"""
+    if personalization is None or personalization[1] != "blend":
+        return query_embedding
+    vector, _, weight = personalization
+    blended = (1.0 - weight) * np.asarray(query_embedding, dtype=np.float32) + weight * vector
+    return (blended / np.linalg.norm(blended)).astype(np.float32)
+
+def personalize_results(product_results, personalization, image_embeddings):
+    """Re-rank candidates by similarity plus weight * (preference . item embedding)"""
+    if personalization is None or personalization[1] != "rerank" or not product_results:
+        return product_results
+    vector, _, weight = personalization
+    scores = [
+        product.get('similarity', 0.0) + weight * float(vector @ stored_embedding(product['id'], image_embeddings))
+        for product in product_results
+    ]
+    order = sorted(range(len(product_results)), key=lambda i: -scores[i])
+    return [product_results[i] for i in order]
+
+def multimodal_fusion(request):
+    """Return (strategy, text weight, overfetch) for a multimodal request, defaulting to the CLIP_* settings"""
+    strategy = request.get("fusion") or FUSION_STRATEGY
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy: {strategy}")
+    text_weight = request.get("text_weight")
+    text_weight = MULTIMODAL_TEXT_WEIGHT if text_weight is None else float(text_weight)
+    if not 0.0 <= text_weight <= 1.0:
+        raise ValueError("text_weight must be between 0 and 1")
+    overfetch = int(request.get("overfetch") or MULTIMODAL_OVERFETCH)
+    if overfetch < 1:
+        raise ValueError("overfetch must be at least 1")
+    return strategy, text_weight, overfetch
+
+def fusion_text_weight(strategy, text_weight, similarity):
+    """The text feature's weight for one query; "adaptive" lets the image decide when the two disagree"""
+    if strategy != "adaptive":
+        return text_weight
+    # Full weight from twice the coherence threshold up, none for unrelated text
+    return text_weight * min(1.0, max(0.0, similarity) / (2 * COHERENCE_THRESHOLD))
+
+def fusion_queries(text_feature, image_feature, strategy, text_weight):
+    """Query rows for one multimodal search: the fused vector, or both features for late fusion"""
+    text_feature = np.asarray(text_feature, dtype=np.float32).reshape(-1)
+    image_feature = np.asarray(image_feature, dtype=np.float32).reshape(-1)
+    if strategy == "late":
+        return np.stack([text_feature, image_feature])
+    fused = text_weight * text_feature + (1.0 - text_weight) * image_feature
+    return (fused / np.linalg.norm(fused))[None, :]
+
+@traced("fusion_merge")
+def merge_ranked_lists(distances, indices, weights, k):
+    """Late fusion: merge per-modality result rows into one (distances, indices) row by weighted distance
+    
+    An item missing from a list gets that list's worst retrieved distance, a lower bound on its
+    true one, so items found by both modalities rank ahead of equally close single-list hits.
+    """
+    valid = [row >= 0 for row in indices]
+    candidates = np.unique(np.concatenate([row[mask] for row, mask in zip(indices, valid)]))
+    fused = np.zeros(len(candidates), dtype=np.float32)
+    for row_distances, row_indices, mask, weight in zip(distances, indices, valid, weights):
+        floor = row_distances[mask].max() if mask.any() else 0.0
+        merged = np.full(len(candidates), floor, dtype=np.float32)
+        merged[np.searchsorted(candidates, row_indices[mask])] = row_distances[mask]
+        fused += weight * merged
+    order = np.argsort(fused, kind='stable')[:k]
+    return fused[order], candidates[order]
+
+def fused_search(index, queries, weights, fetch_k):
+    """Search a multimodal query's rows in one call; returns one (distances, indices) row"""
+    with span("index_search"):
+        distances, indices = index.search(np.ascontiguousarray(queries, dtype=np.float32), fetch_k)
+    if len(queries) == 1:
+        return distances[0], indices[0]
+    return merge_ranked_lists(distances, indices, weights, fetch_k)
+
+@traced("hydrate")
+def build_product_results(distances, indices, df, image_embeddings, quiet=False):
+    """Look up catalogue metadata for one row of FAISS search results"""
+    # Get image IDs
+    img_ids = list(image_embeddings.keys())
+    
+    product_results = []
+    for i, idx in enumerate(indices):
+        # FAISS pads with -1 when fewer than k vectors are available
+        if idx < 0:
+            continue
+        img_id = img_ids[idx]
+        row = df[df['id'].astype(str) == img_id]
+        if not row.empty:
+            try:
+                product_results.append({
+                    'id': img_id,
+                    'name': row['productDisplayName'].values[0],
+                    'category': row['masterCategory'].values[0] if 'masterCategory' in row else 'Unknown',
+                    'subCategory': row['subCategory'].values[0] if 'subCategory' in row else 'Unknown',
+                    'articleType': row['articleType'].values[0] if 'articleType' in row else 'Unknown',
+                    'baseColor': row['baseColour'].values[0] if 'baseColour' in row else 'Unknown',
+                    'gender': row['gender'].values[0] if 'gender' in row else 'Unknown',
+                    'usage': row['usage'].values[0] if 'usage' in row else 'Unknown',
+                    'similarity': float(1.0 - distances[i]),
+                    'image': f"{img_id}.jpg"
+                })
+            except Exception as e:
+                if not quiet:
+                    print(f"Error processing product {img_id}: {str(e)}", file=sys.stderr)
+                # Add with minimal information
+                product_results.append({
+                    'id': img_id,
+                    'name': f"Product {img_id}",
+                    'similarity': float(1.0 - distances[i]),
+                    'image': f"{img_id}.jpg"
+                })
+        else:
+            if not quiet:
+                print(f"No metadata found for product ID: {img_id}", file=sys.stderr)
+    
+    return product_results
+
+@functools.lru_cache(maxsize=1)
+def query_normalizer():
+    """The process's compiled query normalizer (built on first use)"""
+    from query_normalizer import QueryNormalizer
+    return QueryNormalizer(NON_FASHION_KEYWORDS, COLOR_MAPPING, FASHION_CATEGORIES + ACCESSORY_CATEGORIES)
+
+def normalize_query(query):
+    """Return {"key", "tokens", "non_fashion", "colors"} for a text query"""
+    return query_normalizer().normalize(query)
+
+def is_non_fashion_query(query):
+    """Check if a text query mentions non-fashion keywords (plurals, typos and phrases included)"""
+    return bool(normalize_query(query)["non_fashion"])
+
+def search_by_text(query, model, index, df, image_embeddings, device, top_k=5, quiet=False, personalization=None,
+                   cursor=None):
     """Search for fashion products using text query"""
     try:
+        with span("query_normalize"):
+            normalized = normalize_query(query)
+        
         # Check if query contains non-fashion keywords
-        query_words = set(query.lower().split())
-        if query_words & NON_FASHION_KEYWORDS:
+        if normalized["non_fashion"]:
             if not quiet:
                 print("Warning: Your query contains non-fashion-related terms. Please search for fashion-related products.", file=sys.stderr)
             return []
@@ -413,50 +1511,26 @@ def search_by_text(query, model, index, df, image_embeddings, device, top_k=5, q
         
         with torch.no_grad():
             # Encode the text query
-            text_feature = model.encode_text(text_token).cpu().numpy()
+            with span("clip_encode_text"):
+                text_feature = model.encode_text(text_token).cpu().numpy()
             text_feature /= np.linalg.norm(text_feature)
         
-        # Perform search
-        distances, indices = index.search(text_feature, top_k * 2)  # Get more results for filtering
+        # Paginated: the cursor keeps the query and serves this page and the later ones
+        if cursor is not None:
+            cursor.start(personalize_query(text_feature, personalization), 2, normalized["colors"] or None,
+                         personalization)
+            return cursor.next_page(index, df, image_embeddings, quiet=quiet)
         
-        # Get image IDs
-        img_ids = list(image_embeddings.keys())
-        results = [img_ids[i] for i in indices[0]]
+        # Perform search
+        with span("index_search"):
+            distances, indices = index.search(personalize_query(text_feature, personalization), top_k * 2)  # Get more results for filtering
         
         # Get product details
-        product_results = []
-        for i, img_id in enumerate(results):
-            row = df[df['id'].astype(str) == img_id]
-            if not row.empty:
-                try:
-                    product_results.append({
-                        'id': img_id,
-                        'name': row['productDisplayName'].values[0],
-                        'category': row['masterCategory'].values[0] if 'masterCategory' in row else 'Unknown',
-                        'subCategory': row['subCategory'].values[0] if 'subCategory' in row else 'Unknown',
-                        'articleType': row['articleType'].values[0] if 'articleType' in row else 'Unknown',
-                        'baseColor': row['baseColour'].values[0] if 'baseColour' in row else 'Unknown',
-                        'gender': row['gender'].values[0] if 'gender' in row else 'Unknown',
-                        'usage': row['usage'].values[0] if 'usage' in row else 'Unknown',
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-                except Exception as e:
-                    if not quiet:
-                        print(f"Error processing product {img_id}: {str(e)}", file=sys.stderr)
-                    # Add with minimal information
-                    product_results.append({
-                        'id': img_id,
-                        'name': f"Product {img_id}",
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-            else:
-                if not quiet:
-                    print(f"No metadata found for product ID: {img_id}", file=sys.stderr)
+        product_results = build_product_results(distances[0], indices[0], df, image_embeddings, quiet)
+        product_results = personalize_results(product_results, personalization, image_embeddings)
         
-        # Enrich the results with additional metadata
-        product_results = enrich_product_results(product_results, None, quiet)
+        # Enrich the results with additional metadata, favouring colours the query asks for
+        product_results = enrich_product_results(product_results, normalized["colors"] or None, quiet)
         
         # Return the top K results after all processing
         return product_results[:top_k]
@@ -465,14 +1539,24 @@ def search_by_text(query, model, index, df, image_embeddings, device, top_k=5, q
             print(f"Error in text search: {str(e)}", file=sys.stderr)
         return []
 
-def search_by_image(image_path, model, preprocess, index, df, image_embeddings, device, top_k=5, dominant_colors=None, quiet=False):
+def search_by_image(image_path, model, preprocess, index, df, image_embeddings, device, top_k=5, dominant_colors=None, quiet=False, personalization=None,
+                    cursor=None, prescreen=None):
     """Search for fashion products using image query"""
     try:
         # Load and preprocess image
-        image = preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
+        with span("image_decode"):
+            image = preprocess(open_image(image_path)).unsqueeze(0).to(device)
+        
+        with torch.no_grad():
+            # Encode the image once: validation screens the same features the index is searched with
+            with span("clip_encode_image"):
+                image_features = model.encode_image(image)
+            image_features /= image_features.norm(dim=-1, keepdim=True)
         
         # First, validate if the image is fashion-related
-        validation_result = validate_fashion_image(image_path, model, preprocess, device, quiet)
+        validation_result = validate_image_tiered(image_path, model, preprocess, device,
+                                                  prescreen=PRESCREEN if prescreen is None else prescreen,
+                                                  quiet=quiet, image_features=image_features)
         
         # If the image is not fashion-related, return an empty result
         if not validation_result.get("is_fashion_related", True):
@@ -484,49 +1568,19 @@ def search_by_image(image_path, model, preprocess, index, df, image_embeddings,
         if not dominant_colors and validation_result.get("dominantColors"):
             dominant_colors = validation_result.get("dominantColors")
         
-        with torch.no_grad():
-            # Encode the image
-            image_feature = model.encode_image(image).cpu().numpy()
-            image_feature /= np.linalg.norm(image_feature)
+        image_feature = image_features.float().cpu().numpy()
         
-        # Perform search - get more results than needed for color filtering
-        distances, indices = index.search(image_feature, top_k * 3)
+        if cursor is not None:
+            cursor.start(personalize_query(image_feature, personalization), 3, dominant_colors, personalization)
+            return cursor.next_page(index, df, image_embeddings, quiet=quiet)
         
-        # Get image IDs
-        img_ids = list(image_embeddings.keys())
-        results = [img_ids[i] for i in indices[0]]
+        # Perform search - get more results than needed for color filtering
+        with span("index_search"):
+            distances, indices = index.search(personalize_query(image_feature, personalization), top_k * 3)
         
         # Get product details
-        product_results = []
-        for i, img_id in enumerate(results):
-            row = df[df['id'].astype(str) == img_id]
-            if not row.empty:
-                try:
-                    product_results.append({
-                        'id': img_id,
-                        'name': row['productDisplayName'].values[0],
-                        'category': row['masterCategory'].values[0] if 'masterCategory' in row else 'Unknown',
-                        'subCategory': row['subCategory'].values[0] if 'subCategory' in row else 'Unknown',
-                        'articleType': row['articleType'].values[0] if 'articleType' in row else 'Unknown',
-                        'baseColor': row['baseColour'].values[0] if 'baseColour' in row else 'Unknown',
-                        'gender': row['gender'].values[0] if 'gender' in row else 'Unknown',
-                        'usage': row['usage'].values[0] if 'usage' in row else 'Unknown',
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-                except Exception as e:
-                    if not quiet:
-                        print(f"Error processing product {img_id}: {str(e)}", file=sys.stderr)
-                    # Add with minimal information
-                    product_results.append({
-                        'id': img_id,
-                        'name': f"Product {img_id}",
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-            else:
-                if not quiet:
-                    print(f"No metadata found for product ID: {img_id}", file=sys.stderr)
+        product_results = build_product_results(distances[0], indices[0], df, image_embeddings, quiet)
+        product_results = personalize_results(product_results, personalization, image_embeddings)
         
         # Enrich the results with additional metadata
         product_results = enrich_product_results(product_results, dominant_colors, quiet)
@@ -541,11 +1595,15 @@ def search_by_image(image_path, model, preprocess, index, df, image_embeddings,
             print(f"Error in image search: {str(e)}", file=sys.stderr)
         return []
 
-def multimodal_search(query, image_path, model, preprocess, index, df, image_embeddings, device, top_k=5, dominant_colors=None, quiet=False):
+def multimodal_search(query, image_path, model, preprocess, index, df, image_embeddings, device, top_k=5, dominant_colors=None, quiet=False, personalization=None, fusion=None,
+                      cursor=None):
     """Search for fashion products using both text and image"""
     try:
-        # First check text-image coherence
-        coherence_result = check_text_image_coherence(query, image_path, model, preprocess, device, quiet)
+        strategy, text_weight, overfetch = fusion or multimodal_fusion({})
+        
+        # Encode each modality once; the coherence check and the fusion share the features
+        text_feature, image_feature = encode_text_and_image(query, image_path, model, preprocess, device)
+        coherence_result = coherence_from_features(text_feature, image_feature)
         
         # If text and image are not coherent, log a warning but continue with search
         if not coherence_result.get("is_coherent", True) and not quiet:
@@ -558,60 +1616,18 @@ def multimodal_search(query, image_path, model, preprocess, index, df, image_emb
             if extracted_colors:
                 dominant_colors = extracted_colors
         
-        # Encode text
-        text_token = clip.tokenize([query]).to(device)
-        with torch.no_grad():
-            text_feature = model.encode_text(text_token).cpu().numpy()
-            text_feature /= np.linalg.norm(text_feature)
-        
-        # Encode image
-        image = preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
-        with torch.no_grad():
-            image_feature = model.encode_image(image).cpu().numpy()
-            image_feature /= np.linalg.norm(image_feature)
-        
-        # Combine features
-        query_embedding = (text_feature + image_feature) / 2
-        query_embedding /= np.linalg.norm(query_embedding)
-        
-        # Perform search - get more results than needed for color filtering
-        distances, indices = index.search(query_embedding, top_k * 3)
-        
-        # Get image IDs
-        img_ids = list(image_embeddings.keys())
-        results = [img_ids[i] for i in indices[0]]
+        # Combine features (or keep both for late fusion) and search, over-fetching for colour filtering
+        text_weight = fusion_text_weight(strategy, text_weight, coherence_result["similarity"])
+        queries = fusion_queries(text_feature, image_feature, strategy, text_weight)
+        queries = np.stack([personalize_query(row, personalization) for row in queries])
+        if cursor is not None:
+            cursor.start(queries, overfetch, dominant_colors, personalization, (text_weight, 1.0 - text_weight))
+            return cursor.next_page(index, df, image_embeddings, quiet=quiet)
+        distances, indices = fused_search(index, queries, (text_weight, 1.0 - text_weight), top_k * overfetch)
         
         # Get product details
-        product_results = []
-        for i, img_id in enumerate(results):
-            row = df[df['id'].astype(str) == img_id]
-            if not row.empty:
-                try:
-                    product_results.append({
-                        'id': img_id,
-                        'name': row['productDisplayName'].values[0],
-                        'category': row['masterCategory'].values[0] if 'masterCategory' in row else 'Unknown',
-                        'subCategory': row['subCategory'].values[0] if 'subCategory' in row else 'Unknown',
-                        'articleType': row['articleType'].values[0] if 'articleType' in row else 'Unknown',
-                        'baseColor': row['baseColour'].values[0] if 'baseColour' in row else 'Unknown',
-                        'gender': row['gender'].values[0] if 'gender' in row else 'Unknown',
-                        'usage': row['usage'].values[0] if 'usage' in row else 'Unknown',
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-                except Exception as e:
-                    if not quiet:
-                        print(f"Error processing product {img_id}: {str(e)}", file=sys.stderr)
-                    # Add with minimal information
-                    product_results.append({
-                        'id': img_id,
-                        'name': f"Product {img_id}",
-                        'similarity': float(1.0 - distances[0][i]),
-                        'image': f"{img_id}.jpg"
-                    })
-            else:
-                if not quiet:
-                    print(f"No metadata found for product ID: {img_id}", file=sys.stderr)
+        product_results = build_product_results(distances, indices, df, image_embeddings, quiet)
+        product_results = personalize_results(product_results, personalization, image_embeddings)
         
         # Enrich the results with additional metadata
         product_results = enrich_product_results(product_results, dominant_colors, quiet)
@@ -642,114 +1658,222 @@ def clean_product_results(product_results, quiet=False):
         return product_results
 
 # Add this function after the existing functions
-def validate_fashion_image(image_path, model, preprocess, device, quiet=False):
+# Validation prompt features per loaded model; the prompts never change
+_validation_prompts = {}
+
+@traced("clip_encode_prompts")
+def encode_validation_prompts(model, device):
+    """Encode the fashion/non-fashion category prompts used for image validation (once per model)"""
+    key = (id(model), str(device))
+    if key in _validation_prompts:
+        return _validation_prompts[key]
+    
+    # Tokenize categories
+    text_tokens = clip.tokenize(VALIDATION_CATEGORIES).to(device)
+    
+    with torch.no_grad():
+        # Get text features for all categories
+        text_features = model.encode_text(text_tokens)
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+    
+    _validation_prompts[key] = text_features
+    return text_features
+
+@functools.lru_cache(maxsize=1)
+def load_validation_probe():
+    """Return the linear fashion probe trained by validation_probe.py, or None"""
+    if not os.path.exists(VALIDATION_PROBE_PATH):
+        return None
+    with np.load(VALIDATION_PROBE_PATH) as probe:
+        return {
+            "weights": probe["weights"].astype(np.float32),
+            "bias": float(probe["bias"]),
+            "accept": float(probe["accept"]),
+            "reject": float(probe["reject"]),
+        }
+
+def classify_fashion_features(image_features, text_features):
+    """Decide whether normalized image features look fashion-related given the prompt features"""
+    with torch.no_grad():
+        # Calculate similarity scores
+        similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
+        
+        # Get top categories and their confidence scores
+        values, indices = similarity[0].topk(10)
+    
+    # Prepare results
+    categories = []
+    for value, idx in zip(values, indices):
+        categories.append({
+            "name": VALIDATION_CATEGORIES[idx],
+            "confidence": value.item()
+        })
+    
+    # Check if any of the top 3 categories are fashion-related with sufficient confidence
+    is_fashion_related = any(
+        categories[i]["name"] in FASHION_CATEGORIES and categories[i]["confidence"] > 0.35
+        for i in range(min(3, len(categories)))
+    )
+    
+    # Special check for accessories with a lower threshold
+    is_accessory = any(
+        categories[i]["name"] in ACCESSORY_CATEGORIES and categories[i]["confidence"] > 0.2
+        for i in range(min(5, len(categories)))
+    )
+    
+    # Check if the top category is non-fashion with high confidence
+    is_definitely_non_fashion = (
+        categories[0]["name"] in NON_FASHION_CATEGORIES and 
+        categories[0]["confidence"] > 0.5
+    )
+    
+    # Stricter validation: must be fashion-related AND not definitely non-fashion
+    # OR must be an accessory
+    return {
+        "is_fashion_related": (is_fashion_related and not is_definitely_non_fashion) or is_accessory,
+        "categories": categories,
+        "is_accessory": is_accessory
+    }
+
+@traced("validate")
+def validate_fashion_image(image_path, model, preprocess, device, quiet=False, image_features=None):
     """Validate if an image is fashion-related with stricter detection for external images"""
     try:
         # Extract dominant colors from the image
         dominant_colors = extract_dominant_colors(image_path)
         
-        # Load and preprocess image
-        image = preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
-        
-        # Define fashion-related categories (focused list)
-        fashion_categories = [
-            "clothing", "fashion", "apparel", "wear", "dress", "shirt", "pants", 
-            "jeans", "t-shirt", "jacket", "coat", "sweater", "skirt", "blouse", 
-            "suit", "tie", "scarf", "hat", "cap", "shoes", "boots", "sneakers", 
-            "heels", "sandals", "accessories", "jewelry", "watch", "bag", "purse", 
-            "handbag", "backpack", "sunglasses", "glasses", "belt", "wallet"
-        ]
-        
-        # Define accessory-specific categories with lower threshold
-        accessory_categories = [
-            "bag", "purse", "handbag", "backpack", "wallet", "accessories", 
-            "watch", "jewelry", "belt", "sunglasses", "glasses"
-        ]
-        
-        # Define non-fashion categories
-        non_fashion_categories = [
-            "car", "vehicle", "landscape", "building", "food", "animal", "pet", 
-            "plant", "tree", "flower", "technology", "device", "furniture", 
-            "scenery", "nature", "mountain", "beach", "ocean", "river", "lake", 
-            "sky", "cloud", "road", "street", "city", "house", "apartment", 
-            "office", "restaurant", "cafe", "park", "garden", "forest", "desert",
-            "logo", "symbol", "icon", "sign", "text", "diagram", "chart", "graph",
-            "abstract", "pattern", "texture", "background", "wallpaper"
-        ]
-        
-        # Combine all categories for classification
-        all_categories = fashion_categories + non_fashion_categories
-        
-        # Tokenize categories
-        text_tokens = clip.tokenize(all_categories).to(device)
-        
-        with torch.no_grad():
-            # Get image features
-            image_features = model.encode_image(image)
+        # Features from the pre-screen are reused rather than encoded again
+        if image_features is None:
+            # Load and preprocess image
+            with span("image_decode"):
+                image = preprocess(open_image(image_path)).unsqueeze(0).to(device)
             
-            # Get text features for all categories
-            text_features = model.encode_text(text_tokens)
-            
-            # Normalize features
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            
-            # Calculate similarity scores
-            similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-            
-            # Get top categories and their confidence scores
-            values, indices = similarity[0].topk(10)
-            
-            # Prepare results
-            categories = []
-            for i, (value, idx) in enumerate(zip(values, indices)):
-                category_name = all_categories[idx]
-                confidence = value.item()
-                categories.append({
-                    "name": category_name,
-                    "confidence": confidence
-                })
-            
-            # Check if any of the top 3 categories are fashion-related with sufficient confidence
-            is_fashion_related = any(
-                categories[i]["name"] in fashion_categories and categories[i]["confidence"] > 0.35
-                for i in range(min(3, len(categories)))
-            )
-            
-            # Special check for accessories with a lower threshold
-            is_accessory = any(
-                categories[i]["name"] in accessory_categories and categories[i]["confidence"] > 0.2
-                for i in range(min(5, len(categories)))
-            )
-            
-            # Check if the top category is non-fashion with high confidence
-            is_definitely_non_fashion = (
-                categories[0]["name"] in non_fashion_categories and 
-                categories[0]["confidence"] > 0.5
-            )
-            
-            # Stricter validation: must be fashion-related AND not definitely non-fashion
-            # OR must be an accessory
-            return {
-                "is_fashion_related": (is_fashion_related and not is_definitely_non_fashion) or is_accessory,
-                "categories": categories,
-                "dominantColors": dominant_colors,
-                "is_accessory": is_accessory
-            }
+            with torch.no_grad():
+                # Get image features
+                with span("clip_encode_image"):
+                    image_features = model.encode_image(image)
+                image_features /= image_features.norm(dim=-1, keepdim=True)
+        
+        result = classify_fashion_features(image_features, encode_validation_prompts(model, device))
+        
+        return {
+            "is_fashion_related": result["is_fashion_related"],
+            "categories": result["categories"],
+            "dominantColors": dominant_colors,
+            "is_accessory": result["is_accessory"]
+        }
     except Exception as e:
         if not quiet:
             print(f"Error validating image: {str(e)}", file=sys.stderr)
         return {"is_fashion_related": False, "categories": []}
 
+@traced("prescreen")
+def prescreen_fashion_image(image_path, model, preprocess, device):
+    """Cheap validation tier: return (verdict dict, normalized image features), from a draft decode for files"""
+    started = time.perf_counter()
+    with span("image_decode"):
+        if isinstance(image_path, Image.Image):
+            image = open_image(image_path)
+        else:
+            image = Image.open(image_path)
+            # JPEGs decode straight to a 1/2-1/8 scale no smaller than the model input
+            image.draft("RGB", (PRESCREEN_SIZE, PRESCREEN_SIZE))
+            image = image.convert("RGB")
+        image = preprocess(image).unsqueeze(0).to(device)
+    
+    with torch.no_grad():
+        with span("clip_encode_image"):
+            image_features = model.encode_image(image)
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+    
+    screened = prescreen_features(image_features, model, device)
+    screened["elapsed_ms"] = (time.perf_counter() - started) * 1000.0
+    return screened, image_features
+
+def prescreen_features(image_features, model, device):
+    """The cheap tier's verdict dict for normalized image features that are already encoded"""
+    started = time.perf_counter()
+    with torch.no_grad():
+        probe = load_validation_probe()
+        if probe is not None and len(probe["weights"]) == image_features.shape[-1]:
+            logit = float(image_features[0].float().cpu().numpy() @ probe["weights"]) + probe["bias"]
+            score = 1.0 / (1.0 + np.exp(-logit))
+            accept, reject, source = probe["accept"], probe["reject"], "probe"
+        else:
+            # Share of the prompt softmax that lands on fashion categories (listed first)
+            similarity = (100.0 * image_features @ encode_validation_prompts(model, device).T).softmax(dim=-1)
+            score = similarity[0, :len(FASHION_CATEGORIES)].sum().item()
+            accept, reject, source = PRESCREEN_ACCEPT, PRESCREEN_REJECT, "prompts"
+    
+    if score >= accept:
+        verdict = "accept"
+    elif score <= reject:
+        verdict = "reject"
+    else:
+        verdict = "ambiguous"
+    
+    return {
+        "verdict": verdict,
+        "score": float(score),
+        "accept": accept,
+        "reject": reject,
+        "source": source,
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0
+    }
+
+def validate_image_tiered(image_path, model, preprocess, device, rotation_check=False, prescreen=True, quiet=False,
+                          image_features=None):
+    """Validate an upload, running the full category rules and rotation sweep only when the cheap tier can't decide
+    
+    Callers that have already encoded the image pass its normalized `image_features`; the
+    pre-screen then scores those instead of decoding and encoding the image itself.
+    """
+    screened, screen_features = None, image_features
+    if prescreen:
+        try:
+            if image_features is None:
+                screened, screen_features = prescreen_fashion_image(image_path, model, preprocess, device)
+                # A file is screened from a draft decode; the full tier re-encodes it at full resolution
+                if isinstance(image_path, Image.Image):
+                    image_features = screen_features
+            else:
+                with span("prescreen"):
+                    screened = prescreen_features(image_features, model, device)
+        except Exception as e:
+            if not quiet:
+                print(f"Error pre-screening image: {str(e)}", file=sys.stderr)
+    
+    if screened is not None and screened["verdict"] != "ambiguous":
+        # Categories come from the features we already have; the verdict from the screen
+        validation_result = classify_fashion_features(screen_features, encode_validation_prompts(model, device))
+        validation_result["is_fashion_related"] = screened["verdict"] == "accept"
+        validation_result["dominantColors"] = extract_dominant_colors(image_path)
+        validation_result["tier"] = "fast"
+        validation_result["prescreen"] = screened
+        return validation_result
+    
+    validation_result = validate_fashion_image(image_path, model, preprocess, device, quiet, image_features)
+    validation_result["tier"] = "full"
+    if screened is not None:
+        validation_result["prescreen"] = screened
+    
+    # Check if rotation check is enabled and the image is not already valid
+    if rotation_check and not validation_result.get("is_fashion_related", False):
+        rotated_validation = validate_rotated_fashion_image(image_path, model, preprocess, device, quiet)
+        if rotated_validation:
+            validation_result["rotatedValidation"] = rotated_validation
+    
+    return validation_result
+
 # Add this new function after the validate_fashion_image function
+@traced("rotation_check")
 def validate_rotated_fashion_image(image_path, model, preprocess, device, quiet=False):
   """Try different rotations of the image to see if any are fashion-related"""
   try:
       import copy
-      from PIL import Image, ImageOps
 
       # Load the original image
-      original_img = Image.open(image_path).convert("RGB")
+      original_img = open_image(image_path)
       
       # Create rotations of the image
       rotations = [
@@ -775,13 +1899,9 @@ def validate_rotated_fashion_image(image_path, model, preprocess, device, quiet=
       
       # Test each rotation
       for rotation_name, rotated_img in rotations:
-          # Save rotated image to temp file
-          temp_path = image_path + f"_rotated_{rotation_name}.jpg"
-          rotated_img.save(temp_path)
-          
           try:
-              # Validate the rotated image
-              result = validate_fashion_image(temp_path, model, preprocess, device, quiet=True)
+              # Validate the rotated image in memory
+              result = validate_fashion_image(rotated_img, model, preprocess, device, quiet=True)
               
               # Check if it's fashion-related and has higher confidence
               if result.get("is_fashion_related", False):
@@ -800,7 +1920,7 @@ def validate_rotated_fashion_image(image_path, model, preprocess, device, quiet=
                       
                       # Extract dominant colors from the rotated image
                       if best_result.get("dominantColors") is None:
-                          best_result["dominantColors"] = extract_dominant_colors(temp_path)
+                          best_result["dominantColors"] = extract_dominant_colors(rotated_img)
               
               # Special check for accessories even if not classified as fashion-related
               if not result.get("is_fashion_related", False):
@@ -816,14 +1936,10 @@ def validate_rotated_fashion_image(image_path, model, preprocess, device, quiet=
                               
                               # Extract dominant colors from the rotated image
                               if best_result.get("dominantColors") is None:
-                                  best_result["dominantColors"] = extract_dominant_colors(temp_path)
+                                  best_result["dominantColors"] = extract_dominant_colors(rotated_img)
           except Exception as e:
               if not quiet:
                   print(f"Error validating rotated image ({rotation_name}): {e}", file=sys.stderr)
-          finally:
-              # Clean up the temp file
-              if os.path.exists(temp_path):
-                  os.remove(temp_path)
       
       return best_result
   except Exception as e:
@@ -831,134 +1947,1011 @@ def validate_rotated_fashion_image(image_path, model, preprocess, device, quiet=
           print(f"Error validating rotated images: {e}", file=sys.stderr)
       return None
 
+def encode_text_and_image(query, image_path, model, preprocess, device):
+    """Encode a query's text and image once each; returns unit (1, d) float32 arrays"""
+    with span("image_decode"):
+        image = preprocess(open_image(image_path)).unsqueeze(0).to(device)
+    text_token = clip.tokenize([query]).to(device)
+    
+    with torch.no_grad():
+        with span("clip_encode_image"):
+            image_feature = model.encode_image(image).float().cpu().numpy()
+        with span("clip_encode_text"):
+            text_feature = model.encode_text(text_token).float().cpu().numpy()
+    text_feature /= np.linalg.norm(text_feature)
+    image_feature /= np.linalg.norm(image_feature)
+    return text_feature, image_feature
+
+def coherence_from_features(text_feature, image_feature):
+    """Text-image coherence from already encoded, normalized features"""
+    similarity = float(np.dot(np.ravel(text_feature), np.ravel(image_feature)))
+    return {
+        "is_coherent": similarity >= COHERENCE_THRESHOLD,
+        "similarity": similarity
+    }
+
 # Add a new function to check text-image coherence
+@traced("coherence")
 def check_text_image_coherence(query, image_path, model, preprocess, device, quiet=False):
     """Check if the text query and image are coherent"""
     try:
-        # Load and preprocess image
-        image = preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
+        return coherence_from_features(*encode_text_and_image(query, image_path, model, preprocess, device))
+    except Exception as e:
+        if not quiet:
+            print(f"Error checking text-image coherence: {str(e)}", file=sys.stderr)
+        return {"is_coherent": True, "similarity": 1.0}
+
+def request_from_args(args):
+    """Build a search request dict from command line arguments"""
+    # `--image-path -` pipes the upload in instead of writing it to a temp file
+    image_bytes = None
+    if args.image_path == "-":
+        image_bytes = sys.stdin.buffer.read(MAX_IMAGE_BYTES + 1)
+    return {
+        "search_type": args.search_type,
+        "query": args.query,
+        "image_path": None if image_bytes is not None else args.image_path,
+        "image_bytes": image_bytes,
+        "product_id": args.product_id,
+        "weights": args.weights,
+        "user_id": args.user_id,
+        "personalization": args.personalization,
+        "personalization_weight": args.personalization_weight,
+        "facets": args.facets,
+        "facet_k": args.facet_k,
+        "fusion": args.fusion,
+        "text_weight": args.text_weight,
+        "overfetch": args.overfetch,
+        "top_k": args.top_k,
+        "dominant_colors": args.dominant_colors,
+        "color_detection": args.color_detection,
+        "rotation_check": args.rotation_check,
+        "prescreen": not args.no_prescreen,
+        "timings": args.timings
+    }
+
+def read_shared_memory(name, size=None):
+    """Copy an image out of a shared-memory segment the client created (and will unlink)"""
+    from multiprocessing import shared_memory
+    try:
+        segment = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment for cleanup at exit; we don't own it
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+    try:
+        size = segment.size if size is None else int(size)
+        if size > min(segment.size, MAX_IMAGE_BYTES):
+            raise ValueError(f"Shared-memory image is larger than {MAX_IMAGE_BYTES} bytes")
+        return bytes(segment.buf[:size])
+    finally:
+        segment.close()
+
+def request_image_data(request):
+    """Return the request's uploaded image bytes (raw, base64 or shared memory), or None"""
+    data = request.get("image_bytes")
+    if data is None and request.get("image_base64"):
+        encoded = request["image_base64"]
+        # Browsers send data URLs
+        if encoded.startswith("data:"):
+            encoded = encoded.partition(",")[2]
+        if len(encoded) // 4 * 3 > MAX_IMAGE_BYTES + 2:
+            raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except ValueError as e:
+            raise ValueError(f"Invalid base64 image: {e}")
+    elif data is None and request.get("image_shm"):
+        data = read_shared_memory(request["image_shm"], request.get("image_size"))
+    if data is not None and len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return data
+
+def load_query_image(request):
+    """Decode the request's query image once, from memory for uploads; None if it has no image"""
+    data = request_image_data(request)
+    source = io.BytesIO(data) if data is not None else request.get("image_path")
+    if source is None:
+        return None
+    with span("image_decode"):
+        image = Image.open(source)
+        # The header is read lazily, so oversized images are refused before any pixel is decoded
+        width, height = image.size
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValueError(f"Image is {width}x{height}, over the {MAX_IMAGE_PIXELS} pixel limit")
+        return image.convert("RGB")
+
+def parse_list(value):
+    """Accept a list or a comma-separated string (CLI style) for multi-valued request fields"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def request_prescreen(request):
+    """Whether an image request's validation may be decided by the cheap pre-screen"""
+    prescreen = request.get("prescreen")
+    return PRESCREEN if prescreen is None else bool(prescreen)
+
+def product_ids(request):
+    return [str(product_id) for product_id in parse_list(request.get("product_id"))]
+
+def validate_request(request):
+    """Raise ValueError if a search request is missing required fields"""
+    # Later pages only name the cursor (and optionally a different page size)
+    if request.get("cursor") is not None:
+        if not isinstance(request["cursor"], str):
+            raise ValueError("cursor must be the token returned with the previous page")
+        return
+    search_type = request.get("search_type")
+    query = request.get("query")
+    # A path on disk, or an upload as bytes, base64 or a shared-memory segment
+    has_image = any(request.get(field) for field in IMAGE_SOURCE_FIELDS)
+    
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"Unknown search type: {search_type}")
+    if search_type == "validate" and not has_image:
+        raise ValueError("Image validation requires an image")
+    if search_type == "coherence" and (not has_image or not query):
+        raise ValueError("Coherence check requires both an image and a query")
+    if search_type == "text" and not query:
+        raise ValueError("Text search requires a query")
+    if search_type == "image" and not has_image:
+        raise ValueError("Image search requires an image")
+    if search_type == "multimodal" and (not query or not has_image):
+        raise ValueError("Multimodal search requires both a query and an image")
+    if search_type == "multimodal":
+        multimodal_fusion(request)
+    request_facets(request)
+    if request.get("paginate") and search_type not in PAGINATED_SEARCH_TYPES:
+        raise ValueError(f"Pagination is only available for {', '.join(PAGINATED_SEARCH_TYPES)} searches")
+    if search_type == "similar" and (not request.get("product_id") or len(product_ids(request)) != 1):
+        raise ValueError("Similar items search requires a product id")
+    if search_type == "product":
+        if not product_ids(request):
+            raise ValueError("Product search requires one or more product ids")
+        weights = request.get("weights")
+        if weights is not None and len(parse_list(weights)) != len(product_ids(request)):
+            raise ValueError("Product search needs one weight per product id")
+
+@functools.lru_cache(maxsize=1)
+def catalogue_rows():
+    """Catalogue ids in image_ids.npy order, and the row of each id"""
+    ids = np.load(IMAGE_IDS_PATH).tolist()
+    return ids, {str(img_id): row for row, img_id in enumerate(ids)}
+
+@functools.lru_cache(maxsize=1)
+def load_similar_table():
+    """Memory-map the precomputed neighbour table and index its rows by product id"""
+    ids, row_of = catalogue_rows()
+    neighbors = np.load(SIMILAR_NEIGHBORS_PATH, mmap_mode='r')
+    scores = np.load(SIMILAR_SCORES_PATH, mmap_mode='r')
+    return ids, row_of, neighbors, scores
+
+@functools.lru_cache(maxsize=1)
+def catalogue_matrix():
+    """Memory-map image_matrix.npy (rows in image_ids.npy order), or None if there is none"""
+    return np.load(IMAGE_MATRIX_PATH, mmap_mode='r') if os.path.exists(IMAGE_MATRIX_PATH) else None
+
+def stored_embedding(product_id, image_embeddings):
+    """Return a catalogue item's stored, normalized image embedding from a model's embeddings
+    
+    Without `image_embeddings` (outside a search, e.g. user_profiles.py) CLIP_MODEL's live matrix is read.
+    """
+    if image_embeddings is not None:
+        vector = image_embeddings.get(str(product_id))
+    else:
+        _, row_of = catalogue_rows()
+        row = row_of.get(str(product_id))
+        matrix = catalogue_matrix()
+        vector = None if row is None or matrix is None else matrix[row]
+    if vector is None:
+        raise ValueError(f"Unknown product id: {product_id}")
+    return np.asarray(vector, dtype=np.float32)
+
+def search_by_products(product_ids, weights, index, df, image_embeddings, top_k=5, quiet=False, personalization=None,
+                       cursor=None):
+    """Search with the (weighted) mean of catalogue items' stored embeddings, e.g. a wishlist or outfit"""
+    vectors = np.stack([stored_embedding(product_id, image_embeddings) for product_id in product_ids])
+    weights = np.ones(len(vectors), dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+    query_embedding = (weights[:, None] * vectors).sum(axis=0, keepdims=True)
+    norm = np.linalg.norm(query_embedding)
+    if norm == 0:
+        raise ValueError("Product weights cancel out")
+    query_embedding /= norm
+    
+    if cursor is not None:
+        cursor.start(personalize_query(query_embedding, personalization), 2, None, personalization,
+                     exclude=product_ids)
+        return cursor.next_page(index, df, image_embeddings, quiet=quiet)
+    
+    # Over-fetch for enrichment, plus room for the query items themselves
+    with span("index_search"):
+        distances, indices = index.search(personalize_query(query_embedding, personalization),
+                                          top_k * 2 + len(product_ids))
+    
+    product_results = build_product_results(distances[0], indices[0], df, image_embeddings, quiet)
+    product_results = personalize_results(product_results, personalization, image_embeddings)
+    exclude = set(product_ids)
+    product_results = [product for product in product_results if product['id'] not in exclude]
+    product_results = enrich_product_results(product_results, None, quiet)
+    return product_results[:top_k]
+
+@traced("similar_lookup")
+def similar_items(product_id, df, top_k=5, quiet=False):
+    """Return a product's precomputed nearest catalogue items by direct lookup"""
+    if not os.path.exists(SIMILAR_NEIGHBORS_PATH):
+        raise ValueError("No similar items table; run similar_items.py first")
+    ids, row_of, neighbors, scores = load_similar_table()
+    row = row_of.get(str(product_id))
+    if row is None:
+        raise ValueError(f"Unknown product id: {product_id}")
+    
+    positions = np.asarray(neighbors[row][:top_k])
+    similarities = np.asarray(scores[row][:top_k], dtype=np.float32)
+    # Padding is -1; tables written before its score was 0 carry -inf there
+    valid = (positions >= 0) & np.isfinite(similarities)
+    
+    # Hydrate only the neighbours, as positions 0..n-1 of a tiny id list
+    neighbour_ids = dict.fromkeys(ids[p] for p in positions[valid])
+    product_results = build_product_results(1.0 - similarities[valid], np.arange(valid.sum()), df, neighbour_ids, quiet)
+    return enrich_product_results(product_results, None, quiet)
+
+def handle_request(request, model, preprocess, index, df, image_embeddings, device, quiet=False):
+    """Run a single search request, adding a timings block when it asks for one"""
+    # An enclosing trace (e.g. the CLI's, which also covers model load) reports for itself
+    if not request.get("timings") or _active_trace.get() is not None:
+        return dispatch_request(request, model, preprocess, index, df, image_embeddings, device, quiet)
+    
+    with tracing() as trace:
+        output = dispatch_request(request, model, preprocess, index, df, image_embeddings, device, quiet)
+    output["timings"] = trace.timings_ms()
+    return output
+
+def dispatch_request(request, model, preprocess, index, df, image_embeddings, device, quiet=False):
+    """Run a single search request against loaded models and return the JSON output dict"""
+    validate_request(request)
+    if request.get("cursor") is not None:
+        return cursor_page(request, index, df, image_embeddings, quiet)
+    search_type = request["search_type"]
+    query = request.get("query")
+    top_k = int(request.get("top_k") or 5)
+    
+    # Decode the query image once; everything below works on the in-memory image
+    image = None
+    if search_type in ("validate", "coherence", "image", "multimodal"):
+        image = load_query_image(request)
+    
+    # Special case for validation
+    if search_type == "validate":
+        validation_result = validate_image_tiered(image, model, preprocess, device,
+                                                  request.get("rotation_check"), request_prescreen(request), quiet)
+        
+        # Extract colors if requested
+        if request.get("color_detection"):
+            validation_result["dominantColors"] = extract_dominant_colors(image)
+        
+        return {"validation": validation_result}
+    
+    # Precomputed neighbours: no encoding or index search
+    if search_type == "similar":
+        results = similar_items(product_ids(request)[0], df, top_k, quiet)
+        return {"results": clean_product_results(results, quiet)}
+    
+    # Facet counts ride along on the index search, which fetches facet_k candidates for them
+    faceted = None
+    facet_request = request_facets(request)
+    if facet_request is not None:
+        columns, facet_k = facet_request
+        index = faceted = FacetedIndex(index, facet_index(df, image_embeddings), facet_k, columns)
+    
+    # Paginated searches hand their query to a cursor, which serves this page and the later ones
+    cursor = request_cursor(request)
+    
+    # Stored catalogue embeddings as the query: no encoding
+    if search_type == "product":
+        weights = request.get("weights")
+        weights = [float(weight) for weight in parse_list(weights)] if weights is not None else None
+        results = search_by_products(product_ids(request), weights, index, df, image_embeddings, top_k, quiet,
+                                     user_personalization(request), cursor)
+        output = with_facets({"results": clean_product_results(results, quiet)}, faceted)
+        return with_cursor(output, cursor) if cursor is not None else output
+    
+    # Special case for coherence check
+    if search_type == "coherence":
+        coherence_result = check_text_image_coherence(query, image, model, preprocess, device, quiet)
+        return {"coherence": coherence_result}
+    
+    # Parse dominant colors if provided
+    dominant_colors = request.get("dominant_colors")
+    if isinstance(dominant_colors, str):
+        dominant_colors = dominant_colors.split(',')
+    
+    # Perform search based on type
+    results = []
+    personalization = user_personalization(request)
+    if search_type == "text":
+        results = search_by_text(query, model, index, df, image_embeddings, device, top_k, quiet, personalization,
+                                 cursor)
+    
+    elif search_type == "image":
+        results = search_by_image(image, model, preprocess, index, df, image_embeddings, device, top_k, dominant_colors, quiet, personalization,
+                                  cursor, request_prescreen(request))
+    
+    elif search_type == "multimodal":
+        results = multimodal_search(query, image, model, preprocess, index, df, image_embeddings, device, top_k,
+                                    dominant_colors, quiet, personalization, multimodal_fusion(request), cursor)
+    
+    # Clean the results to ensure they are JSON serializable
+    results = clean_product_results(results, quiet)
+    
+    output = with_facets({"results": results}, faceted)
+    return with_cursor(output, cursor) if cursor is not None else output
+
+def with_facets(output, faceted):
+    """Add the facets block to a search output, unless the search was refused before reaching the index"""
+    if faceted is not None and faceted.counts is not None:
+        output["facets"] = faceted.counts
+    return output
+
+class SearchCursor:
+    """A paginated search: its query vectors and a ranked buffer of the candidates not yet returned
+    
+    Each page hydrates and enriches the first page_size * overfetch buffered candidates, as an
+    unpaginated search does with its over-fetched results, returns the best page_size of them
+    and keeps the rest at the front of the buffer. When the buffer runs short it is refilled by
+    searching the cached query with twice the k, so later pages never run the model.
+    """
+    
+    def __init__(self, page_size, model=None):
+        self.page_size = page_size
+        self.model = model
+        self.query_rows = None
+        self.pages = 0
+        self.returned = set()
+        self._reset_buffer()
+    
+    def _reset_buffer(self):
+        self.catalogue = None
+        self.k = 0
+        self.complete = False
+        self.seen = set()
+        # (distance, index position, id), best first
+        self.pending = []
+    
+    def start(self, query_rows, overfetch, dominant_colors=None, personalization=None, weights=None, exclude=()):
+        """Set the search this cursor pages through: one query row, or late fusion's two with weights"""
+        self.query_rows = np.array(query_rows, dtype=np.float32).reshape(-1, np.shape(query_rows)[-1])
+        self.overfetch = overfetch
+        self.dominant_colors = dominant_colors
+        self.personalization = personalization
+        self.weights = weights
+        self.exclude = set(exclude)
+    
+    @property
+    def exhausted(self):
+        return self.query_rows is None or (self.complete and not self.pending)
+    
+    def add_candidates(self, distances, indices, k, image_embeddings, ntotal):
+        """Buffer the new candidates of one ranked (distances, indices) row from a top-k search"""
+        img_ids = list(image_embeddings.keys())
+        found = 0
+        for distance, position in zip(distances, indices):
+            if position < 0:
+                continue
+            found += 1
+            if position in self.seen:
+                continue
+            self.seen.add(position)
+            img_id = img_ids[position]
+            if img_id not in self.returned and img_id not in self.exclude:
+                self.pending.append((float(distance), int(position), img_id))
+        self.k = max(self.k, k)
+        self.complete = found < k or k >= ntotal
+    
+    def extend(self, index, k, image_embeddings):
+        """Search the cached query for its top k and buffer what is new"""
+        with span("index_search"):
+            distances, indices = index.search(self.query_rows, k)
+        if len(self.query_rows) > 1:
+            distances, indices = merge_ranked_lists(distances, indices, self.weights, k)
+        else:
+            distances, indices = distances[0], indices[0]
+        self.add_candidates(distances, indices, k, image_embeddings, index.ntotal)
+    
+    def next_page(self, index, df, image_embeddings, page_size=None, quiet=False):
+        """Return the next page of results, searching further only when the buffer is short"""
+        page_size = page_size or self.page_size
+        window = page_size * self.overfetch
+        # A reloaded artifact version renumbers the index: search it afresh, skipping what was shown
+        if self.catalogue is not None and self.catalogue() is not df:
+            self._reset_buffer()
+        self.catalogue = weakref.ref(df)
+        while len(self.pending) < window and not self.complete:
+            # The first search fetches what an unpaginated one would; each refill doubles it
+            k = max(2 * self.k, len(self.returned) + len(self.exclude) + window)
+            self.extend(index, min(k, index.ntotal), image_embeddings)
+        
+        candidates = self.pending[:window]
+        distances = np.array([candidate[0] for candidate in candidates], dtype=np.float32)
+        positions = np.array([candidate[1] for candidate in candidates], dtype=np.int64)
+        product_results = build_product_results(distances, positions, df, image_embeddings, quiet)
+        product_results = personalize_results(product_results, self.personalization, image_embeddings)
+        product_results = enrich_product_results(product_results, self.dominant_colors, quiet)
+        product_results = clean_product_results(product_results, quiet)
+        page = product_results[:page_size]
+        
+        # Hydrated candidates that didn't make this page stay first in line for the next one
+        shown = {product['id'] for product in page}
+        hydrated = {product['id'] for product in product_results}
+        self.returned.update(shown)
+        self.pending = [candidate for candidate in candidates
+                        if candidate[2] in hydrated and candidate[2] not in shown] + self.pending[window:]
+        self.pages += 1
+        return page
+
+class CursorStore:
+    """Search cursors by token, each dropped `ttl` seconds after its last page or when `capacity` is exceeded"""
+    
+    def __init__(self, ttl=CURSOR_TTL, capacity=CURSOR_CAPACITY):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._cursors)
+    
+    def __contains__(self, token):
+        with self._lock:
+            self._expire(time.monotonic())
+            return token in self._cursors
+    
+    def _expire(self, now):
+        # Least recently used first, so expiry stops at the first live cursor
+        while self._cursors and now - next(iter(self._cursors.values()))[1] >= self.ttl:
+            self._cursors.popitem(last=False)
+    
+    def put(self, cursor):
+        token = secrets.token_urlsafe(12)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._cursors[token] = (cursor, now)
+            while len(self._cursors) > self.capacity:
+                self._cursors.popitem(last=False)
+        return token
+    
+    def get(self, token):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._cursors.get(token)
+            if entry is None:
+                raise ValueError("Unknown or expired cursor")
+            self._cursors[token] = (entry[0], now)
+            self._cursors.move_to_end(token)
+        return entry[0]
+    
+    def discard(self, token):
+        with self._lock:
+            self._cursors.pop(token, None)
+
+@functools.lru_cache(maxsize=1)
+def cursor_store():
+    """The process's paginated searches"""
+    return CursorStore()
+
+def request_cursor(request):
+    """A fresh SearchCursor when a request asks for pagination, else None"""
+    if not request.get("paginate") or request.get("search_type") not in PAGINATED_SEARCH_TYPES:
+        return None
+    return SearchCursor(int(request.get("top_k") or 5), request_model(request))
+
+def with_cursor(output, cursor, token=None):
+    """Add the page number and the token for the next page (None after the last page) to a search output"""
+    if cursor.exhausted:
+        if token is not None:
+            cursor_store().discard(token)
+        token = None
+    elif token is None:
+        token = cursor_store().put(cursor)
+    output["page"] = max(1, cursor.pages)
+    output["cursor"] = token
+    return output
+
+def request_model(request):
+    """Name of the extra model a request is for, or None for CLIP_MODEL; later pages follow their first"""
+    name = request.get("model")
+    if request.get("cursor") is not None:
+        try:
+            name = cursor_store().get(request["cursor"]).model
+        except ValueError:
+            # Unknown cursors are reported when the request is run
+            name = None
+    return None if name in (None, "", CLIP_MODEL) else str(name)
+
+def route_request(request, search_args, models):
+    """Return (request, search args) for the model a request asks for, from CLIP_MODEL's and the extra `models`"""
+    name = request_model(request)
+    if name is None:
+        return request, search_args
+    if name not in models:
+        raise ValueError(f"Model {name} is not loaded; available: {', '.join([CLIP_MODEL] + list(models))}")
+    if request.get("search_type") == "similar":
+        raise ValueError(f"Similar items are only precomputed for {CLIP_MODEL}")
+    # User profiles and the pre-screen probe live in CLIP_MODEL's embedding space
+    return dict(request, personalization="off", prescreen=False), models[name]
+
+def cursor_page(request, index, df, image_embeddings, quiet=False):
+    """Serve the next page of a paginated search from its cursor, without encoding anything"""
+    token = request["cursor"]
+    cursor = cursor_store().get(token)
+    page_size = int(request.get("top_k") or cursor.page_size)
+    results = cursor.next_page(index, df, image_embeddings, page_size, quiet)
+    return with_cursor({"results": results}, cursor, token)
+
+def search_batch(requests, model, preprocess, index, df, image_embeddings, device, quiet=False, prepared=None):
+    """Run several search requests with one encode per modality and a single index.search call
+    
+    `prepared` optionally holds, per request, an already preprocessed "image_tensor" and/or
+    extracted "dominant_colors" so callers can decode images elsewhere (e.g. a process pool).
+    """
+    prepared = prepared or [None] * len(requests)
+    # Output dict by request position, filled as each request is answered
+    outputs = {}
+    text_positions = []
+    text_tokens = []
+    image_positions = []
+    image_tensors = []
+    images = {}
+    
+    for pos, request in enumerate(requests):
+        try:
+            validate_request(request)
+        except Exception as e:
+            outputs[pos] = {"error": str(e)}
+            continue
         
-        # Tokenize text query
-        text_token = clip.tokenize([query]).to(device)
+        search_type = request.get("search_type")
         
-        with torch.no_grad():
-            # Encode the image and text
-            image_features = model.encode_image(image)
-            text_features = model.encode_text(text_token)
+        # Validation and coherence checks aren't retrievals, and later pages come from their
+        # cursor without encoding, so run them on their own
+        if request.get("cursor") is not None or search_type not in ("text", "image", "multimodal"):
+            try:
+                outputs[pos] = dispatch_request(request, model, preprocess, index, df, image_embeddings, device, quiet)
+            except Exception as e:
+                outputs[pos] = {"error": str(e)}
+            continue
+        
+        if search_type == "text" and is_non_fashion_query(request["query"]):
+            if not quiet:
+                print("Warning: Your query contains non-fashion-related terms. Please search for fashion-related products.", file=sys.stderr)
+            outputs[pos] = {"results": []}
+            continue
+        
+        # Tokenize and preprocess per request so one bad input doesn't fail the whole batch
+        try:
+            image_tensor = None
+            text_token = None
+            if search_type in ("image", "multimodal"):
+                image_tensor = (prepared[pos] or {}).get("image_tensor")
+                if image_tensor is None:
+                    images[pos] = load_query_image(request)
+                    image_tensor = preprocess(images[pos])
+            if search_type in ("text", "multimodal"):
+                text_token = clip.tokenize([request["query"]])
+        except Exception as e:
+            if not quiet:
+                print(f"Error preparing {search_type} search: {str(e)}", file=sys.stderr)
+            outputs[pos] = {"results": []}
+            continue
+        
+        if image_tensor is not None:
+            image_positions.append(pos)
+            image_tensors.append(image_tensor)
+        if text_token is not None:
+            text_positions.append(pos)
+            text_tokens.append(text_token)
+    
+    # One forward pass per modality for the whole batch
+    text_features = {}
+    image_features = {}
+    with torch.no_grad():
+        if text_positions:
+            with span("clip_encode_text"):
+                features = model.encode_text(torch.cat(text_tokens).to(device))
+            features /= features.norm(dim=-1, keepdim=True)
+            text_features = dict(zip(text_positions, features))
+        if image_positions:
+            with span("clip_encode_image"):
+                features = model.encode_image(torch.stack(image_tensors).to(device))
+            features /= features.norm(dim=-1, keepdim=True)
+            image_features = dict(zip(image_positions, features))
+            prompt_features = encode_validation_prompts(model, device)
+    
+    # Build one query vector per request
+    queries = []
+    for pos in sorted(set(text_positions) | set(image_positions)):
+        request = requests[pos]
+        search_type = request["search_type"]
+        top_k = int(request.get("top_k") or 5)
+        dominant_colors = request.get("dominant_colors")
+        if isinstance(dominant_colors, str):
+            dominant_colors = dominant_colors.split(',')
+        
+        if search_type == "text":
+            # Colour hints come from the query text; get more results for filtering
+            queries.append((pos, text_features[pos].cpu().numpy()[None, :], None, top_k * 2, top_k,
+                            normalize_query(request["query"])["colors"] or None))
+            continue
+        
+        if search_type == "image":
+            # Validation reuses the image features we already have: the pre-screen first, the
+            # category rules only when it can't decide
+            screened = None
+            if request_prescreen(request):
+                with span("prescreen"):
+                    screened = prescreen_features(image_features[pos].unsqueeze(0), model, device)
+            if screened is not None and screened["verdict"] != "ambiguous":
+                is_fashion_related = screened["verdict"] == "accept"
+            else:
+                is_fashion_related = classify_fashion_features(image_features[pos].unsqueeze(0),
+                                                               prompt_features)["is_fashion_related"]
+            if not is_fashion_related:
+                if not quiet:
+                    print("Warning: The uploaded image does not appear to be fashion-related.", file=sys.stderr)
+                outputs[pos] = {"results": []}
+                continue
+            query_rows, weights, fetch_k = image_features[pos].cpu().numpy()[None, :], None, top_k * 3
+        else:
+            similarity = float(image_features[pos] @ text_features[pos])
+            if similarity < COHERENCE_THRESHOLD and not quiet:
+                print(f"Warning: Text query and image may not be coherent. Similarity: {similarity}", file=sys.stderr)
+            strategy, text_weight, overfetch = multimodal_fusion(request)
+            text_weight = fusion_text_weight(strategy, text_weight, similarity)
+            query_rows = fusion_queries(text_features[pos].cpu().numpy(), image_features[pos].cpu().numpy(),
+                                        strategy, text_weight)
+            weights, fetch_k = (text_weight, 1.0 - text_weight), top_k * overfetch
+        
+        # If no dominant colors provided, try to extract them
+        if not dominant_colors:
+            inputs = prepared[pos] or {}
+            if "dominant_colors" in inputs:
+                dominant_colors = inputs["dominant_colors"] or None
+            else:
+                # Reuse the image decoded for the encode, decoding only if it was prepared elsewhere
+                image = images.get(pos) or load_query_image(request)
+                dominant_colors = extract_dominant_colors(image) or None
+        
+        queries.append((pos, query_rows, weights, fetch_k, top_k, dominant_colors))
+    
+    if not queries:
+        return [outputs[pos] for pos in range(len(requests))]
+    
+    # One exact search for every query row (late fusion has two per query); a smaller k is a
+    # prefix of a larger one, so facet candidates come from the same call
+    personalizations = [user_personalization(requests[q[0]]) for q in queries]
+    facet_requests = [request_facets(requests[q[0]]) for q in queries]
+    search_k = max([q[3] for q in queries] + [min(f[1], index.ntotal) for f in facet_requests if f])
+    query_matrix = np.concatenate([
+        np.stack([personalize_query(row, personalization) for row in q[1]])
+        for q, personalization in zip(queries, personalizations)
+    ]).astype('float32')
+    with span("index_search"):
+        distances, indices = index.search(query_matrix, search_k)
+    
+    first_row = 0
+    for row, (pos, query_rows, weights, fetch_k, top_k, dominant_colors) in enumerate(queries):
+        rows = slice(first_row, first_row + len(query_rows))
+        first_row += len(query_rows)
+        if len(query_rows) == 1:
+            row_distances, row_indices = distances[rows][0][:fetch_k], indices[rows][0][:fetch_k]
+        else:
+            row_distances, row_indices = merge_ranked_lists(distances[rows, :fetch_k], indices[rows, :fetch_k],
+                                                            weights, fetch_k)
+        cursor = request_cursor(requests[pos])
+        if cursor is not None:
+            # The batch's search fills the cursor's first buffer
+            cursor.start(query_matrix[rows], fetch_k // top_k, dominant_colors, personalizations[row], weights)
+            cursor.add_candidates(row_distances, row_indices, fetch_k, image_embeddings, index.ntotal)
+            outputs[pos] = with_cursor({"results": cursor.next_page(index, df, image_embeddings, quiet=quiet)}, cursor)
+        else:
+            product_results = build_product_results(row_distances, row_indices, df, image_embeddings, quiet)
+            product_results = personalize_results(product_results, personalizations[row], image_embeddings)
+            product_results = enrich_product_results(product_results, dominant_colors, quiet)
+            product_results = clean_product_results(product_results, quiet)
+            outputs[pos] = {"results": product_results[:top_k]}
+        if facet_requests[row]:
+            columns, facet_k = facet_requests[row]
+            with span("facets"):
+                outputs[pos]["facets"] = facet_index(df, image_embeddings).counts(indices[rows, :facet_k], columns)
+    
+    return [outputs[pos] for pos in range(len(requests))]
+
+class MicroBatcher:
+    """Gathers concurrent search requests into micro-batches for search_batch"""
+    
+    def __init__(self, model, preprocess, index, df, image_embeddings, device,
+                 max_batch_size=16, max_wait_ms=5.0, quiet=False, reloader=None, models=None, model_reloaders=None):
+        self.search_args = (model, preprocess, index, df, image_embeddings, device)
+        self.reloader = reloader
+        # Extra models by name, each searched in its own sub-batch
+        self.models = dict(models or {})
+        self.model_reloaders = {name: reloader for name, reloader in (model_reloaders or {}).items() if reloader}
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.quiet = quiet
+        self.batches = 0
+        self.batched_requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    @property
+    def mean_batch_size(self):
+        return self.batched_requests / self.batches if self.batches else 0.0
+    
+    def submit(self, request, prepared=None, deadline=None, trace=None):
+        """Queue a request and return a Future for its output dict
+        
+        `deadline` is a time.monotonic() value; requests still queued past it fail with
+        TimeoutError instead of using model time. If a `trace` is given (or the request
+        asks for timings) it receives the queue wait and the stages of its micro-batch.
+        """
+        if trace is None and request.get("timings"):
+            trace = Trace()
+        future = Future()
+        self._queue.put((request, future, prepared, deadline, trace, time.perf_counter()))
+        return future
+    
+    def close(self):
+        """Finish queued requests and stop the scheduler thread"""
+        self._queue.put(None)
+        self._thread.join()
+        for reloader in [self.reloader] + list(self.model_reloaders.values()):
+            if reloader is not None:
+                reloader.close()
+    
+    def _collect(self):
+        # Block for the first request, then wait at most max_wait for the batch to fill
+        item = self._queue.get()
+        if item is None:
+            return None
+        
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back so the next collect sees it
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
             
-            # Normalize features
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
+            # Drop requests whose caller has already given up. Marking the rest running means
+            # a caller timing out from here on can no longer cancel the future under us
+            now = time.monotonic()
+            live = []
+            for item in batch:
+                if not item[1].set_running_or_notify_cancel():
+                    continue
+                deadline = item[3]
+                if deadline is not None and now > deadline:
+                    item[1].set_exception(TimeoutError("Deadline exceeded before inference"))
+                else:
+                    live.append(item)
+            if not live:
+                continue
+            
+            # Between batches is the one point where nothing is using the index
+            if self.reloader is not None:
+                self.search_args = self.reloader.swap(self.search_args)
+            for name, reloader in self.model_reloaders.items():
+                self.models[name] = reloader.swap(self.models[name])
             
-            # Calculate similarity between text and image
-            similarity = (image_features @ text_features.T).item()
+            # One sub-batch per model; most batches only have the one
+            groups = {}
+            for item in live:
+                try:
+                    request, search_args = route_request(item[0], self.search_args, self.models)
+                except ValueError as e:
+                    item[1].set_result({"error": str(e)})
+                    continue
+                groups.setdefault(request_model(request), (search_args, []))[1].append((request, item))
             
-            # Define threshold for coherence
-            coherence_threshold = 0.2  # This can be adjusted based on testing
+            for search_args, group in groups.values():
+                self._run_group(search_args, group)
+    
+    def _run_group(self, search_args, group):
+        self.batches += 1
+        self.batched_requests += len(group)
+        requests = [request for request, _ in group]
+        prepared = [item[2] for _, item in group]
+        traces = [item[4] for _, item in group]
+        started = time.perf_counter()
+        try:
+            # Only time the batch when someone in it is collecting timings
+            with tracing(any(trace is not None for trace in traces)) as batch_trace:
+                outputs = search_batch(requests, *search_args, quiet=self.quiet, prepared=prepared)
+        except Exception as e:
+            if not self.quiet:
+                print(f"Error in batched search: {str(e)}", file=sys.stderr)
+            for _, item in group:
+                item[1].set_exception(e)
+            return
+        
+        # Scatter the results back to the callers
+        for (_, item), output in zip(group, outputs):
+            request, future, _, _, trace, queued = item
+            if trace is not None:
+                trace.add("queue_wait", started - queued)
+                trace.merge(batch_trace)
+                if request.get("timings"):
+                    output["timings"] = trace.timings_ms()
+            future.set_result(output)
+
+def serve(model, preprocess, index, df, image_embeddings, device, thread_config=None, batcher=None, quiet=False,
+          reloader=None, models=None, model_reloaders=None):
+    """Answer newline-delimited JSON search requests from stdin until it is closed
+    
+    `models` holds the search args of extra models by name (with `model_reloaders`), for
+    requests naming one in "model"; a batcher has its own.
+    """
+    models = dict(models or {})
+    model_reloaders = {name: reloader for name, reloader in (model_reloaders or {}).items() if reloader}
+    write_lock = threading.Lock()
+    
+    def write_response(response, request=None):
+        # Echo the request id so callers can match pipelined responses
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        with write_lock:
+            sys.stdout.write(json.dumps(response) + "\n")
+            sys.stdout.flush()
+    
+    def write_future(future, request):
+        try:
+            response = future.result()
+        except Exception as e:
+            response = {"error": str(e)}
+        write_response(response, request)
+    
+    # Tell the launcher the model is loaded and which cores/threads we ended up with
+    write_response({"ready": True, "pid": os.getpid(), "threads": thread_config, "models": [CLIP_MODEL] + list(models)})
+    
+    pending = []
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        
+        request = None
+        try:
+            request = json.loads(line)
             
-            is_coherent = similarity >= coherence_threshold
+            # Batched mode: the scheduler answers out of order as batches complete
+            if batcher is not None:
+                future = batcher.submit(request)
+                future.add_done_callback(lambda f, request=request: write_future(f, request))
+                pending.append(future)
+                continue
             
-            return {
-                "is_coherent": is_coherent,
-                "similarity": similarity
-            }
-    except Exception as e:
-        if not quiet:
-            print(f"Error checking text-image coherence: {str(e)}", file=sys.stderr)
-        return {"is_coherent": True, "similarity": 1.0}
+            if reloader is not None:
+                model, preprocess, index, df, image_embeddings, device = reloader.swap(
+                    (model, preprocess, index, df, image_embeddings, device))
+            for name, model_reloader in model_reloaders.items():
+                models[name] = model_reloader.swap(models[name])
+            routed, search_args = route_request(request, (model, preprocess, index, df, image_embeddings, device),
+                                                models)
+            response = handle_request(routed, *search_args, quiet)
+        except Exception as e:
+            if not quiet:
+                print(f"Error handling request: {str(e)}", file=sys.stderr)
+            response = {"error": str(e)}
+        
+        write_response(response, request)
+    
+    # Drain in-flight batched requests before exiting
+    for future in pending:
+        try:
+            future.result()
+        except Exception:
+            pass
+    if batcher is not None:
+        batcher.close()
+    else:
+        for model_reloader in [reloader] + list(model_reloaders.values()):
+            if model_reloader is not None:
+                model_reloader.close()
 
-# Update the main function to handle rotation check
 def main():
   args = parse_args()
   quiet = args.quiet
 
   try:
-      # Initialize results with default empty list
-      results = []
+      # Pin cores and size thread pools before torch and FAISS start their workers
+      thread_config = configure_threads(args.torch_threads, args.torch_interop_threads,
+                                        args.faiss_threads, args.cpu_affinity, quiet)
       
-      # Special case for validation
-      if args.search_type == "validate":
-          if not args.image_path:
-              if not quiet:
-                  print("Error: Image validation requires an image path", file=sys.stderr)
-              sys.exit(1)
-              
-          # Load model and data
-          model, preprocess, _, _, _, device = load_model_and_data(quiet)
-          
-          # Validate the image
-          validation_result = validate_fashion_image(args.image_path, model, preprocess, device, quiet)
-          
-          # Check if rotation check is enabled and the image is not already valid
-          if args.rotation_check and not validation_result.get("is_fashion_related", False):
-              rotated_validation = validate_rotated_fashion_image(args.image_path, model, preprocess, device, quiet)
-              if rotated_validation:
-                  validation_result["rotatedValidation"] = rotated_validation
+      if args.model != CLIP_MODEL:
+          use_model(args.model)
+      
+      # Long-running worker mode: load once, answer many requests
+      index_args = (args.shard_manifest, args.shard_addresses, args.shard_timeout_ms,
+                    args.index_mode, args.rerank_factor, not args.no_diversify)
+      
+      if args.serve:
+          model, preprocess, index, df, image_embeddings, device = load_model_and_data(quiet, *index_args)
+          # Compile the query normalizer now rather than on the first text request
+          query_normalizer()
+          facet_index(df, image_embeddings)
+          reloader = artifact_reloader(args.reload_interval, *index_args, quiet=quiet)
           
-          # Extract colors if requested
-          if args.color_detection:
-              validation_result["dominantColors"] = extract_dominant_colors(args.image_path)
+          # Side-by-side models for A/B comparison, routed by each request's "model"
+          models = load_extra_models(parse_list(args.extra_models), args.index_mode, args.rerank_factor,
+                                     not args.no_diversify, quiet)
+          model_reloaders = {}
+          for name, search_args in models.items():
+              facet_index(search_args[3], search_args[4])
+              model_reloaders[name] = artifact_reloader(args.reload_interval, index_mode=args.index_mode,
+                                                        rerank_factor=args.rerank_factor,
+                                                        diversify=not args.no_diversify, quiet=quiet,
+                                                        model_name=name)
           
-          # Output validation results as JSON
-          print(json.dumps({"validation": validation_result}))
+          batcher = None
+          if args.max_batch_size > 1:
+              batcher = MicroBatcher(model, preprocess, index, df, image_embeddings, device,
+                                     args.max_batch_size, args.max_wait_ms, quiet, reloader, models, model_reloaders)
+          serve(model, preprocess, index, df, image_embeddings, device,
+                thread_config=thread_config, batcher=batcher, quiet=quiet, reloader=reloader,
+                models=models, model_reloaders=model_reloaders)
           return
       
-      # Special case for coherence check
-      if args.search_type == "coherence":
-          if not args.image_path or not args.query:
-              if not quiet:
-                  print("Error: Coherence check requires both image path and query", file=sys.stderr)
-              sys.exit(1)
+      # Check we have the required arguments before paying for the model load
+      request = request_from_args(args)
+      validate_request(request)
+        
+      # Trace the whole run, model and data loading included
+      index = None
+      with tracing(args.timings) as trace:
+          if request["search_type"] in INDEX_FREE_SEARCH_TYPES:
+              # Lookups in precomputed tables only need the catalogue metadata
+              output = handle_request(request, None, None, None, load_metadata(quiet), None, None, quiet)
+          else:
+              # Load model and data
+              load_model = request["search_type"] not in MODEL_FREE_SEARCH_TYPES
+              model, preprocess, index, df, image_embeddings, device = load_model_and_data(
+                  quiet, *index_args, load_model=load_model)
               
-          # Load model and data
-          model, preprocess, _, _, _, device = load_model_and_data(quiet)
-          
-          # Check text-image coherence
-          coherence_result = check_text_image_coherence(args.query, args.image_path, model, preprocess, device, quiet)
-          
-          # Output coherence results as JSON
-          print(json.dumps({"coherence": coherence_result}))
-          return
-        
-      # Check if we have the required arguments for other search types
-      if args.search_type == "text" and not args.query:
-          if not quiet:
-              print("Error: Text search requires a query", file=sys.stderr)
-          sys.exit(1)
-        
-      if args.search_type == "image" and not args.image_path:
-          if not quiet:
-              print("Error: Image search requires an image path", file=sys.stderr)
-          sys.exit(1)
-        
-      if args.search_type == "multimodal" and (not args.query or not args.image_path):
-          if not quiet:
-              print("Error: Multimodal search requires both query and image path", file=sys.stderr)
-          sys.exit(1)
-        
-      # Load model and data
-      model, preprocess, index, df, image_embeddings, device = load_model_and_data(quiet)
-        
-      # Parse dominant colors if provided
-      dominant_colors = None
-      if args.dominant_colors:
-          dominant_colors = args.dominant_colors.split(',')
-        
-      # Perform search based on type
-      if args.search_type == "text":
-          results = search_by_text(args.query, model, index, df, image_embeddings, device, args.top_k, quiet)
-        
-      elif args.search_type == "image":
-          results = search_by_image(args.image_path, model, preprocess, index, df, image_embeddings, device, args.top_k, dominant_colors, quiet)
-        
-      elif args.search_type == "multimodal":
-          results = multimodal_search(args.query, args.image_path, model, preprocess, index, df, image_embeddings, device, args.top_k, dominant_colors, quiet)
-        
-      # Clean the results to ensure they are JSON serializable
-      results = clean_product_results(results, quiet)
+              output = handle_request(request, model, preprocess, index, df, image_embeddings, device, quiet)
+      
+      if trace is not None:
+          output["timings"] = trace.timings_ms()
+      
+      # Flag results that are missing a slow or failed shard
+      if getattr(index, 'missing_shards', None):
+          output["missingShards"] = index.missing_shards
         
       # Output results as JSON
-      print(json.dumps({"results": results}))
+      print(json.dumps(output))
 
   except Exception as e:
       if not quiet:
@@ -967,4 +2960,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -4,10 +4,17 @@ Generate embeddings for fashion dataset using CLIP model.
 """
 
 import argparse
+import json
 import os
+import shutil
 import sys
+import time
+import zlib
 import importlib.util
 
+from artifact_versions import DEFAULT_MODEL, model_root, prune_versions, publish_version, start_version, write_model_info
+from image_cache import ImageCache
+
 # Add error handling for imports
 try:
     import numpy as np
@@ -28,10 +35,180 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Generate embeddings for fashion dataset")
     parser.add_argument("--dataset-path", type=str, required=True, help="Path to dataset directory")
     parser.add_argument("--embeddings-path", type=str, required=True, help="Path to save embeddings")
+    parser.add_argument("--model", type=str, default=os.environ.get("CLIP_MODEL", DEFAULT_MODEL),
+                        help=f"CLIP model to embed with; models other than {DEFAULT_MODEL} are written under "
+                             "<embeddings-path>/models/<model> (env: CLIP_MODEL)")
     parser.add_argument("--batch-size", type=int, default=16, help="Batch size for processing")
     parser.add_argument("--env-file", type=str, help="Path to environment variables file")
+    parser.add_argument("--num-shards", type=int, default=0,
+                        help="Also split the index into this many shards (see shard_server.py)")
+    parser.add_argument("--shard-by", type=str, default="hash", choices=["hash", "masterCategory"],
+                        help="Partition shards by a stable hash of the id or by masterCategory")
+    parser.add_argument("--compressed", type=str, default="",
+                        help="Also write compressed first-stage indexes, comma-separated from fp16,sq8,pq "
+                             "(searched with clip_search.py --index-mode)")
+    parser.add_argument("--pq-m", type=int, default=64,
+                        help="PQ sub-quantizers (bytes per vector) for --compressed pq")
+    parser.add_argument("--matrix-only", action="store_true",
+                        help="Only convert an existing image_embeddings.npy into the memory-mappable matrix files "
+                             "(and shards, with --num-shards)")
+    parser.add_argument("--image-cache", action="store_true",
+                        help="Read images from the preprocessed uint8 cache under <embeddings-path>/image_cache, "
+                             "decoding only new or changed files into it (see image_cache.py)")
+    parser.add_argument("--prepare-only", action="store_true",
+                        help="Only load, filter and describe the catalogue, and report how long that took")
+    parser.add_argument("--publish", action="store_true",
+                        help="Build into a new version under <embeddings-path>/versions and make it live once "
+                             "complete (running search services switch to it; see artifact_versions.py)")
+    parser.add_argument("--version", type=str, help="Name for the published version (default: build timestamp)")
+    parser.add_argument("--keep-versions", type=int, default=3,
+                        help="With --publish, delete all but this many newest versions afterwards")
+    
+    args = parser.parse_args()
+    if args.publish and args.matrix_only:
+        parser.error("--publish builds a complete version; it can't be combined with --matrix-only")
+    return args
+
+# Metadata columns joined into each item's text description, after productDisplayName
+DESCRIPTION_COLUMNS = ["masterCategory", "subCategory", "articleType", "baseColour", "usage", "gender"]
+
+def image_ids_on_disk(image_folder):
+    """Ids with a <id>.jpg in the folder, from one directory listing instead of a stat per row"""
+    with os.scandir(image_folder) as entries:
+        return {entry.name[:-4] for entry in entries if entry.name.endswith(".jpg")}
+
+def text_descriptions(df):
+    """"<name> - <masterCategory>, <subCategory>, ..., <gender>" for every row, built column-wise"""
+    # Missing values read "nan", exactly as the row-wise f-string wrote them
+    columns = [df[column].fillna("nan").astype(str) for column in ["productDisplayName"] + DESCRIPTION_COLUMNS]
+    description = columns[0] + " - " + columns[1]
+    for column in columns[2:]:
+        description = description + ", " + column
+    return description
+
+def prepare_catalogue(metadata_file, image_folder):
+    """Load styles.csv, keep rows that have an image and add text_description; returns (df, timings in s)"""
+    timings = {}
+    started = time.perf_counter()
+    df = pd.read_csv(metadata_file, on_bad_lines="skip")
+    timings["read_csv"] = time.perf_counter() - started
+    
+    # Remove missing values and ensure corresponding images exist
+    step = time.perf_counter()
+    df = df.dropna(subset=["id", "productDisplayName"])
+    df["id"] = df["id"].astype(str)  # Convert ID to string
+    df = df[df["id"].isin(image_ids_on_disk(image_folder))].reset_index(drop=True)
+    timings["filter"] = time.perf_counter() - step
+    
+    # Create a text description combining metadata
+    step = time.perf_counter()
+    df["text_description"] = text_descriptions(df)
+    timings["describe"] = time.perf_counter() - step
+    
+    timings["total"] = time.perf_counter() - started
+    return df, timings
+
+def save_embedding_matrix(image_embeddings, embeddings_path):
+    """Save image embeddings as a float32 matrix plus id array, row-aligned with the FAISS index"""
+    ids = np.array(list(image_embeddings.keys()))
+    matrix = np.ascontiguousarray(np.stack(list(image_embeddings.values())), dtype=np.float32)
     
-    return parser.parse_args()
+    # Plain .npy files (no pickle) so search processes can np.load(..., mmap_mode='r') and share pages
+    np.save(os.path.join(embeddings_path, "image_matrix.npy"), matrix)
+    np.save(os.path.join(embeddings_path, "image_ids.npy"), ids)
+    return matrix
+
+def build_compressed_index(matrix, mode, pq_m=64):
+    """Build a compressed FAISS index over the matrix: fp16 (2x), sq8 (4x) or PQ (2048/pq_m x)"""
+    dimension = matrix.shape[1]
+    if mode == "fp16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    elif mode == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif mode == "pq":
+        # 8-bit codes need at least 256 training vectors per sub-quantizer centroid set
+        if len(matrix) < 256:
+            raise ValueError(f"PQ needs at least 256 vectors to train, got {len(matrix)}")
+        index = faiss.IndexPQ(dimension, pq_m, 8)
+    else:
+        raise ValueError(f"Unknown compressed index mode: {mode}")
+    
+    index.train(matrix)
+    index.add(matrix)
+    return index
+
+def write_compressed_indexes(matrix, embeddings_path, modes, pq_m=64):
+    """Write fashion_faiss_<mode>.index for each requested mode"""
+    for mode in [m.strip() for m in modes.split(",") if m.strip()]:
+        try:
+            index = build_compressed_index(matrix, mode, pq_m)
+        except ValueError as e:
+            print(f"Skipping {mode} index: {e}")
+            continue
+        path = os.path.join(embeddings_path, f"fashion_faiss_{mode}.index")
+        faiss.write_index(index, path)
+        print(f"  {mode}: {os.path.getsize(path) / 1e6:.1f} MB -> {path}")
+
+def assign_shards(ids, df, num_shards, shard_by):
+    """Return a shard number for every id"""
+    if shard_by == "hash":
+        # crc32 is stable across runs and machines, unlike Python's hash()
+        return np.array([zlib.crc32(str(img_id).encode("utf-8")) % num_shards for img_id in ids])
+    
+    # Keep each masterCategory on one shard, packing the largest categories first
+    categories = df.set_index("id")[shard_by].reindex(ids).fillna("Unknown").astype(str).values
+    names, counts = np.unique(categories, return_counts=True)
+    shard_sizes = np.zeros(num_shards, dtype=np.int64)
+    shard_of = {}
+    for name, count in sorted(zip(names, counts), key=lambda item: -item[1]):
+        shard = int(np.argmin(shard_sizes))
+        shard_of[name] = shard
+        shard_sizes[shard] += count
+    return np.array([shard_of[name] for name in categories])
+
+def write_shards(image_embeddings, df, embeddings_path, num_shards, shard_by):
+    """Split the image embeddings into per-shard FAISS indexes plus a manifest"""
+    ids = np.array(list(image_embeddings.keys()))
+    matrix = np.ascontiguousarray(np.stack(list(image_embeddings.values())), dtype=np.float32)
+    assignment = assign_shards(ids, df, num_shards, shard_by)
+    
+    shards_path = os.path.join(embeddings_path, "shards")
+    os.makedirs(shards_path, exist_ok=True)
+    
+    shards = []
+    for shard in range(num_shards):
+        rows = np.flatnonzero(assignment == shard)
+        name = f"shard_{shard:03d}"
+        shard_path = os.path.join(shards_path, name)
+        os.makedirs(shard_path, exist_ok=True)
+        
+        index = faiss.IndexFlatL2(matrix.shape[1])
+        if len(rows):
+            index.add(matrix[rows])
+        faiss.write_index(index, os.path.join(shard_path, "fashion_faiss.index"))
+        np.save(os.path.join(shard_path, "image_ids.npy"), ids[rows])
+        
+        entry = {"name": name, "path": name, "count": int(len(rows))}
+        if shard_by != "hash":
+            entry["categories"] = sorted(set(df.set_index("id")[shard_by].reindex(ids[rows]).fillna("Unknown").astype(str)))
+        shards.append(entry)
+        print(f"  {name}: {len(rows)} vectors")
+    
+    manifest = {
+        "num_shards": num_shards,
+        "shard_by": shard_by,
+        "dimension": int(matrix.shape[1]),
+        "metric": "L2",
+        "total": int(len(ids)),
+        "shards": shards,
+    }
+    
+    # Write the manifest last and atomically so readers never see a half-written one
+    manifest_path = os.path.join(shards_path, "manifest.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest_path
 
 def main():
     args = parse_args()
@@ -56,10 +233,31 @@ def main():
     
     # Define paths
     DATASET_PATH = args.dataset_path
-    EMBEDDINGS_PATH = args.embeddings_path
+    # Each model's artifacts live apart, so trial models never overwrite the production ones
+    EMBEDDINGS_PATH = model_root(args.embeddings_path, args.model)
     IMAGE_FOLDER = os.path.join(DATASET_PATH, 'images')
     METADATA_FILE = os.path.join(DATASET_PATH, 'styles.csv')
     
+    # Convert existing embeddings without touching the dataset or the model
+    if args.matrix_only:
+        print("Converting image embeddings to a memory-mappable matrix...")
+        image_embeddings = np.load(os.path.join(EMBEDDINGS_PATH, "image_embeddings.npy"), allow_pickle=True).item()
+        image_vectors = save_embedding_matrix(image_embeddings, EMBEDDINGS_PATH)
+        print(f"Saved {len(image_embeddings)} embeddings to image_matrix.npy / image_ids.npy")
+        
+        if args.compressed:
+            print("Writing compressed indexes...")
+            write_compressed_indexes(image_vectors, EMBEDDINGS_PATH, args.compressed, args.pq_m)
+        
+        if args.num_shards > 0:
+            df = None
+            if args.shard_by != "hash":
+                df = pd.read_csv(METADATA_FILE, on_bad_lines="skip").dropna(subset=["id"])
+                df["id"] = df["id"].astype(str)
+            print(f"Writing {args.num_shards} shards by {args.shard_by}...")
+            print(f"Shard manifest: {write_shards(image_embeddings, df, EMBEDDINGS_PATH, args.num_shards, args.shard_by)}")
+        return
+    
     # Check if paths exist
     print(f"Checking paths:")
     print(f"Dataset path: {DATASET_PATH}, exists: {os.path.exists(DATASET_PATH)}")
@@ -70,85 +268,89 @@ def main():
     assert os.path.exists(METADATA_FILE), f"Metadata file not found: {METADATA_FILE}"
     
     # Create embeddings directory if it doesn't exist
-    os.makedirs(EMBEDDINGS_PATH, exist_ok=True)
-    
-    # Load dataset
-    print("Loading dataset...")
-    df = pd.read_csv(METADATA_FILE, on_bad_lines="skip")
+    if not args.prepare_only:
+        os.makedirs(EMBEDDINGS_PATH, exist_ok=True)
     
-    # Remove missing values and ensure corresponding images exist
-    df = df.dropna(subset=["id", "productDisplayName"])
-    df["id"] = df["id"].astype(str)  # Convert ID to string
+    # Publishing builds into a staging directory that search never reads from
+    ARTIFACTS_ROOT = EMBEDDINGS_PATH
+    if args.publish and not args.prepare_only:
+        version, EMBEDDINGS_PATH = start_version(ARTIFACTS_ROOT, args.version)
+        print(f"Building version {version} in {EMBEDDINGS_PATH}")
     
-    # Keep only rows where the image exists
-    print("Filtering dataset...")
-    df = df[df["id"].apply(lambda x: os.path.exists(os.path.join(IMAGE_FOLDER, f"{x}.jpg")))].reset_index(drop=True)
-    
-    # Create a text description combining metadata
-    df["text_description"] = df.apply(
-        lambda row: f"{row['productDisplayName']} - {row['masterCategory']}, {row['subCategory']}, {row['articleType']}, {row['baseColour']}, {row['usage']}, {row['gender']}",
-        axis=1
-    )
+    # Load dataset, keep rows whose image exists and describe them
+    print("Loading dataset...")
+    df, timings = prepare_catalogue(METADATA_FILE, IMAGE_FOLDER)
     
     # Display dataset info
     print(f"Dataset size after filtering: {len(df)}")
+    print("Preparation time: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    if args.prepare_only:
+        print(json.dumps({"rows": len(df), "timings_s": timings}))
+        return
     
     # Load CLIP model
     print("Loading CLIP model...")
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, preprocess = clip.load("ViT-B/32", device=device)
+    model, preprocess = clip.load(args.model, device=device)
     
     # Dictionary to store image embeddings
     print("Generating image embeddings...")
     image_embeddings = {}
     
-    # Process images in batches
+    # Process images in batches, slicing plain arrays rather than iterating DataFrame rows
     batch_size = args.batch_size
-    for i in tqdm(range(0, len(df), batch_size)):
-        batch_df = df.iloc[i:i+batch_size]
-        batch_images = []
-        batch_ids = []
-        
-        for _, row in batch_df.iterrows():
-            img_id = row["id"]
-            img_path = os.path.join(IMAGE_FOLDER, f"{img_id}.jpg")
-            
-            try:
-                image = preprocess(Image.open(img_path).convert("RGB"))
-                batch_images.append(image)
-                batch_ids.append(img_id)
-            except Exception as e:
-                print(f"Error processing image {img_id}: {e}")
-        
-        if batch_images:
-            images_tensor = torch.stack(batch_images).to(device)
+    all_ids = df["id"].to_numpy()
+    all_texts = df["text_description"].to_numpy()
+    
+    def decoded_batches():
+        for i in range(0, len(df), batch_size):
+            batch_images = []
+            batch_ids = []
             
-            with torch.no_grad():
-                image_features = model.encode_image(images_tensor)
-                image_features /= image_features.norm(dim=-1, keepdim=True)
+            for img_id in all_ids[i:i+batch_size]:
+                img_path = os.path.join(IMAGE_FOLDER, f"{img_id}.jpg")
+                
+                try:
+                    image = preprocess(Image.open(img_path).convert("RGB"))
+                    batch_images.append(image)
+                    batch_ids.append(img_id)
+                except Exception as e:
+                    print(f"Error processing image {img_id}: {e}")
             
-            for img_id, feature in zip(batch_ids, image_features):
-                image_embeddings[img_id] = feature.cpu().numpy()
+            if batch_images:
+                yield batch_ids, torch.stack(batch_images)
+    
+    batches = decoded_batches()
+    if args.image_cache:
+        # Cached crops: no JPEG decoding, only a vectorized normalize per batch
+        # Shared by all models: the cache is keyed by preprocess geometry, not by model
+        cache = ImageCache(args.embeddings_path, preprocess)
+        print(f"Syncing image cache {cache.path}...")
+        print(json.dumps(cache.sync(all_ids, IMAGE_FOLDER)))
+        batches = cache.batches(batch_size)
+    
+    for batch_ids, images_tensor in tqdm(batches, total=(len(df) + batch_size - 1) // batch_size):
+        images_tensor = images_tensor.to(device)
+        
+        with torch.no_grad():
+            image_features = model.encode_image(images_tensor)
+            image_features /= image_features.norm(dim=-1, keepdim=True)
+        
+        for img_id, feature in zip(batch_ids, image_features):
+            image_embeddings[img_id] = feature.cpu().numpy()
     
     # Save image embeddings
     print("Saving image embeddings...")
     np.save(os.path.join(EMBEDDINGS_PATH, "image_embeddings.npy"), image_embeddings)
+    image_vectors = save_embedding_matrix(image_embeddings, EMBEDDINGS_PATH)
     
     # Generate text embeddings
     print("Generating text embeddings...")
     text_embeddings = {}
     
     for i in tqdm(range(0, len(df), batch_size)):
-        batch_df = df.iloc[i:i+batch_size]
-        batch_texts = []
-        batch_ids = []
-        
-        for _, row in batch_df.iterrows():
-            img_id = row["id"]
-            text = row["text_description"]
-            
-            batch_texts.append(text)
-            batch_ids.append(img_id)
+        batch_texts = all_texts[i:i+batch_size].tolist()
+        batch_ids = all_ids[i:i+batch_size]
         
         if batch_texts:
             text_tokens = clip.tokenize(batch_texts).to(device)
@@ -166,7 +368,6 @@ def main():
     
     # Create FAISS index
     print("Creating FAISS index...")
-    image_vectors = np.array(list(image_embeddings.values()))
     dimension = image_vectors.shape[1]
     index = faiss.IndexFlatL2(dimension)
     index.add(image_vectors)
@@ -175,6 +376,30 @@ def main():
     print("Saving FAISS index...")
     faiss.write_index(index, os.path.join(EMBEDDINGS_PATH, "fashion_faiss.index"))
     
+    # Record what the vectors are, so search only pairs them with queries from the same model
+    model_info = write_model_info(EMBEDDINGS_PATH, args.model, dimension)
+    
+    # Optionally add compressed first-stage indexes for exact re-ranking
+    if args.compressed:
+        print("Writing compressed indexes...")
+        write_compressed_indexes(image_vectors, EMBEDDINGS_PATH, args.compressed, args.pq_m)
+    
+    # Optionally split into shards for scatter-gather search
+    if args.num_shards > 0:
+        print(f"Writing {args.num_shards} shards by {args.shard_by}...")
+        manifest_path = write_shards(image_embeddings, df, EMBEDDINGS_PATH, args.num_shards, args.shard_by)
+        print(f"Shard manifest: {manifest_path}")
+    
+    if args.publish:
+        # Search reads metadata from the version too, so ids and rows always match the index
+        shutil.copyfile(METADATA_FILE, os.path.join(EMBEDDINGS_PATH, "styles.csv"))
+        manifest = publish_version(ARTIFACTS_ROOT, version, EMBEDDINGS_PATH,
+                                   dict(model_info, count=len(image_embeddings)))
+        print(f"Published version {version}: {len(manifest['files'])} files, now live")
+        pruned = prune_versions(ARTIFACTS_ROOT, args.keep_versions)
+        if pruned:
+            print(f"Deleted old versions: {', '.join(pruned)}")
+    
     print("Embeddings and index generated successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Preprocessed Image Cache
+
+Keeps every catalogue image resized and center-cropped, as uint8 RGB pixels,
+in one memory-mapped .npy file so re-embedding runs and model comparisons skip
+JPEG decoding and resizing entirely: batches are sliced straight from the file
+and only the per-channel normalize step runs (vectorized, on the whole batch).
+
+  embeddings/image_cache/<H>x<W>-<tag>/
+    pixels-<generation>.npy   uint8 [N, H, W, 3]
+    keys.npz                  row-aligned catalogue ids and uint64 hashes of each source
+                              file's bytes (0 = could not be decoded), plus the generation
+
+<tag> fingerprints the resize/crop steps of the model's preprocess, so models
+with different input geometry keep separate caches. On each sync a row is
+reused when its id and source-file hash are unchanged, and decoded again
+otherwise. The cache lives beside the artifact versions, not in one, because
+it outlives embedding builds.
+
+  build  decode, crop and store every image of the catalogue (incremental)
+  info   show the cached geometry, row count and size
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from artifact_versions import DEFAULT_MODEL
+
+CACHE_DIR = "image_cache"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain the preprocessed image cache")
+    parser.add_argument("--dataset-path", type=str, required=True, help="Path to dataset directory")
+    parser.add_argument("--embeddings-path", type=str, required=True, help="Embeddings root directory")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL, help="CLIP model whose preprocess is cached")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("build", help="Decode, crop and store every catalogue image")
+    subparsers.add_parser("info", help="Show the cached geometry, row count and size")
+
+    return parser.parse_args()
+
+def split_preprocess(preprocess):
+    """Split a CLIP preprocess Compose into (resize/crop/RGB steps, mean, std)"""
+    import torchvision.transforms as T
+
+    steps = list(getattr(preprocess, "transforms", []))
+    tensor_at = next((i for i, step in enumerate(steps) if isinstance(step, T.ToTensor)), None)
+    normalize = next((step for step in steps if isinstance(step, T.Normalize)), None)
+    if tensor_at is None or normalize is None or tensor_at + 1 != steps.index(normalize):
+        raise ValueError("The image cache needs a torchvision preprocess ending in ToTensor, Normalize")
+    return T.Compose(steps[:tensor_at]), normalize.mean, normalize.std
+
+def file_hash(path):
+    """Stable 64-bit hash of a file's bytes (never 0, which marks undecodable rows)"""
+    with open(path, "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+class ImageCache:
+    """uint8 resized and cropped catalogue images in one memory-mapped file, for one preprocess geometry"""
+
+    def __init__(self, root, preprocess):
+        from PIL import Image
+
+        self.crop, mean, std = split_preprocess(preprocess)
+        self.width, self.height = self.crop(Image.new("RGB", (8, 8))).size
+        # Plain functions (CLIP's RGB conversion) are named rather than repr'd, which includes their address
+        steps = "|".join(getattr(step, "__qualname__", None) or repr(step) for step in self.crop.transforms)
+        tag = zlib.crc32(steps.encode("utf-8"))
+        self.path = os.path.join(root, CACHE_DIR, f"{self.width}x{self.height}-{tag:08x}")
+        # (x / 255 - mean) / std as one multiply-subtract pass
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.shift = (np.asarray(mean, dtype=np.float32) / std).astype(np.float32)
+        self.ids = None
+        self.hashes = None
+        self.pixels = None
+        self.generation = 0
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def open(self):
+        """Map the cache as it is on disk; returns False if there is none yet"""
+        if not os.path.exists(self._file("keys.npz")):
+            return False
+        with np.load(self._file("keys.npz")) as keys:
+            self.ids = keys["ids"].astype(str)
+            self.hashes = keys["hashes"]
+            self.generation = int(keys["generation"])
+        self.pixels = np.load(self._file(f"pixels-{self.generation}.npy"), mmap_mode="r")
+        return True
+
+    def _mapped(self):
+        """(ids, hashes, pixels) of the cache, opening it first if needed"""
+        if self.pixels is None and not self.open():
+            raise ValueError(f"No image cache at {self.path}; build it with image_cache.py build")
+        assert self.ids is not None and self.hashes is not None and self.pixels is not None
+        return self.ids, self.hashes, self.pixels
+
+    def sync(self, ids, image_folder, quiet=False):
+        """Make the cache hold exactly `ids` in this order, decoding only new or changed images
+
+        Returns {"rows", "reused", "decoded", "failed", "elapsed_s"}.
+        """
+        from PIL import Image
+
+        started = time.perf_counter()
+        ids = np.asarray([str(img_id) for img_id in ids])
+        hashes = np.zeros(len(ids), dtype=np.uint64)
+        for row, img_id in enumerate(ids):
+            try:
+                hashes[row] = file_hash(os.path.join(image_folder, f"{img_id}.jpg"))
+            except OSError:
+                pass
+
+        # Rows we can copy from the current cache: same id, same bytes, decoded last time
+        old_row, old_pixels = {}, None
+        if self.open():
+            old_ids, old_hashes, old_pixels = self._mapped()
+            old_row = {(img_id, int(h)): row for row, (img_id, h) in enumerate(zip(old_ids, old_hashes)) if h}
+        source = np.array([old_row.get((img_id, int(h)), -1) if h else -1 for img_id, h in zip(ids, hashes)],
+                          dtype=np.int64)
+        if old_pixels is not None and len(old_pixels) == len(ids) and (source == np.arange(len(ids))).all():
+            return {"rows": len(ids), "reused": len(ids), "decoded": 0, "failed": 0,
+                    "elapsed_s": time.perf_counter() - started}
+
+        # Write a new generation next to the current one; readers keep using the old until keys.npz moves
+        os.makedirs(self.path, exist_ok=True)
+        generation = self.generation + 1
+        pixels = np.lib.format.open_memmap(self._file(f"pixels-{generation}.npy"), mode="w+", dtype=np.uint8,
+                                           shape=(len(ids), self.height, self.width, 3))
+        reused = decoded = failed = 0
+        for row, (img_id, h) in enumerate(zip(ids, hashes)):
+            if old_pixels is not None and source[row] >= 0:
+                pixels[row] = old_pixels[source[row]]
+                reused += 1
+                continue
+            try:
+                with Image.open(os.path.join(image_folder, f"{img_id}.jpg")) as image:
+                    pixels[row] = np.asarray(self.crop(image.convert("RGB")), dtype=np.uint8)
+                decoded += 1
+            except Exception as e:
+                if not quiet:
+                    print(f"Error processing image {img_id}: {e}", file=sys.stderr)
+                hashes[row] = 0
+                failed += 1
+            if not quiet and (decoded + failed) % 1000 == 0:
+                print(f"  {row + 1}/{len(ids)} images", file=sys.stderr)
+        pixels.flush()
+        del pixels, old_pixels
+        self.pixels = None
+
+        # Replacing keys.npz is the commit point: it names the generation the ids and hashes describe
+        with open(self._file("keys.npz.tmp"), "wb") as f:
+            np.savez(f, ids=ids, hashes=hashes, generation=np.int64(generation))
+        os.replace(self._file("keys.npz.tmp"), self._file("keys.npz"))
+        if os.path.exists(self._file(f"pixels-{self.generation}.npy")):
+            os.remove(self._file(f"pixels-{self.generation}.npy"))
+        self.open()
+        return {"rows": len(ids), "reused": reused, "decoded": decoded, "failed": failed,
+                "elapsed_s": time.perf_counter() - started}
+
+    def normalize(self, pixels):
+        """uint8 [B, H, W, 3] -> float32 [B, 3, H, W] tensor, as ToTensor + Normalize would give
+
+        The result is a channels-last view, which conv layers take without another copy.
+        """
+        import torch
+
+        # Converting in numpy copies the read-only map into a writable buffer for the in-place ops
+        batch = torch.from_numpy(np.asarray(pixels, dtype=np.float32))
+        batch.mul_(torch.from_numpy(self.scale)).sub_(torch.from_numpy(self.shift))
+        return batch.permute(0, 3, 1, 2)
+
+    def batches(self, batch_size):
+        """Yield (ids, normalized image tensor) per batch of the cached rows, skipping undecodable ones
+
+        Opens the cache if sync() or open() hasn't; raises ValueError if there is none on disk.
+        """
+        ids, hashes, cached = self._mapped()
+        for start in range(0, len(ids), batch_size):
+            valid = np.flatnonzero(hashes[start:start + batch_size]) + start
+            if len(valid) == 0:
+                continue
+            # Contiguous rows are one slice of the map; holes need a gather
+            if len(valid) == valid[-1] - valid[0] + 1:
+                pixels = cached[valid[0]:valid[-1] + 1]
+            else:
+                pixels = cached[valid]
+            yield ids[valid].tolist(), self.normalize(pixels)
+
+    def info(self):
+        return {
+            "path": self.path,
+            "size": [self.width, self.height],
+            "rows": 0 if self.ids is None else int(len(self.ids)),
+            "failed": 0 if self.hashes is None else int((self.hashes == 0).sum()),
+            "bytes": int(self.pixels.nbytes) if self.pixels is not None else 0,
+        }
+
+def main():
+    args = parse_args()
+
+    import clip
+    from generate_embeddings import prepare_catalogue
+
+    _, preprocess = clip.load(args.model, device="cpu")
+    cache = ImageCache(args.embeddings_path, preprocess)
+    try:
+        if args.command == "build":
+            df, _ = prepare_catalogue(os.path.join(args.dataset_path, "styles.csv"),
+                                      os.path.join(args.dataset_path, "images"))
+            summary = cache.sync(df["id"].tolist(), os.path.join(args.dataset_path, "images"), args.quiet)
+            print(json.dumps(dict(cache.info(), **summary), indent=2))
+        elif args.command == "info":
+            cache.open()
+            print(json.dumps(cache.info(), indent=2))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
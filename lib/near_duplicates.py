@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Clustering
+
+Groups catalogue images whose embeddings are within a cosine-similarity
+threshold of each other (the same product shot several times, recolours of
+one photo, ...) so search can collapse them instead of returning five copies.
+
+Runs on CPU in bounded memory: the float32 matrix is memory-mapped and
+searched against the FAISS index one block of rows at a time (k-NN self-join,
+or range search), and clusters are merged with a union-find over int32 arrays.
+Writes embeddings/duplicate_clusters.npy, one int32 cluster id per row of
+image_ids.npy (the smallest row position in the cluster), plus a JSON summary.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import faiss
+
+from artifact_versions import resolve_artifact_dir, save_array
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate catalogue images")
+    parser.add_argument("--embeddings-path", type=str, required=True, help="Embeddings directory (the live version is used if it holds published versions)")
+    parser.add_argument("--threshold", type=float, default=0.95, help="Cosine similarity to count as a duplicate")
+    parser.add_argument("--method", type=str, default="knn", choices=["knn", "range"],
+                        help="k-NN self-join (bounded neighbours per item) or exact range search")
+    parser.add_argument("--k", type=int, default=32, help="Neighbours examined per item with --method knn")
+    parser.add_argument("--block-size", type=int, default=4096, help="Rows searched per block")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def find_root(parent, i):
+    """Union-find lookup with path halving"""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def union_edges(parent, sources, targets):
+    for a, b in zip(sources.tolist(), targets.tolist()):
+        root_a, root_b = find_root(parent, a), find_root(parent, b)
+        if root_a != root_b:
+            # The smaller position becomes the root, so roots are stable across runs
+            if root_a < root_b:
+                parent[root_b] = root_a
+            else:
+                parent[root_a] = root_b
+
+def block_edges(index, block, start, method, k, max_distance):
+    """Return (source, target) positions of pairs within max_distance for one block of rows"""
+    if method == "range":
+        lims, distances, labels = index.range_search(block, max_distance)
+        sources = np.repeat(np.arange(start, start + len(block)), np.diff(lims).astype(np.int64))
+        targets = labels
+    else:
+        distances, labels = index.search(block, k)
+        sources = np.repeat(np.arange(start, start + len(block)), labels.shape[1])
+        close = (distances.ravel() <= max_distance) & (labels.ravel() >= 0)
+        sources, targets = sources[close], labels.ravel()[close]
+
+    # Each pair once, and never an item with itself
+    keep = sources < targets
+    return sources[keep], targets[keep].astype(np.int64)
+
+def cluster_near_duplicates(matrix, index, threshold=0.95, method="knn", k=32, block_size=4096, quiet=False):
+    """Return an int32 cluster id per row; ids are the smallest row position in each cluster"""
+    # Embeddings are L2-normalized, so squared L2 distance = 2 - 2 * cosine similarity
+    max_distance = 2.0 - 2.0 * threshold
+    count = len(matrix)
+    parent = np.arange(count, dtype=np.int32)
+
+    for start in range(0, count, block_size):
+        block = np.ascontiguousarray(matrix[start:start + block_size], dtype=np.float32)
+        sources, targets = block_edges(index, block, start, method, k, max_distance)
+        union_edges(parent, sources, targets)
+        if not quiet:
+            print(f"  {min(start + block_size, count)}/{count} rows", file=sys.stderr)
+
+    # Flatten so every row points straight at its root (the cluster's smallest position)
+    while True:
+        flattened = parent[parent]
+        if np.array_equal(flattened, parent):
+            return parent
+        parent = flattened
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    # Write next to the live version's index when builds are published as versions
+    args.embeddings_path = resolve_artifact_dir(args.embeddings_path)
+
+    matrix = np.load(os.path.join(args.embeddings_path, "image_matrix.npy"), mmap_mode="r")
+    index_path = os.path.join(args.embeddings_path, "fashion_faiss.index")
+    if os.path.exists(index_path):
+        index = faiss.read_index(index_path)
+    else:
+        index = faiss.IndexFlatL2(matrix.shape[1])
+        index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+    if index.ntotal != len(matrix):
+        print(f"Error: index has {index.ntotal} vectors, image_matrix.npy has {len(matrix)}", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.quiet:
+        print(f"Clustering {len(matrix)} items at cosine >= {args.threshold} ({args.method})...", file=sys.stderr)
+    clusters = cluster_near_duplicates(matrix, index, args.threshold, args.method, args.k,
+                                       args.block_size, args.quiet)
+    save_array(os.path.join(args.embeddings_path, "duplicate_clusters.npy"), clusters)
+
+    sizes = np.bincount(clusters, minlength=len(clusters))
+    summary = {
+        "items": int(len(clusters)),
+        "threshold": args.threshold,
+        "method": args.method,
+        "k": args.k if args.method == "knn" else None,
+        "clusters": int(np.count_nonzero(sizes)),
+        "duplicate_items": int(sizes[sizes > 1].sum()),
+        "largest_cluster": int(sizes.max()) if len(sizes) else 0,
+        "elapsed_s": time.perf_counter() - started,
+    }
+    with open(os.path.join(args.embeddings_path, "duplicate_clusters.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
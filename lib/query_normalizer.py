@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Query Normalization
+
+Turns a raw text query into lowercase stemmed tokens in a few microseconds,
+without touching the model:
+
+  - non-fashion phrases ("washing machine", "laptops", "labtop") are found with
+    one word-level Aho-Corasick pass, so search can refuse them before encoding;
+    fashion phrases built on those words ("laptop bag", "cat eye sunglasses")
+    are matched in the same pass and, being longer, win over them
+  - colour words and phrases ("navy blue", "burgundy") are mapped to the
+    catalogue's standard colours, giving the colour intent of the query
+  - the joined tokens form a normalized key for caches
+
+Everything is compiled once from the keyword and colour tables; clip_search
+keeps one QueryNormalizer per process. Run this file with queries as
+arguments to see what they normalize to.
+"""
+
+import json
+import re
+import sys
+import timeit
+from collections import deque
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_POSSESSIVE_RE = re.compile(r"['\u2019]s\b")
+
+# Fashion words whose stems or one-letter typos would otherwise collide with a
+# non-fashion keyword ("glasses" -> "glass", "printed" ~ "printer", "pant" ~ "plant")
+FASHION_TERMS = [
+    "glasses", "sunglasses", "printed", "print", "chain", "pant", "pants", "tops", "top", "shorts",
+    "boxers", "briefs", "trunks", "leggings", "tights", "heels", "flats", "loafers", "slippers",
+    "sandals", "sneakers", "trainers", "boots", "socks", "kurta", "kurtas", "saree", "sarees",
+    "jeans", "jacket", "blazer", "cap", "caps", "bracelet", "ring", "rings", "earrings", "necklace",
+    "pendant", "bangle", "clutch", "tote", "sling", "cufflinks", "tie", "ties", "scarf", "stole",
+    "dupatta", "shawl", "cardigan", "hoodie", "sweatshirt", "tracksuit", "track", "jersey",
+    "sports", "sporty", "casual", "formal", "party", "ethnic", "travel", "cotton", "denim",
+    "leather", "linen", "silk", "wool", "checked", "striped", "floral", "solid", "men", "women",
+    "boys", "girls", "kids", "unisex", "cloak", "frock", "gown", "vest", "coat", "hose", "trunk",
+]
+
+# Fashion phrases that start with a non-fashion keyword; the longest match wins, so these
+# keep "laptop bag" or "tennis shoes" from being refused as "laptop" or "tennis"
+FASHION_PHRASES = [
+    "laptop bag", "laptop sleeve", "laptop backpack", "phone case", "phone cover", "phone pouch",
+    "camera bag", "book bag", "paper bag", "cat eye", "house dress", "house coat", "art deco",
+    "car coat", "boat shoe", "mirror work", "bottle green", "tennis shoe", "tennis skirt",
+    "tennis dress", "tennis bracelet", "football boot", "football jersey", "football shoe",
+    "basketball shoe", "basketball jersey", "cricket shoe", "cricket jersey", "hockey jersey",
+    "rugby shirt", "volleyball shoe", "badminton shoe",
+]
+
+# Spellings the colour table doesn't list
+COLOR_ALIASES = {"gray": "grey"}
+
+def stem(token):
+    """Strip English plural endings ("dresses" -> "dress", "watches" -> "watch", "cities" -> "city")"""
+    if len(token) <= 3 or not token.endswith("s"):
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "ches", "shes", "zes")):
+        return token[:-2]
+    if token.endswith(("ss", "us", "is")):
+        return token
+    return token[:-1]
+
+def edit_variants(word):
+    """Every string one deletion, transposition or substitution away from word"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    variants = set()
+    for left, right in splits:
+        if right:
+            variants.add(left + right[1:])
+            for letter in letters:
+                variants.add(left + letter + right[1:])
+        if len(right) > 1:
+            variants.add(left + right[1] + right[0] + right[2:])
+    variants.discard(word)
+    return variants
+
+class QueryNormalizer:
+    """Compiled query normalization: stemming, typo folding and one Aho-Corasick pass over the tokens"""
+
+    def __init__(self, non_fashion_keywords, color_mapping, fashion_terms=(), min_typo_length=5, fashion_phrases=()):
+        self.min_typo_length = min_typo_length
+        # Tokens matched as written, never stemmed or typo-corrected
+        self.protected = {token for term in list(fashion_terms) + FASHION_TERMS for token in self._split(term)}
+
+        patterns = []
+        for keyword in non_fashion_keywords:
+            patterns.append((self._canonical_words(keyword), ("non_fashion", keyword)))
+        for phrase in list(fashion_phrases) + FASHION_PHRASES:
+            # Protected plurals ("shoes") aren't stemmed, so the plural head word is a pattern of its own
+            words = self._canonical_words(phrase)
+            head = self._split(phrase)[-1]
+            plural = self.canonical(head + ("es" if head.endswith(("s", "x", "ch", "sh")) else "s"))
+            for last in {words[-1], plural}:
+                patterns.append((words[:-1] + (last,), ("fashion", phrase)))
+        for name, standard in color_mapping.items():
+            patterns.append((self._canonical_words(name), ("color", standard)))
+        for alias, name in COLOR_ALIASES.items():
+            standard = next((value for key, value in color_mapping.items() if key.lower() == name), None)
+            if standard is not None:
+                patterns.append((self._canonical_words(alias), ("color", standard)))
+
+        # One-edit typos of long non-fashion words fold onto the word, unless the typo is a
+        # real vocabulary word or close to two different keywords
+        vocabulary = (self.protected | {stem(token) for token in self.protected}
+                      | {word for words, _ in patterns for word in words})
+        typos = {}
+        self.keyword_words = set()
+        for words, (kind, _) in patterns:
+            if kind != "non_fashion":
+                continue
+            self.keyword_words.update(words)
+            for word in words:
+                if len(word) < min_typo_length:
+                    continue
+                for variant in edit_variants(word):
+                    if variant in vocabulary or stem(variant) in vocabulary:
+                        continue
+                    typos[variant] = word if typos.get(variant, word) == word else None
+        self.typos = {variant: word for variant, word in typos.items() if word is not None}
+
+        self._build_automaton(patterns)
+
+    @staticmethod
+    def _split(text):
+        return _TOKEN_RE.findall(_POSSESSIVE_RE.sub("", text.lower()))
+
+    def _canonical_words(self, phrase):
+        return tuple(self.canonical(token) for token in self._split(phrase))
+
+    def canonical(self, token):
+        """The form a single lowercase token is matched and keyed under"""
+        if token in self.protected:
+            return token
+        return stem(token)
+
+    def _fold(self, token):
+        """canonical() plus typo folding; only used on query tokens"""
+        word = self.canonical(token)
+        if word in self.protected or word in self.goto[0] or len(word) < self.min_typo_length:
+            return word
+        folded = self.typos.get(word)
+        if folded is not None:
+            return folded
+        # An extra letter in a longer word: one deletion of the query token lands on the keyword
+        if len(word) >= self.min_typo_length + 2:
+            for i in range(len(word)):
+                candidate = word[:i] + word[i + 1:]
+                if candidate in self.keyword_words:
+                    return candidate
+        return word
+
+    def _build_automaton(self, patterns):
+        """Word-level Aho-Corasick: goto tables, failure links and merged outputs"""
+        self.goto = [{}]
+        outputs = [[]]
+        for words, payload in patterns:
+            state = 0
+            for word in words:
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    outputs.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            outputs[state].append((len(words), payload))
+
+        # Breadth-first, so a state's failure target is finished before its children need it
+        fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = self.goto[fallback].get(word, 0)
+                outputs[child] = outputs[child] + outputs[fail[child]]
+        self.fail = fail
+        self.outputs = outputs
+
+    def normalize(self, query):
+        """Return {"key", "tokens", "non_fashion", "colors"} for a raw query string"""
+        tokens = [self._fold(token) for token in self._split(query or "")]
+
+        # Collect every match, then keep the longest non-overlapping ones
+        matches = []
+        state = 0
+        for end, token in enumerate(tokens):
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            for length, payload in self.outputs[state]:
+                matches.append((end - length + 1, -length, payload))
+        matches.sort(key=lambda match: match[:2])
+
+        non_fashion, colors = [], []
+        covered = -1
+        for start, negative_length, (kind, value) in matches:
+            if start <= covered:
+                continue
+            covered = start - negative_length - 1
+            # Fashion phrases only claim their words from shorter non-fashion matches
+            if kind == "fashion":
+                continue
+            found = non_fashion if kind == "non_fashion" else colors
+            if value not in found:
+                found.append(value)
+
+        return {"key": " ".join(tokens), "tokens": tokens, "non_fashion": non_fashion, "colors": colors}
+
+def main():
+    import clip_search
+
+    normalizer = clip_search.query_normalizer()
+    for query in sys.argv[1:]:
+        result = normalizer.normalize(query)
+        result["query"] = query
+        result["us_per_query"] = timeit.timeit(lambda: normalizer.normalize(query), number=1000) * 1000.0
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
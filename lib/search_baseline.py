@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Search Quality Baseline
+
+Records a golden set of query -> top-k results and latencies from the exact
+IndexFlatL2 search path, then compares other configurations against it so
+faster modes (quantized or ANN indexes, cached embeddings, ...) can be adopted
+without silently degrading results.
+
+  record   run the query set through clip_search.py --serve and save the golden set
+  compare  run the same queries under another configuration and report recall@k,
+           NDCG@k and latency deltas; exits 1 when quality drops past a threshold
+
+A configuration is the clip_search.py flags after `--` plus any --env overrides:
+
+  python lib/search_baseline.py record --output golden.json
+  python lib/search_baseline.py compare --baseline golden.json --env CLIP_INDEX_MODE=pq -- --torch-threads 4
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from bench_search import load_requests, percentile_summary
+from search_workers import SearchWorkerPool
+
+def parse_args(argv=None):
+    # No abbreviations: a misspelt gate option must fail rather than pass for a prefix
+    parser = argparse.ArgumentParser(description="Record and compare search quality baselines", allow_abbrev=False)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record a golden set from the current configuration",
+                                   allow_abbrev=False)
+    record.add_argument("--output", type=str, required=True, help="Golden set JSON file to write")
+    record.add_argument("--top-k", type=int, default=10, help="Number of results per query")
+    record.add_argument("--query-file", type=str, help="File with one text query per line")
+    record.add_argument("--image-dir", type=str, help="Directory of query images (image searches)")
+    record.add_argument("--max-images", type=int, default=50, help="Image queries to take from --image-dir")
+    record.add_argument("--repeats", type=int, default=3, help="Timed runs per query (median is kept)")
+    record.add_argument("--env", action="append", default=[], help="KEY=VALUE environment override")
+
+    compare = subparsers.add_parser("compare", help="Compare a configuration against a golden set",
+                                    allow_abbrev=False)
+    compare.add_argument("--baseline", type=str, required=True, help="Golden set JSON file")
+    compare.add_argument("--repeats", type=int, default=3, help="Timed runs per query (median is kept)")
+    compare.add_argument("--min-recall", type=float, default=0.95, help="Fail below this mean recall@k")
+    compare.add_argument("--min-ndcg", type=float, default=0.95, help="Fail below this mean NDCG@k")
+    compare.add_argument("--max-latency-ratio", type=float,
+                         help="Fail when p50 latency exceeds the baseline's by this factor")
+    compare.add_argument("--env", action="append", default=[], help="KEY=VALUE environment override")
+    compare.add_argument("--report", type=str, help="Write the JSON report here as well as stdout")
+
+    # Everything after `--` is passed to clip_search.py --serve; anything unknown before it is an error
+    argv = sys.argv[1:] if argv is None else list(argv)
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+    args.search_args = argv[split + 1:]
+    return args
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+def run_queries(requests, search_args, env, repeats):
+    """Run every request `repeats` times in one serve worker; return result ids, median latency and errors"""
+    saved_env = dict(os.environ)
+    os.environ.update(env)
+    try:
+        with SearchWorkerPool(1, extra_args=search_args) as pool:
+            runs = []
+            for request in requests:
+                timed = []
+                for _ in range(max(1, repeats)):
+                    started = time.perf_counter()
+                    timed.append((pool.search(request), time.perf_counter() - started))
+                response = timed[-1][0]
+                latencies = [latency for _, latency in timed]
+                runs.append({
+                    "request": request,
+                    "ids": [str(item["id"]) for item in response.get("results", [])],
+                    "error": response.get("error"),
+                    "latency_s": float(np.median(latencies)),
+                })
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+    return runs
+
+def recall_at_k(golden_ids, ids, k):
+    golden = set(golden_ids[:k])
+    if not golden:
+        return 1.0
+    return len(golden & set(ids[:k])) / len(golden)
+
+def ndcg_at_k(golden_ids, ids, k):
+    """NDCG with graded relevance taken from the golden ranking (rank 1 is worth k, rank k is worth 1)"""
+    relevance = {item_id: k - rank for rank, item_id in enumerate(golden_ids[:k])}
+    ideal = sum(relevance[item_id] / math.log2(rank + 2) for rank, item_id in enumerate(golden_ids[:k]))
+    if ideal == 0:
+        return 1.0
+    dcg = sum(relevance.get(item_id, 0) / math.log2(rank + 2) for rank, item_id in enumerate(ids[:k]))
+    return dcg / ideal
+
+def latency_summary(runs):
+    return percentile_summary([run["latency_s"] for run in runs if not run["error"]])
+
+def record(args):
+    requests = load_requests(args.query_file, args.image_dir, args.top_k, args.max_images)
+    env = parse_env(args.env)
+    print(f"Recording {len(requests)} queries...", file=sys.stderr)
+    runs = run_queries(requests, args.search_args, env, args.repeats)
+
+    golden = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "top_k": args.top_k,
+        "config": {"search_args": args.search_args, "env": env},
+        "latency_ms": latency_summary(runs),
+        "queries": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(golden, f, indent=2)
+
+    errors = sum(1 for run in runs if run["error"])
+    print(f"Saved {len(runs)} queries ({errors} errors) to {args.output}", file=sys.stderr)
+    return 0
+
+def compare(args):
+    with open(args.baseline) as f:
+        golden = json.load(f)
+    k = golden["top_k"]
+    env = parse_env(args.env)
+
+    print(f"Running {len(golden['queries'])} queries against the candidate configuration...", file=sys.stderr)
+    runs = run_queries([query["request"] for query in golden["queries"]], args.search_args, env, args.repeats)
+
+    per_query = []
+    for expected, actual in zip(golden["queries"], runs):
+        # Queries that failed when the baseline was recorded carry no ground truth
+        if expected["error"]:
+            continue
+        entry = {"request": expected["request"], "error": actual["error"],
+                 "latency_delta_ms": (actual["latency_s"] - expected["latency_s"]) * 1000.0}
+        if actual["error"]:
+            entry.update(recall=0.0, ndcg=0.0)
+        else:
+            entry.update(recall=recall_at_k(expected["ids"], actual["ids"], k),
+                         ndcg=ndcg_at_k(expected["ids"], actual["ids"], k))
+        per_query.append(entry)
+
+    mean_recall = float(np.mean([q["recall"] for q in per_query])) if per_query else 1.0
+    mean_ndcg = float(np.mean([q["ndcg"] for q in per_query])) if per_query else 1.0
+    baseline_latency = golden["latency_ms"]
+    candidate_latency = latency_summary(runs)
+
+    failures = []
+    if mean_recall < args.min_recall:
+        failures.append(f"mean recall@{k} {mean_recall:.4f} < {args.min_recall}")
+    if mean_ndcg < args.min_ndcg:
+        failures.append(f"mean NDCG@{k} {mean_ndcg:.4f} < {args.min_ndcg}")
+    errors = sum(1 for q in per_query if q["error"])
+    if errors:
+        failures.append(f"{errors} queries failed that succeeded in the baseline")
+    latency_ratio = None
+    if baseline_latency["p50"] and candidate_latency["p50"]:
+        latency_ratio = candidate_latency["p50"] / baseline_latency["p50"]
+        if args.max_latency_ratio and latency_ratio > args.max_latency_ratio:
+            failures.append(f"p50 latency {latency_ratio:.2f}x baseline > {args.max_latency_ratio}x")
+
+    report = {
+        "baseline": args.baseline,
+        "config": {"search_args": args.search_args, "env": env},
+        "top_k": k,
+        "queries": len(per_query),
+        "recall_at_k": mean_recall,
+        "ndcg_at_k": mean_ndcg,
+        "min_recall_at_k": min((q["recall"] for q in per_query), default=1.0),
+        "latency_ms": {
+            "baseline": baseline_latency,
+            "candidate": candidate_latency,
+            "p50_ratio": latency_ratio,
+        },
+        # The queries that moved the most, to start an investigation from
+        "worst_queries": sorted(per_query, key=lambda q: (q["recall"], q["ndcg"]))[:5],
+        "passed": not failures,
+        "failures": failures,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output + "\n")
+
+    if failures:
+        print("Quality gate FAILED:", file=sys.stderr)
+        for failure in failures:
+            print(f"  - {failure}", file=sys.stderr)
+        return 1
+    print(f"Quality gate passed: recall@{k} {mean_recall:.4f}, NDCG@{k} {mean_ndcg:.4f}", file=sys.stderr)
+    return 0
+
+def main():
+    args = parse_args()
+    try:
+        if args.command == "record":
+            sys.exit(record(args))
+        sys.exit(compare(args))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
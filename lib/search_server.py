@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Asyncio Fashion Search Server
+
+Serves clip_search over a small HTTP/1.1 API so I/O overlaps with CPU work:
+
+  - image decode, CLIP preprocessing and colour extraction run in a process pool
+  - CLIP inference and FAISS search run on the micro-batcher's dedicated thread
+  - bounded in-flight and decode queues reject with 429 when saturated
+  - every request has a deadline (504 when exceeded)
+
+Endpoints:
+  POST /search   JSON request (same fields as clip_search.py --serve, images as
+                 "image_base64" or an "image_shm" segment name), or a raw image
+                 body (Content-Type: image/*) with search_type, query, top_k and
+                 dominant_colors passed in the query string
+  GET  /health   load, queue and memory status
+  GET  /metrics  per-stage latency histograms (Prometheus text format)
+
+Requests with "paginate": true get a "cursor" token back; POSTing {"cursor": token}
+returns the next page from the candidates kept for it, without re-encoding the
+query. Cursors belong to the worker that served the first page: with --workers
+N a cursor reaching another worker gets a 404 and the client searches again.
+
+Requests with "timings": true get a per-stage breakdown in milliseconds. With
+--workers N each worker keeps its own histograms, labelled with its pid.
+
+With --workers N the server pre-forks: the parent loads the CLIP model, FAISS
+index and (memory-mapped) embedding matrix once, then forks N workers that share
+those pages copy-on-write and accept on the same listening socket.
+
+A newly published artifact version (generate_embeddings.py --publish) is loaded
+in the background and swapped in between micro-batches; each pre-forked worker
+loads its own copy.
+
+--extra-models loads more CLIP models beside --model, each with its own
+artifacts; a request's "model" picks one (for A/B latency and quality
+comparisons) and images are preprocessed for the model they are sent to.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import torch
+
+import clip_search
+from search_workers import available_cpus, split_cores
+
+# Largest request body we accept (uploads included)
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    504: "Gateway Timeout",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Asyncio fashion search server")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--decode-workers", type=int, default=2, help="Processes for image decode and preprocessing")
+    parser.add_argument("--max-inflight", type=int, default=64, help="Requests accepted at once before replying 429")
+    parser.add_argument("--max-decode-queue", type=int, default=16, help="Image decodes queued at once before replying 429")
+    parser.add_argument("--deadline-ms", type=float, default=10000.0, help="Default per-request deadline")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Largest inference micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="How long to wait for a micro-batch to fill")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Pre-fork this many workers sharing one copy of the model and index")
+    parser.add_argument("--pin-workers", action="store_true", help="Give each pre-forked worker its own slice of cores")
+    parser.add_argument("--model", type=str, default=clip_search.CLIP_MODEL,
+                        help="CLIP model requests use unless they name another (env: CLIP_MODEL)")
+    parser.add_argument("--extra-models", type=str, default=clip_search.EXTRA_MODELS,
+                        help="Comma-separated models to load as well, chosen by a request's \"model\" "
+                             "(env: CLIP_EXTRA_MODELS)")
+    parser.add_argument("--reload-interval", type=float, default=clip_search.RELOAD_INTERVAL,
+                        help="Check for a newly published artifact version this often, in seconds "
+                             "(0 disables; env: CLIP_RELOAD_INTERVAL)")
+    parser.add_argument("--no-stage-metrics", action="store_true",
+                        help="Don't trace every request for /metrics (timings are still returned on request)")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+class RequestError(Exception):
+    """An error that maps directly to an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# Set in each decode worker process by init_decode_worker: preprocess per model name (None for --model)
+_decode_preprocess = {}
+
+def init_decode_worker(preprocess, model_preprocess=None):
+    """Process pool initializer: keep CLIP's preprocess (and the extra models') and stay single-threaded"""
+    global _decode_preprocess
+    _decode_preprocess = dict(model_preprocess or {})
+    _decode_preprocess[None] = preprocess
+    torch.set_num_threads(1)
+
+def decode_query_image(image_source, extract_colors=True, model=None):
+    """Decode (once) and preprocess a query image in a worker process"""
+    image = clip_search.load_query_image(image_source)
+    tensor = _decode_preprocess[model](image).numpy()
+
+    dominant_colors = None
+    if extract_colors:
+        dominant_colors = clip_search.extract_dominant_colors(image)
+    return tensor, dominant_colors
+
+class SearchServer:
+    """Admission control, deadlines and executor hand-off around a MicroBatcher"""
+
+    def __init__(self, batcher, preprocess, decode_workers=2, max_inflight=64, max_decode_queue=16,
+                 deadline_ms=10000.0, stage_metrics=True, quiet=False):
+        self.batcher = batcher
+        self.histograms = clip_search.StageHistograms(labels={"pid": os.getpid()}) if stage_metrics else None
+        self.max_inflight = max_inflight
+        self.max_decode_queue = max_decode_queue
+        self.deadline = deadline_ms / 1000.0
+        self.quiet = quiet
+        self.inflight = 0
+        self.decoding = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.decode_pool = ProcessPoolExecutor(
+            max_workers=decode_workers,
+            initializer=init_decode_worker,
+            initargs=(preprocess, {name: search_args[1] for name, search_args in batcher.models.items()})
+        )
+
+    def close(self):
+        self.decode_pool.shutdown(wait=False, cancel_futures=True)
+        self.batcher.close()
+
+    def health(self):
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "memory": clip_search.process_memory(),
+            "inflight": self.inflight,
+            "decoding": self.decoding,
+            "rejected": self.rejected,
+            "timedOut": self.timed_out,
+            "meanBatchSize": self.batcher.mean_batch_size,
+            "artifactVersion": self.batcher.reloader.version if self.batcher.reloader else None,
+            "models": [clip_search.CLIP_MODEL] + list(self.batcher.models),
+            "cursors": len(clip_search.cursor_store()),
+        }
+
+    async def search(self, request):
+        """Run one search request under admission control and its deadline"""
+        if self.inflight >= self.max_inflight:
+            self.rejected += 1
+            raise RequestError(429, "Server is saturated, retry later")
+
+        try:
+            clip_search.validate_request(request)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        # Cursors live in the worker that served the first page; elsewhere the client starts over
+        if request.get("cursor") is not None and request["cursor"] not in clip_search.cursor_store():
+            raise RequestError(404, "Unknown or expired cursor")
+        model = clip_search.request_model(request)
+        if model is not None and model not in self.batcher.models:
+            raise RequestError(400, f"Model {model} is not loaded")
+
+        deadline_s = float(request.get("deadline_ms") or self.deadline * 1000.0) / 1000.0
+        deadline = time.monotonic() + deadline_s
+
+        # Trace every request feeding the histograms, or only those asking for timings
+        trace = None
+        if self.histograms is not None or request.get("timings"):
+            trace = clip_search.Trace()
+        started = time.perf_counter()
+
+        self.inflight += 1
+        try:
+            output = await asyncio.wait_for(self._search(request, deadline, trace, model), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise RequestError(504, "Request deadline exceeded")
+        finally:
+            self.inflight -= 1
+
+        if trace is not None:
+            trace.add("total", time.perf_counter() - started)
+            if self.histograms is not None:
+                self.histograms.observe_trace(trace)
+            if request.get("timings"):
+                output["timings"] = trace.timings_ms()
+        return output
+
+    async def _search(self, request, deadline, trace=None, model=None):
+        loop = asyncio.get_running_loop()
+        prepared = None
+
+        # Only image searches touch the decode pool, so slow decodes never hold up text queries
+        if request.get("cursor") is None and request["search_type"] in ("image", "multimodal"):
+            if self.decoding >= self.max_decode_queue:
+                self.rejected += 1
+                raise RequestError(429, "Image decode queue is full, retry later")
+
+            self.decoding += 1
+            decode_started = time.perf_counter()
+            try:
+                # Base64 and shared-memory uploads are read in the worker too, off the event loop
+                image_source = {field: request[field] for field in clip_search.IMAGE_SOURCE_FIELDS + ["image_size"]
+                                if request.get(field) is not None}
+                tensor, dominant_colors = await loop.run_in_executor(
+                    self.decode_pool, decode_query_image, image_source, not request.get("dominant_colors"), model
+                )
+            except Exception as e:
+                raise RequestError(400, f"Could not decode image: {e}")
+            finally:
+                self.decoding -= 1
+                if trace is not None:
+                    trace.add("image_decode", time.perf_counter() - decode_started)
+
+            # Colours are None when the request brought its own, which search_batch then uses
+            prepared = {"image_tensor": torch.from_numpy(tensor), "dominant_colors": dominant_colors}
+
+        future = self.batcher.submit(request, prepared, deadline, trace)
+        try:
+            return await asyncio.wrap_future(future)
+        except TimeoutError:
+            self.timed_out += 1
+            raise RequestError(504, "Request deadline exceeded")
+
+    async def dispatch(self, method, target, headers, body):
+        """Route one HTTP request and return (status, payload dict)"""
+        url = urlsplit(target)
+
+        if url.path == "/health" and method == "GET":
+            return 200, self.health()
+        if url.path == "/metrics" and method == "GET":
+            if self.histograms is None:
+                return 404, {"error": "Stage metrics are disabled"}
+            return 200, self.histograms.render()
+
+        if url.path != "/search":
+            return 404, {"error": f"Unknown endpoint: {url.path}"}
+        if method != "POST":
+            return 400, {"error": "Use POST for /search"}
+
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("image/"):
+            # Raw upload: the body is the image, everything else is in the query string
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            request = dict(params, image_bytes=body)
+            request.setdefault("search_type", "image")
+        else:
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError as e:
+                return 400, {"error": f"Invalid JSON body: {e}"}
+            if not isinstance(request, dict):
+                return 400, {"error": "Request body must be a JSON object"}
+            request.pop("image_bytes", None)
+
+        try:
+            return 200, await self.search(request)
+        except RequestError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            if not self.quiet:
+                print(f"Error handling request: {str(e)}", file=sys.stderr)
+            return 500, {"error": str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one keep-alive connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split()
+                except ValueError:
+                    await write_response(writer, 400, {"error": "Malformed request line"}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await write_response(writer, 413, {"error": "Request body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, target, headers, body)
+                close = headers.get("connection", "").lower() == "close"
+                await write_response(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+async def write_response(writer, status, payload, close=False):
+    """Write a JSON HTTP response (plain text when the payload is already a string)"""
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4"
+    else:
+        body = json.dumps(payload).encode("utf-8")
+        content_type = "application/json"
+    head = (
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'close' if close else 'keep-alive'}\r\n"
+    )
+    if status == 429:
+        head += "Retry-After: 1\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+    await writer.drain()
+
+async def run_server(server, host=None, port=None, sock=None, quiet=False):
+    if sock is not None:
+        listener = await asyncio.start_server(server.handle_connection, sock=sock)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+    if not quiet:
+        print(f"Search server listening on http://{host}:{port} (pid {os.getpid()})", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+def run_worker(worker_id, listener, model, preprocess, index, df, image_embeddings, device, args, cpus=None,
+               models=None):
+    """Body of one pre-forked worker: its own batcher thread and decode pool over the shared data"""
+    if cpus:
+        threads = len(cpus)
+        clip_search.configure_threads(threads, 1, threads, ",".join(str(cpu) for cpu in cpus), args.quiet)
+
+    # Threads don't survive fork, so the batcher, reloader and decode pool are created per worker
+    reloader = clip_search.artifact_reloader(args.reload_interval, quiet=args.quiet)
+    batcher = clip_search.MicroBatcher(model, preprocess, index, df, image_embeddings, device,
+                                       args.max_batch_size, args.max_wait_ms, args.quiet, reloader,
+                                       models, model_reloaders(models, args))
+    server = SearchServer(batcher, preprocess, args.decode_workers, args.max_inflight,
+                          args.max_decode_queue, args.deadline_ms, not args.no_stage_metrics, args.quiet)
+    if not args.quiet:
+        print(f"Worker {worker_id} (pid {os.getpid()}) ready, memory: {clip_search.process_memory()}", file=sys.stderr)
+    try:
+        asyncio.run(run_server(server, sock=listener, quiet=True))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+def model_reloaders(models, args):
+    """An ArtifactReloader per extra model (None where reloading is off)"""
+    return {name: clip_search.artifact_reloader(args.reload_interval, quiet=args.quiet, model_name=name)
+            for name in models or {}}
+
+def serve_prefork(args, model, preprocess, index, df, image_embeddings, device, models=None):
+    """Fork workers that share the parent's models, indexes and embeddings"""
+    # Put the weights in shared memory so they stay shared even if a worker touches their pages
+    model.share_memory()
+    for search_args in (models or {}).values():
+        search_args[0].share_memory()
+
+    listener = socket.create_server((args.host, args.port), backlog=1024)
+
+    # Keep the garbage collector from writing to (and so un-sharing) everything loaded so far
+    gc.freeze()
+
+    cpu_slices = split_cores(available_cpus(), args.workers) if args.pin_workers else [None] * args.workers
+    children = {}
+    for worker_id, cpus in enumerate(cpu_slices):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(worker_id, listener, model, preprocess, index, df, image_embeddings, device, args, cpus,
+                           models)
+            except Exception as e:
+                print(f"Worker {worker_id} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = worker_id
+
+    # The workers own the listening socket now
+    listener.close()
+    if not args.quiet:
+        print(f"Search server listening on http://{args.host}:{args.port} with {args.workers} workers "
+              f"(parent pid {os.getpid()}, memory: {clip_search.process_memory()})", file=sys.stderr)
+
+    def stop_workers(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        if not args.quiet and worker_id is not None:
+            print(f"Worker {worker_id} (pid {pid}) exited", file=sys.stderr)
+
+def main():
+    args = parse_args()
+
+    # Thread pools and affinity come from the CLIP_* environment variables
+    clip_search.configure_threads(
+        clip_search.env_int("CLIP_TORCH_THREADS"), clip_search.env_int("CLIP_TORCH_INTEROP_THREADS"),
+        clip_search.env_int("CLIP_FAISS_THREADS"), os.environ.get("CLIP_CPU_AFFINITY"), args.quiet
+    )
+
+    if args.model != clip_search.CLIP_MODEL:
+        clip_search.use_model(args.model)
+    model, preprocess, index, df, image_embeddings, device = clip_search.load_model_and_data(args.quiet)
+    try:
+        models = clip_search.load_extra_models(clip_search.parse_list(args.extra_models), quiet=args.quiet)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error loading extra models: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.workers > 1:
+        if not hasattr(os, "fork"):
+            print("Error: --workers needs os.fork (not available on this platform)", file=sys.stderr)
+            sys.exit(1)
+        serve_prefork(args, model, preprocess, index, df, image_embeddings, device, models)
+        return
+
+    reloader = clip_search.artifact_reloader(args.reload_interval, quiet=args.quiet)
+    batcher = clip_search.MicroBatcher(model, preprocess, index, df, image_embeddings, device,
+                                       args.max_batch_size, args.max_wait_ms, args.quiet, reloader,
+                                       models, model_reloaders(models, args))
+    server = SearchServer(batcher, preprocess, args.decode_workers, args.max_inflight,
+                          args.max_decode_queue, args.deadline_ms, not args.no_stage_metrics, args.quiet)
+    try:
+        asyncio.run(run_server(server, args.host, args.port, quiet=args.quiet))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
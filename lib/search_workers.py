@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Search Worker Pool Launcher
+
+Starts N long-running clip_search.py workers (--serve mode), splits the machine's
+cores between them so torch and FAISS don't oversubscribe, and dispatches
+newline-delimited JSON search requests to the least busy worker.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clip_search.py')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Launch a pool of pinned clip_search workers")
+    parser.add_argument("--workers", type=int, default=1, help="Number of search workers")
+    parser.add_argument("--cpus", type=str, help="Cores to split between workers, e.g. '0-7' (default: all)")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="Seconds to wait for workers to load")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def available_cpus():
+    """Return the cores this process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def split_cores(cpus, num_workers):
+    """Split a list of core ids into num_workers contiguous, near-equal slices"""
+    if num_workers > len(cpus):
+        # More workers than cores: give each worker a single shared core
+        return [[cpus[i % len(cpus)]] for i in range(num_workers)]
+
+    base, extra = divmod(len(cpus), num_workers)
+    slices = []
+    start = 0
+    for i in range(num_workers):
+        size = base + (1 if i < extra else 0)
+        slices.append(cpus[start:start + size])
+        start += size
+    return slices
+
+class SearchWorker:
+    """A clip_search.py --serve subprocess pinned to a slice of cores"""
+
+    def __init__(self, worker_id, cpus, extra_args=None, quiet=True):
+        self.worker_id = worker_id
+        self.cpus = cpus
+        self.pending = {}
+        self.ready = threading.Event()
+        self.info = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        threads = str(len(cpus))
+        command = [
+            sys.executable, SCRIPT_PATH, "--serve",
+            "--cpu-affinity", ",".join(str(cpu) for cpu in cpus),
+            "--torch-threads", threads,
+            "--torch-interop-threads", "1",
+            "--faiss-threads", threads,
+        ]
+        if quiet:
+            command.append("--quiet")
+        command.extend(extra_args or [])
+
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, bufsize=1)
+        # Both are pipes, as requested above
+        assert self.process.stdin is not None and self.process.stdout is not None
+        self.stdin = self.process.stdin
+        self.stdout = self.process.stdout
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    @property
+    def load(self):
+        """Number of requests sent to this worker that have not been answered yet"""
+        return len(self.pending)
+
+    def _read_responses(self):
+        for line in self.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+
+            if response.get("ready"):
+                self.info = response
+                self.ready.set()
+                continue
+
+            with self._lock:
+                future = self.pending.pop(response.get("id"), None)
+            if future is not None:
+                future.set_result(response)
+
+        # The worker exited: fail everything still waiting on it
+        self.ready.set()
+        with self._lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for future in pending:
+            future.set_exception(RuntimeError(f"Search worker {self.worker_id} exited"))
+
+    def submit(self, request_id, request):
+        """Send a request to the worker and return a Future for its response"""
+        future = Future()
+        with self._lock:
+            self.pending[request_id] = future
+
+        payload = dict(request, id=request_id)
+        try:
+            with self._write_lock:
+                self.stdin.write(json.dumps(payload) + "\n")
+                self.stdin.flush()
+        except OSError:
+            # The worker has exited; don't leave the future counting towards its load
+            with self._lock:
+                failed = self.pending.pop(request_id, None)
+            # Unless the reader saw the exit first and already failed it
+            if failed is not None:
+                failed.set_exception(RuntimeError(f"Search worker {self.worker_id} exited"))
+        return future
+
+    def close(self, timeout=10.0):
+        """Close stdin so the worker exits after finishing outstanding requests"""
+        try:
+            self.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+class SearchWorkerPool:
+    """N pinned search workers with least-loaded dispatch"""
+
+    def __init__(self, num_workers, cpus=None, extra_args=None, startup_timeout=300.0, quiet=True):
+        cpus = cpus or available_cpus()
+        self.workers = [
+            SearchWorker(i, worker_cpus, extra_args, quiet)
+            for i, worker_cpus in enumerate(split_cores(cpus, num_workers))
+        ]
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        for worker in self.workers:
+            if not worker.ready.wait(startup_timeout) or worker.info is None:
+                self.close()
+                raise RuntimeError(f"Search worker {worker.worker_id} failed to start")
+
+    def submit(self, request):
+        """Dispatch a request to the least busy worker and return a Future for its response"""
+        with self._lock:
+            request_id = next(self._ids)
+            worker = min(self.workers, key=lambda w: w.load)
+        return worker.submit(request_id, request)
+
+    def search(self, request, timeout=None):
+        """Dispatch a request and wait for its response"""
+        return self.submit(request).result(timeout)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    args = parse_args()
+
+    cpus = None
+    if args.cpus:
+        from clip_search import parse_cpu_list
+        cpus = parse_cpu_list(args.cpus)
+
+    pool = SearchWorkerPool(args.workers, cpus, startup_timeout=args.startup_timeout, quiet=args.quiet)
+    if not args.quiet:
+        for worker in pool.workers:
+            print(f"Worker {worker.worker_id} (pid {worker.process.pid}) pinned to cores {worker.cpus}", file=sys.stderr)
+
+    # Proxy stdin requests to the pool, writing responses as they complete
+    write_lock = threading.Lock()
+    futures = []
+
+    def write_response(future, caller_id):
+        try:
+            response = future.result()
+        except Exception as e:
+            response = {"error": str(e)}
+        response.pop("id", None)
+        if caller_id is not None:
+            response["id"] = caller_id
+        with write_lock:
+            sys.stdout.write(json.dumps(response) + "\n")
+            sys.stdout.flush()
+
+    with pool:
+        sys.stdout.write(json.dumps({"ready": True, "workers": len(pool.workers)}) + "\n")
+        sys.stdout.flush()
+
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as e:
+                with write_lock:
+                    sys.stdout.write(json.dumps({"error": f"Invalid request: {e}"}) + "\n")
+                    sys.stdout.flush()
+                continue
+
+            future = pool.submit(request)
+            future.add_done_callback(lambda f, caller_id=request.get("id"): write_response(f, caller_id))
+            futures.append(future)
+
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+FAISS Shard Server
+
+Serves one shard written by generate_embeddings.py --num-shards over a tiny
+newline-delimited JSON protocol on a TCP socket. The clip_search coordinator
+fans query embeddings out to every shard and merges the top-k exactly.
+
+Request:  {"id": 1, "k": 10, "count": 2, "dim": 512, "vectors": <base64 float32>}
+Response: {"id": 1, "count": 2, "k": 10, "distances": <base64 float32>, "indices": <base64 int64>}
+
+Indices are positions within the shard; the coordinator adds the shard's offset.
+Use --local with a manifest to start one process per shard on consecutive ports,
+standing in for separate nodes.
+"""
+
+import argparse
+import base64
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a FAISS index shard")
+    parser.add_argument("--shard-dir", type=str, help="Shard directory containing fashion_faiss.index")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9100, help="Port to listen on")
+    parser.add_argument("--manifest", type=str, help="With --local: shard manifest written by generate_embeddings.py")
+    parser.add_argument("--local", action="store_true", help="Start one shard server process per manifest entry")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Artificial delay per request (for timeout testing)")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def encode_array(array, dtype):
+    """Encode a numpy array as base64 of its raw bytes"""
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode("ascii")
+
+def decode_array(data, dtype, shape):
+    """Decode base64 raw bytes back into a numpy array"""
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).reshape(shape)
+
+def load_manifest(manifest_path):
+    """Load a shard manifest and resolve shard paths relative to it"""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    for shard in manifest["shards"]:
+        shard["path"] = os.path.join(base, shard["path"])
+    return manifest
+
+def default_addresses(num_shards, host="127.0.0.1", base_port=9100):
+    """Addresses used by --local: consecutive ports starting at base_port"""
+    return [(host, base_port + i) for i in range(num_shards)]
+
+class ShardHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        assert isinstance(server, ShardServer)
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if server.delay:
+                    time.sleep(server.delay)
+                count, dim, k = int(request["count"]), int(request["dim"]), int(request["k"])
+                vectors = decode_array(request["vectors"], np.float32, (count, dim))
+                distances, indices = server.index.search(vectors, k)
+                response = {
+                    "id": request.get("id"),
+                    "count": count,
+                    "k": k,
+                    "distances": encode_array(distances, np.float32),
+                    "indices": encode_array(indices, np.int64),
+                }
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+class ShardServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, index, delay_ms=0.0):
+        super().__init__(address, ShardHandler)
+        self.index = index
+        self.delay = delay_ms / 1000.0
+
+def serve_shard(shard_dir, host, port, delay_ms=0.0, quiet=False):
+    import faiss
+
+    index = faiss.read_index(os.path.join(shard_dir, "fashion_faiss.index"))
+    server = ShardServer((host, port), index, delay_ms)
+    if not quiet:
+        print(f"Shard {shard_dir} ({index.ntotal} vectors) listening on {host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def launch_local(manifest_path, host, base_port, delay_ms=0.0, quiet=False):
+    """Start one shard server process per shard, standing in for separate nodes"""
+    manifest = load_manifest(manifest_path)
+    processes = []
+    for shard, (shard_host, port) in zip(manifest["shards"], default_addresses(len(manifest["shards"]), host, base_port)):
+        command = [sys.executable, os.path.abspath(__file__), "--shard-dir", shard["path"],
+                   "--host", shard_host, "--port", str(port), "--delay-ms", str(delay_ms)]
+        if quiet:
+            command.append("--quiet")
+        processes.append(subprocess.Popen(command))
+
+    addresses = ",".join(f"{shard_host}:{port}" for shard_host, port in default_addresses(len(processes), host, base_port))
+    print(f"CLIP_SHARD_ADDRESSES={addresses}", flush=True)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+def main():
+    args = parse_args()
+
+    if args.local:
+        if not args.manifest:
+            print("Error: --local requires --manifest", file=sys.stderr)
+            sys.exit(1)
+        launch_local(args.manifest, args.host, args.port, args.delay_ms, args.quiet)
+        return
+
+    if not args.shard_dir:
+        print("Error: --shard-dir is required", file=sys.stderr)
+        sys.exit(1)
+    serve_shard(args.shard_dir, args.host, args.port, args.delay_ms, args.quiet)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Similar Items Table
+
+Precomputes the top-K nearest catalogue items for every product so "more like
+this" on a product page is a direct lookup (clip_search.py --search-type similar
+--product-id ID) instead of decoding and re-encoding an image we already have
+an embedding for.
+
+Searches the stored image matrix against the FAISS index in batches and writes,
+next to image_ids.npy:
+
+  similar_neighbors.npy   int32 [N, K] row positions of each item's neighbours (-1 padded)
+  similar_scores.npy      float16 [N, K] their similarity (1 - L2 distance, as in search results;
+                          0 in padded slots)
+
+When near_duplicates.py has been run, neighbours are diversified the same way
+search results are, and the item's own cluster is left out: its slot may hold
+a near-duplicate standing in for the item, not the item itself.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import faiss
+
+from artifact_versions import resolve_artifact_dir, save_array
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute similar items for every catalogue product")
+    parser.add_argument("--embeddings-path", type=str, required=True, help="Embeddings directory (the live version is used if it holds published versions)")
+    parser.add_argument("--k", type=int, default=20, help="Neighbours stored per item")
+    parser.add_argument("--block-size", type=int, default=4096, help="Items searched per batch")
+    parser.add_argument("--no-diversify", action="store_true",
+                        help="Ignore duplicate_clusters.npy and keep near-duplicates as neighbours")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def neighbour_table(matrix, index, k=20, block_size=4096, quiet=False, clusters=None):
+    """Return (neighbors int32 [N, k], scores float16 [N, k]) excluding each item and its duplicate cluster
+
+    Slots an item has no neighbour for hold -1 with score 0.
+    """
+    count = len(matrix)
+    neighbors = np.full((count, k), -1, dtype=np.int32)
+    scores = np.zeros((count, k), dtype=np.float16)
+
+    for start in range(0, count, block_size):
+        block = np.ascontiguousarray(matrix[start:start + block_size], dtype=np.float32)
+        rows = np.arange(start, start + len(block))
+        distances, labels = index.search(block, k + 1)
+
+        # A diversified index returns at most one member of the item's own cluster, and it
+        # need not be the item itself (exact duplicates can outrank it too)
+        keep = (labels >= 0) & (labels != rows[:, None])
+        if clusters is not None:
+            keep &= np.asarray(clusters)[np.maximum(labels, 0)] != np.asarray(clusters)[rows][:, None]
+        # Kept hits to the front in rank order, then the first k of them
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+        kept = np.take_along_axis(keep, order, axis=1)
+        neighbors[rows] = np.where(kept, np.take_along_axis(labels, order, axis=1), -1)
+        scores[rows] = np.where(kept, 1.0 - np.take_along_axis(distances, order, axis=1), 0.0)
+        if not quiet:
+            print(f"  {min(start + block_size, count)}/{count} items", file=sys.stderr)
+
+    return neighbors, scores
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    # Write next to the live version's index when builds are published as versions
+    args.embeddings_path = resolve_artifact_dir(args.embeddings_path)
+
+    matrix = np.load(os.path.join(args.embeddings_path, "image_matrix.npy"), mmap_mode="r")
+    index = faiss.read_index(os.path.join(args.embeddings_path, "fashion_faiss.index"))
+    if index.ntotal != len(matrix):
+        print(f"Error: index has {index.ntotal} vectors, image_matrix.npy has {len(matrix)}", file=sys.stderr)
+        sys.exit(1)
+
+    clusters_path = os.path.join(args.embeddings_path, "duplicate_clusters.npy")
+    diversified = not args.no_diversify and os.path.exists(clusters_path)
+    clusters = None
+    if diversified:
+        from clip_search import DiversifiedIndex
+        clusters = np.load(clusters_path, mmap_mode="r")
+        index = DiversifiedIndex(index, clusters)
+
+    k = min(args.k, len(matrix) - 1)
+    if not args.quiet:
+        print(f"Computing {k} neighbours for {len(matrix)} items...", file=sys.stderr)
+    neighbors, scores = neighbour_table(matrix, index, k, args.block_size, args.quiet, clusters)
+
+    save_array(os.path.join(args.embeddings_path, "similar_neighbors.npy"), neighbors)
+    save_array(os.path.join(args.embeddings_path, "similar_scores.npy"), scores)
+
+    summary = {
+        "items": int(len(matrix)),
+        "k": int(k),
+        "diversified": diversified,
+        "bytes": int(neighbors.nbytes + scores.nbytes),
+        "elapsed_s": time.perf_counter() - started,
+    }
+    with open(os.path.join(args.embeddings_path, "similar_items.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Stub CLIP Encoder
+
+A drop-in stand-in for the `clip` package (load, tokenize, available_models)
+used by the benchmarks to run the full pipeline quickly and offline. Images
+are average-pooled and pushed through a fixed random projection, text tokens
+are hashed into a fixed random embedding table, so outputs are deterministic
+and shaped like the named CLIP model (512 dims for ViT-B/32) but carry no
+meaning across modalities. Each model name gets its own projections.
+
+bench_search.py pipeline --encoder stub puts a `clip.py` shim re-exporting
+this module first on PYTHONPATH for the processes it starts.
+"""
+
+import zlib
+
+import torch
+import torch.nn.functional as F
+from torchvision.transforms import Compose, InterpolationMode, Normalize, Resize, ToTensor
+
+# Output dimension and projection seed per model name
+STUB_MODELS = {
+    "ViT-B/32": (512, 0),
+    "ViT-B/16": (512, 1),
+    "ViT-L/14": (768, 2),
+    "RN50": (1024, 3),
+}
+CONTEXT_LENGTH = 77
+VOCAB_SIZE = 8192
+INPUT_RESOLUTION = 224
+POOL_SIZE = 8
+
+# CLIP's own normalization constants, so preprocessed tensors look the same
+MEAN = (0.48145466, 0.4578275, 0.40821073)
+STD = (0.26862954, 0.26130258, 0.27577711)
+
+class StubCLIP(torch.nn.Module):
+    """Fixed random projections with the encode_image/encode_text interface of CLIP"""
+
+    image_projection: torch.Tensor
+    token_embedding: torch.Tensor
+
+    def __init__(self, embed_dim=512, seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.register_buffer("image_projection",
+                             torch.randn(3 * POOL_SIZE * POOL_SIZE, embed_dim, generator=generator))
+        self.register_buffer("token_embedding", torch.randn(VOCAB_SIZE, embed_dim, generator=generator))
+
+    def encode_image(self, images):
+        pooled = F.adaptive_avg_pool2d(images.float(), POOL_SIZE).flatten(1)
+        return pooled @ self.image_projection
+
+    def encode_text(self, tokens):
+        mask = (tokens != 0).unsqueeze(-1).float()
+        summed = (self.token_embedding[tokens % VOCAB_SIZE] * mask).sum(dim=1)
+        return summed / mask.sum(dim=1).clamp(min=1.0)
+
+def _convert_image_to_rgb(image):
+    return image.convert("RGB")
+
+def stub_preprocess():
+    """Resize to 224x224 and normalize like CLIP's preprocess (a torchvision Compose, picklable for process pools)"""
+    return Compose([
+        _convert_image_to_rgb,
+        Resize((INPUT_RESOLUTION, INPUT_RESOLUTION), interpolation=InterpolationMode.BICUBIC),
+        ToTensor(),
+        Normalize(MEAN, STD),
+    ])
+
+def available_models():
+    return list(STUB_MODELS)
+
+def load(name="ViT-B/32", device="cpu", jit=False):
+    """Return (model, preprocess) like clip.load for one of STUB_MODELS"""
+    if name not in STUB_MODELS:
+        raise RuntimeError(f"Model {name} not found; available models = {available_models()}")
+    return StubCLIP(*STUB_MODELS[name]).to(device).eval(), stub_preprocess()
+
+def tokenize(texts, context_length=CONTEXT_LENGTH, truncate=False):
+    """Hash lowercase words to token ids, zero-padded like clip.tokenize"""
+    if isinstance(texts, str):
+        texts = [texts]
+    tokens = torch.zeros(len(texts), context_length, dtype=torch.long)
+    for i, text in enumerate(texts):
+        words = text.lower().split()[:context_length]
+        for j, word in enumerate(words):
+            tokens[i, j] = zlib.crc32(word.encode("utf-8")) % (VOCAB_SIZE - 1) + 1
+    return tokens
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Synthetic Fashion Catalogue Generator
+
+Writes a dataset directory shaped like the Kaggle fashion dataset the search
+pipeline is built on: images/<id>.jpg plus a styles.csv whose columns follow
+the real value sets and rough cardinalities (5 genders, 7 master categories,
+~45 sub categories, ~140 article types, 46 base colours, 8 usages) with
+long-tailed frequencies. Images are small product-like shapes in the row's
+base colour, so colour extraction and encoders have something to work with.
+
+Generation is deterministic for a given --seed and --size, so benchmark runs
+at 10k / 100k / 1M items are reproducible across machines.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+
+# masterCategory -> subCategory -> articleTypes, following the real dataset
+CATALOGUE_TREE = {
+    "Apparel": {
+        "Topwear": ["Tshirts", "Shirts", "Tops", "Kurtas", "Sweatshirts", "Jackets", "Sweaters", "Tunics",
+                    "Blazers", "Kurtis", "Waistcoat", "Shrug", "Suits", "Rain Jacket", "Dupatta", "Nehru Jackets"],
+        "Bottomwear": ["Jeans", "Trousers", "Shorts", "Track Pants", "Capris", "Skirts", "Leggings",
+                       "Patiala", "Salwar", "Churidar", "Jeggings", "Stockings", "Tights"],
+        "Innerwear": ["Briefs", "Bra", "Innerwear Vests", "Trunk", "Boxers", "Camisoles", "Shapewear"],
+        "Dress": ["Dresses", "Jumpsuit", "Rompers"],
+        "Loungewear and Nightwear": ["Nightdress", "Night suits", "Lounge Pants", "Lounge Shorts", "Robe", "Bath Robe"],
+        "Saree": ["Sarees"],
+        "Apparel Set": ["Kurta Sets", "Clothing Set", "Swimwear"],
+        "Socks": ["Socks"],
+    },
+    "Accessories": {
+        "Watches": ["Watches"],
+        "Bags": ["Handbags", "Backpacks", "Clutches", "Duffel Bag", "Laptop Bag", "Messenger Bag",
+                 "Tablet Sleeve", "Rucksack", "Mobile Pouch", "Trolley Bag", "Waist Pouch"],
+        "Belts": ["Belts"],
+        "Wallets": ["Wallets"],
+        "Jewellery": ["Earrings", "Pendant", "Necklace and Chains", "Ring", "Bangle", "Bracelet",
+                      "Jewellery Set", "Ear Cuffs", "Anklet"],
+        "Eyewear": ["Sunglasses"],
+        "Ties": ["Ties", "Ties and Cufflinks"],
+        "Headwear": ["Caps", "Hat", "Headband"],
+        "Scarves": ["Scarves", "Stoles", "Mufflers"],
+        "Cufflinks": ["Cufflinks"],
+        "Accessories": ["Accessory Gift Set", "Key chain", "Water Bottle"],
+        "Gloves": ["Gloves"],
+        "Mufflers": ["Mufflers"],
+        "Shoe Accessories": ["Shoe Accessories", "Shoe Laces"],
+        "Sports Accessories": ["Wristbands"],
+        "Umbrellas": ["Umbrellas"],
+        "Stoles": ["Stoles"],
+        "Hair": ["Hair Accessory"],
+        "Water Bottle": ["Water Bottle"],
+    },
+    "Footwear": {
+        "Shoes": ["Casual Shoes", "Sports Shoes", "Formal Shoes", "Heels", "Flats", "Sandals", "Booties"],
+        "Flip Flops": ["Flip Flops"],
+        "Sandal": ["Sandals", "Sports Sandals"],
+    },
+    "Personal Care": {
+        "Fragrance": ["Perfume and Body Mist", "Deodorant", "Fragrance Gift Set"],
+        "Lips": ["Lipstick", "Lip Gloss", "Lip Liner", "Lip Care", "Lip Plumper"],
+        "Nails": ["Nail Polish", "Nail Essentials"],
+        "Makeup": ["Kajal and Eyeliner", "Foundation and Primer", "Highlighter and Blush", "Compact",
+                   "Mascara", "Eyeshadow", "Concealer", "Makeup Remover"],
+        "Skin Care": ["Face Moisturisers", "Face Wash and Cleanser", "Sunscreen", "Face Serum and Gel",
+                      "Mask and Peel", "Toner", "Eye Cream"],
+        "Skin": ["Body Lotion", "Body Wash and Scrub"],
+        "Bath and Body": ["Body Lotion", "Body Wash and Scrub", "Nail Essentials"],
+        "Hair": ["Hair Colour"],
+        "Beauty Accessories": ["Beauty Accessory"],
+        "Eyes": ["Kajal and Eyeliner", "Mascara", "Eyeshadow"],
+    },
+    "Free Items": {
+        "Free Gifts": ["Free Gifts", "Ipad"],
+        "Vouchers": ["Vouchers"],
+    },
+    "Sporting Goods": {
+        "Sports Equipment": ["Footballs", "Basketballs"],
+        "Wristbands": ["Wristbands"],
+    },
+    "Home": {
+        "Home Furnishing": ["Cushion Covers"],
+    },
+}
+
+# Approximate share of each masterCategory in the real dataset
+MASTER_WEIGHTS = {
+    "Apparel": 0.48, "Accessories": 0.25, "Footwear": 0.21, "Personal Care": 0.05,
+    "Free Items": 0.002, "Sporting Goods": 0.0005, "Home": 0.0001,
+}
+
+GENDER_WEIGHTS = {"Men": 0.50, "Women": 0.42, "Unisex": 0.05, "Boys": 0.02, "Girls": 0.01}
+SEASON_WEIGHTS = {"Summer": 0.48, "Fall": 0.26, "Winter": 0.19, "Spring": 0.07}
+USAGE_WEIGHTS = {"Casual": 0.78, "Sports": 0.09, "Ethnic": 0.07, "Formal": 0.05,
+                 "Smart Casual": 0.002, "Party": 0.0007, "Travel": 0.0006, "Home": 0.0001}
+YEARS = list(range(2007, 2020))
+
+# The dataset's 46 base colours with a representative RGB value for image generation
+BASE_COLOURS = {
+    "Black": (20, 20, 20), "White": (245, 245, 245), "Blue": (40, 80, 200), "Brown": (120, 72, 40),
+    "Grey": (128, 128, 128), "Red": (200, 30, 40), "Green": (40, 150, 60), "Pink": (240, 140, 180),
+    "Navy Blue": (20, 30, 90), "Purple": (110, 40, 140), "Silver": (192, 192, 200), "Yellow": (240, 220, 40),
+    "Beige": (220, 205, 170), "Gold": (212, 175, 55), "Maroon": (110, 20, 30), "Orange": (245, 130, 30),
+    "Olive": (110, 110, 40), "Multi": (150, 100, 150), "Cream": (250, 240, 210), "Steel": (110, 120, 130),
+    "Charcoal": (54, 60, 66), "Peach": (250, 190, 160), "Off White": (240, 235, 225), "Lavender": (200, 170, 230),
+    "Khaki": (190, 175, 120), "Teal": (0, 128, 128), "Tan": (210, 180, 140), "Magenta": (210, 40, 160),
+    "Mustard": (220, 170, 30), "Grey Melange": (170, 170, 170), "Turquoise Blue": (60, 200, 210),
+    "Copper": (184, 115, 51), "Rust": (183, 65, 14), "Burgundy": (128, 0, 32), "Coffee Brown": (90, 60, 40),
+    "Bronze": (205, 127, 50), "Metallic": (160, 160, 170), "Mauve": (190, 150, 190), "Nude": (225, 190, 165),
+    "Rose": (230, 100, 120), "Sea Green": (46, 139, 87), "Lime Green": (150, 220, 50), "Skin": (230, 190, 160),
+    "Taupe": (140, 120, 100), "Mushroom Brown": (150, 130, 110), "Fluorescent Green": (120, 255, 60),
+}
+
+BRANDS = [
+    "Puma", "Nike", "Adidas", "Reebok", "Roadster", "Wrangler", "Levis", "Lee", "Jealous 21", "Fastrack",
+    "Titan", "Baggit", "Lavie", "Catwalk", "Metronaut", "Inkfruit", "Flying Machine", "Mufti", "Arrow",
+    "Van Heusen", "Peter England", "Allen Solly", "Jockey", "Fabindia", "Biba", "W", "Global Desi",
+    "Red Tape", "Woodland", "Bata", "Hidesign", "Ray-Ban", "Skagen", "Q&Q", "Lotto", "Fila", "Quechua",
+    "United Colors of Benetton", "Tommy Hilfiger", "Scullers", "Spykar", "Provogue", "Basics", "Gini and Jony",
+    "Lakme", "Maybelline", "Revlon", "Nivea", "Elle", "Timex",
+]
+
+COLUMNS = ["id", "gender", "masterCategory", "subCategory", "articleType", "baseColour",
+           "season", "year", "usage", "productDisplayName"]
+
+FIRST_ID = 10000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic fashion catalogue")
+    parser.add_argument("--output-dir", type=str, required=True, help="Dataset directory to write")
+    parser.add_argument("--size", type=int, default=10000, help="Number of catalogue items")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--image-size", type=str, default="60x80", help="Image WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes writing images")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def long_tail_weights(count, exponent=1.1):
+    """Zipf-like weights so a few values dominate, as in the real catalogue"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+def choose(rng, values, weights, size):
+    weights = np.asarray(weights, dtype=np.float64)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+def generate_styles(size, seed=0):
+    """Build the styles.csv rows as a DataFrame"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(FIRST_ID, FIRST_ID + size)
+
+    masters = choose(rng, list(MASTER_WEIGHTS), list(MASTER_WEIGHTS.values()), size)
+    sub_categories = np.empty(size, dtype=object)
+    article_types = np.empty(size, dtype=object)
+    for master, tree in CATALOGUE_TREE.items():
+        rows = np.flatnonzero(masters == master)
+        if not len(rows):
+            continue
+        subs = list(tree)
+        sub_categories[rows] = choose(rng, subs, long_tail_weights(len(subs)), len(rows))
+        for sub in subs:
+            sub_rows = rows[sub_categories[rows] == sub]
+            if len(sub_rows):
+                articles = tree[sub]
+                article_types[sub_rows] = choose(rng, articles, long_tail_weights(len(articles)), len(sub_rows))
+
+    genders = choose(rng, list(GENDER_WEIGHTS), list(GENDER_WEIGHTS.values()), size)
+    colours = choose(rng, list(BASE_COLOURS), long_tail_weights(len(BASE_COLOURS), 0.9), size)
+    seasons = choose(rng, list(SEASON_WEIGHTS), list(SEASON_WEIGHTS.values()), size)
+    usages = choose(rng, list(USAGE_WEIGHTS), list(USAGE_WEIGHTS.values()), size)
+    years = rng.choice(YEARS, size=size)
+    brands = choose(rng, BRANDS, long_tail_weights(len(BRANDS), 0.8), size)
+
+    # A sprinkling of missing values, like the real file
+    usages[rng.random(size) < 0.003] = None
+    seasons[rng.random(size) < 0.001] = None
+
+    df = pd.DataFrame({
+        "id": ids,
+        "gender": genders,
+        "masterCategory": masters,
+        "subCategory": sub_categories,
+        "articleType": article_types,
+        "baseColour": colours,
+        "season": seasons,
+        "year": years,
+        "usage": usages,
+        "productDisplayName": brands + " " + genders + " " + colours + " " + article_types.astype(str),
+    })
+    return df
+
+def draw_product(item_id, colour, article_type, width, height, seed):
+    """Draw a product-like shape in the base colour on a light background"""
+    rng = np.random.default_rng((seed, item_id))
+    background = tuple(int(v) for v in rng.integers(225, 256, size=3))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+
+    fill = tuple(int(np.clip(c + rng.integers(-20, 21), 0, 255)) for c in BASE_COLOURS.get(colour, (128, 128, 128)))
+    left, top = width * rng.uniform(0.1, 0.25), height * rng.uniform(0.1, 0.25)
+    right, bottom = width * rng.uniform(0.75, 0.9), height * rng.uniform(0.75, 0.9)
+    # Round things (watches, jewellery, bags) as ellipses, the rest as garments
+    if zlib.crc32(str(article_type).encode("utf-8")) % 3 == 0:
+        draw.ellipse((left, top, right, bottom), fill=fill)
+    else:
+        draw.rectangle((left, top, right, bottom), fill=fill)
+        draw.rectangle((left - width * 0.08, top, left + width * 0.05, top + height * 0.3), fill=fill)
+        draw.rectangle((right - width * 0.05, top, right + width * 0.08, top + height * 0.3), fill=fill)
+
+    # Sensor-like noise so JPEG sizes and colour histograms look photographic
+    pixels = np.asarray(image, dtype=np.int16) + rng.integers(-6, 7, size=(height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+def write_images(job):
+    """Write one chunk of images (runs in a worker process)"""
+    image_folder, rows, width, height, seed = job
+    written = 0
+    for item_id, colour, article_type in rows:
+        path = os.path.join(image_folder, f"{item_id}.jpg")
+        if os.path.exists(path):
+            continue
+        draw_product(item_id, colour, article_type, width, height, seed).save(path, quality=85)
+        written += 1
+    return written
+
+def generate_catalogue(output_dir, size, seed=0, image_size=(60, 80), workers=1, quiet=False):
+    """Write styles.csv and images/ for a synthetic catalogue and return a summary dict
+
+    Existing images are kept, so an interrupted or smaller run can be extended.
+    """
+    started = time.perf_counter()
+    image_folder = os.path.join(output_dir, "images")
+    os.makedirs(image_folder, exist_ok=True)
+
+    df = generate_styles(size, seed)
+    df.to_csv(os.path.join(output_dir, "styles.csv"), index=False)
+
+    width, height = image_size
+    rows = list(zip(df["id"].tolist(), df["baseColour"].tolist(), df["articleType"].tolist()))
+    chunk = 2000
+    jobs = [(image_folder, rows[i:i + chunk], width, height, seed) for i in range(0, len(rows), chunk)]
+
+    written = 0
+    if workers > 1 and len(jobs) > 1:
+        with Pool(workers) as pool:
+            for count in pool.imap_unordered(write_images, jobs):
+                written += count
+                if not quiet:
+                    print(f"  {written} images written", file=sys.stderr)
+    else:
+        for job in jobs:
+            written += write_images(job)
+
+    distinct = df.nunique().to_dict()
+    summary = {
+        "path": output_dir,
+        "size": size,
+        "seed": seed,
+        "image_size": f"{width}x{height}",
+        "images_written": written,
+        "cardinality": {column: int(distinct[column]) for column in COLUMNS[1:-1]},
+        "generate_s": time.perf_counter() - started,
+    }
+    with open(os.path.join(output_dir, "catalogue.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main():
+    args = parse_args()
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    summary = generate_catalogue(args.output_dir, args.size, args.seed, (width, height), args.workers, args.quiet)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
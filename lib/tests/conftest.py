@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# The modules under test are the scripts in lib/, which import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def clip_search():
+    """The clip_search module, or a skip where torch, FAISS or CLIP aren't installed"""
+    for module in ("torch", "faiss", "clip"):
+        pytest.importorskip(module)
+    import clip_search
+    return clip_search
+
+@pytest.fixture(scope="session")
+def generate_embeddings():
+    """The generate_embeddings module, which exits on import without its dependencies"""
+    for module in ("torch", "faiss", "clip", "tqdm"):
+        pytest.importorskip(module)
+    import generate_embeddings
+    return generate_embeddings
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from artifact_versions import (current_version, list_models, list_versions, model_root, model_slug, prune_versions,
+                               publish_version, read_manifest, read_model_info, resolve_artifact_dir, save_array,
+                               set_current, start_version, verify_version, version_dir, write_model_info)
+
+def build(root, version, payload=b"index"):
+    """Stage and publish a version holding one index file"""
+    version, staging = start_version(str(root), version)
+    with open(os.path.join(staging, "fashion_faiss.index"), "wb") as f:
+        f.write(payload)
+    return publish_version(str(root), version, staging, {"model": "ViT-B/32", "count": 3})
+
+def test_flat_layout_without_current(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    assert resolve_artifact_dir(str(tmp_path)) == str(tmp_path)
+    assert list_versions(str(tmp_path)) == []
+
+def test_publish_writes_the_manifest_and_repoints_current(tmp_path):
+    manifest = build(tmp_path, "v1")
+    assert manifest["files"] == {"fashion_faiss.index": 5}
+    assert manifest["version"] == "v1" and manifest["count"] == 3
+    assert current_version(str(tmp_path)) == "v1"
+    assert resolve_artifact_dir(str(tmp_path)) == version_dir(str(tmp_path), "v1")
+    assert not os.path.exists(version_dir(str(tmp_path), "v1") + ".partial")
+
+    build(tmp_path, "v2")
+    assert current_version(str(tmp_path)) == "v2"
+    assert list_versions(str(tmp_path)) == ["v1", "v2"]
+
+def test_staged_builds_are_not_versions_until_published(tmp_path):
+    build(tmp_path, "v1")
+    start_version(str(tmp_path), "v2")
+    assert list_versions(str(tmp_path)) == ["v1"]
+    assert current_version(str(tmp_path)) == "v1"
+
+def test_existing_versions_are_not_overwritten(tmp_path):
+    build(tmp_path, "v1")
+    with pytest.raises(ValueError):
+        start_version(str(tmp_path), "v1")
+
+def test_activate_rolls_back_and_refuses_unknown_versions(tmp_path):
+    build(tmp_path, "v1")
+    build(tmp_path, "v2")
+    set_current(str(tmp_path), "v1")
+    assert current_version(str(tmp_path)) == "v1"
+    with pytest.raises(ValueError):
+        set_current(str(tmp_path), "v3")
+    assert current_version(str(tmp_path)) == "v1"
+
+def test_verify_catches_missing_and_truncated_files(tmp_path):
+    build(tmp_path, "v1")
+    directory = version_dir(str(tmp_path), "v1")
+    assert verify_version(directory)["version"] == "v1"
+
+    with open(os.path.join(directory, "fashion_faiss.index"), "wb") as f:
+        f.write(b"ind")
+    with pytest.raises(ValueError, match="expected 5"):
+        verify_version(directory)
+
+    os.remove(os.path.join(directory, "fashion_faiss.index"))
+    with pytest.raises(ValueError, match="missing"):
+        verify_version(directory)
+
+def test_prune_keeps_the_newest_and_the_live_version(tmp_path):
+    for version in ("v1", "v2", "v3", "v4"):
+        build(tmp_path, version)
+    set_current(str(tmp_path), "v1")
+    assert prune_versions(str(tmp_path), keep=2) == ["v2"]
+    assert list_versions(str(tmp_path)) == ["v1", "v3", "v4"]
+    assert read_manifest(version_dir(str(tmp_path), "v1"))["version"] == "v1"
+
+def test_model_roots(tmp_path):
+    assert model_slug("ViT-B/16") == "ViT-B-16"
+    assert model_slug("RN50x4") == "RN50x4"
+    assert model_root(str(tmp_path)) == model_root(str(tmp_path), "ViT-B/32") == str(tmp_path)
+    assert model_root(str(tmp_path), "ViT-L/14") == os.path.join(str(tmp_path), "models", "ViT-L-14")
+
+def test_model_info_falls_back_to_the_manifest(tmp_path):
+    assert read_model_info(str(tmp_path))["model"] == "ViT-B/32"
+    build(tmp_path, "v1")
+    directory = version_dir(str(tmp_path), "v1")
+    assert read_model_info(directory) == {"model": "ViT-B/32", "dimension": None, "normalized": True, "metric": "l2"}
+    write_model_info(directory, "ViT-B/16", 512)
+    assert read_model_info(directory)["model"] == "ViT-B/16"
+
+def test_list_models(tmp_path):
+    assert list_models(str(tmp_path)) == {}
+    build(tmp_path, "v1")
+    write_model_info(version_dir(str(tmp_path), "v1"), "ViT-B/32", 512)
+    other = model_root(str(tmp_path), "RN50")
+    os.makedirs(other)
+    build(other, "v1")
+    write_model_info(version_dir(other, "v1"), "RN50", 1024)
+    os.makedirs(model_root(str(tmp_path), "ViT-L/14"))
+    assert list_models(str(tmp_path)) == {"ViT-B/32": str(tmp_path), "RN50": other}
+
+def test_save_array_replaces_the_file_whole(tmp_path):
+    np = pytest.importorskip("numpy")
+    path = str(tmp_path / "clusters.npy")
+    save_array(path, np.arange(3))
+    save_array(path, np.arange(5))
+    assert np.load(path).tolist() == [0, 1, 2, 3, 4]
+    assert os.listdir(tmp_path) == ["clusters.npy"]
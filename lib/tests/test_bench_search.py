@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from bench_search import load_requests, percentile_summary, result_ids, run_load
+
+def test_percentile_summary():
+    assert percentile_summary([])["p50"] is None
+    summary = percentile_summary([0.001 * i for i in range(1, 101)])
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["max"] == pytest.approx(100.0)
+
+def test_result_ids():
+    assert result_ids({"results": [{"id": "3"}, {"id": "1"}]}) == ["3", "1"]
+    assert result_ids({"error": "Unknown model"}) == []
+
+def test_request_mix(tmp_path):
+    (tmp_path / "queries.txt").write_text("red dress\n\nblue jeans\n")
+    (tmp_path / "a.jpg").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("")
+    requests = load_requests(str(tmp_path / "queries.txt"), str(tmp_path), top_k=3)
+    assert [request.get("query") or request["image_path"] for request in requests] == [
+        "red dress", "blue jeans", str(tmp_path / "a.jpg")]
+    assert all(request["top_k"] == 3 for request in requests)
+
+def test_run_load_cycles_requests_and_counts_errors():
+    seen = []
+
+    def submit(request):
+        seen.append(request["query"])
+        return {"error": "boom"} if request["query"] == "b" else {"results": []}
+
+    stats = run_load(submit, [{"query": "a"}, {"query": "b"}], total=6, concurrency=2)
+    assert sorted(seen) == ["a"] * 3 + ["b"] * 3
+    assert (stats["requests"], stats["errors"]) == (6, 3)
+    assert stats["latency_ms"]["p50"] is not None
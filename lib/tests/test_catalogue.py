@@ -0,0 +1,36 @@
+import pandas as pd
+
+def test_text_descriptions_match_the_row_wise_format(generate_embeddings):
+    df = pd.DataFrame({
+        "productDisplayName": ["Red Tee", "Blue Jeans"],
+        "masterCategory": ["Apparel", "Apparel"],
+        "subCategory": ["Topwear", None],
+        "articleType": ["Tshirts", "Jeans"],
+        "baseColour": ["Red", "Blue"],
+        "usage": ["Casual", None],
+        "gender": ["Men", "Women"],
+    })
+    expected = [
+        f"{row['productDisplayName']} - {row['masterCategory']}, {row['subCategory']}, {row['articleType']}, "
+        f"{row['baseColour']}, {row['usage']}, {row['gender']}"
+        for _, row in df.iterrows()
+    ]
+    assert generate_embeddings.text_descriptions(df).tolist() == expected
+
+def test_prepare_catalogue_keeps_rows_with_images(generate_embeddings, tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for name in ("1.jpg", "3.jpg", "notes.txt"):
+        (images / name).write_bytes(b"")
+    pd.DataFrame({
+        "id": [1, 2, 3],
+        "productDisplayName": ["A", "B", None],
+        "masterCategory": "Apparel", "subCategory": "Topwear", "articleType": "Tshirts",
+        "baseColour": "Red", "usage": "Casual", "gender": "Men",
+    }).to_csv(tmp_path / "styles.csv", index=False)
+
+    assert generate_embeddings.image_ids_on_disk(str(images)) == {"1", "3"}
+    df, timings = generate_embeddings.prepare_catalogue(str(tmp_path / "styles.csv"), str(images))
+    assert df["id"].tolist() == ["1"]
+    assert df["text_description"][0].startswith("A - Apparel, Topwear")
+    assert {"read_csv", "filter", "describe", "total"} <= set(timings)
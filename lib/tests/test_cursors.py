@@ -0,0 +1,46 @@
+import pytest
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(clip_search, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(clip_search.time, "monotonic", clock)
+    return clock
+
+def test_put_and_get(clip_search, clock):
+    store = clip_search.CursorStore(ttl=10, capacity=4)
+    token = store.put({"offset": 3})
+    assert token in store and store.get(token) == {"offset": 3}
+
+def test_ttl_slides_with_each_page(clip_search, clock):
+    store = clip_search.CursorStore(ttl=10, capacity=4)
+    token = store.put("cursor")
+    clock.now += 8
+    assert store.get(token) == "cursor"
+    clock.now += 8
+    assert store.get(token) == "cursor"
+    clock.now += 10
+    with pytest.raises(ValueError, match="Unknown or expired cursor"):
+        store.get(token)
+    assert len(store) == 0
+
+def test_capacity_drops_least_recently_used(clip_search, clock):
+    store = clip_search.CursorStore(ttl=10, capacity=2)
+    first, second = store.put("first"), store.put("second")
+    store.get(first)
+    third = store.put("third")
+    assert second not in store
+    assert first in store and third in store
+
+def test_discard(clip_search, clock):
+    store = clip_search.CursorStore(ttl=10, capacity=2)
+    token = store.put("cursor")
+    store.discard(token)
+    store.discard(token)
+    with pytest.raises(ValueError):
+        store.get(token)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+class ListIndex:
+    """Exact search over a small matrix, counting the rows it is asked for"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ntotal = len(vectors)
+        self.d = vectors.shape[1]
+        self.fetched = []
+
+    def search(self, queries, k):
+        self.fetched.append(k)
+        distances = ((queries[:, None, :] - self.vectors[None, :, :]) ** 2).sum(axis=2)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1).astype(np.float32), order.astype(np.int64)
+
+def test_one_result_per_cluster_in_rank_order(clip_search):
+    # Positions 0-3 lie on a line; 0 and 1 share a cluster, as do 2 and 3
+    vectors = np.array([[0.0], [0.1], [0.2], [0.3], [5.0]], dtype=np.float32)
+    index = clip_search.DiversifiedIndex(ListIndex(vectors), np.array([0, 0, 2, 2, 4]))
+    distances, indices = index.search(np.array([[0.0]], dtype=np.float32), 3)
+    assert indices.tolist() == [[0, 2, 4]]
+    assert distances[0].tolist() == pytest.approx([0.0, 0.04, 25.0])
+
+def test_fetch_is_sized_by_the_mean_cluster_size(clip_search):
+    vectors = np.arange(8, dtype=np.float32)[:, None]
+    base = ListIndex(vectors)
+    # 8 items in 4 clusters: two rows per cluster are expected
+    index = clip_search.DiversifiedIndex(base, np.array([0, 1, 2, 3, 0, 1, 2, 3]))
+    assert index.expansion == pytest.approx(2.0)
+    index.search(np.array([[0.0]], dtype=np.float32), 2)
+    assert base.fetched == [4]
+
+def test_collapsed_queries_search_again_with_twice_the_k(clip_search):
+    # The 8 items nearest the query are one cluster; the other 12 are singletons
+    vectors = np.arange(20, dtype=np.float32)[:, None]
+    base = ListIndex(vectors)
+    index = clip_search.DiversifiedIndex(base, np.array([0] * 8 + list(range(8, 20))))
+    distances, indices = index.search(np.array([[0.0]], dtype=np.float32), 3)
+    assert indices.tolist() == [[0, 8, 9]]
+    assert base.fetched == [5, 10]
+
+def test_pads_when_the_index_runs_out_of_clusters(clip_search):
+    vectors = np.arange(4, dtype=np.float32)[:, None]
+    index = clip_search.DiversifiedIndex(ListIndex(vectors), np.array([0, 0, 2, 2]))
+    distances, indices = index.search(np.array([[0.0]], dtype=np.float32), 3)
+    assert indices.tolist() == [[0, 2, -1]]
+
+def test_cluster_count_must_match_the_index(clip_search):
+    with pytest.raises(ValueError):
+        clip_search.DiversifiedIndex(ListIndex(np.zeros((3, 1), dtype=np.float32)), np.array([0, 1]))
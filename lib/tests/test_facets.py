@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def facets(clip_search):
+    df = pd.DataFrame({
+        "id": [1, 2, 3, 4, 4],
+        "gender": ["Men", "Women", "Women", "Men", "Women"],
+        "articleType": ["Tshirts", "Dresses", "Dresses", "Jeans", "Jeans"],
+    })
+    # Position 4 has no metadata row; the duplicate id 4 keeps its first row
+    return clip_search.FacetIndex(df, ["3", "1", "2", "4", "99"], columns=["gender", "articleType"])
+
+def test_counts_most_frequent_first(facets):
+    counts = facets.counts(np.array([0, 1, 2, 3]))
+    assert list(counts["gender"].items()) == [("Women", 2), ("Men", 2)]
+    assert list(counts["articleType"].items()) == [("Dresses", 2), ("Tshirts", 1), ("Jeans", 1)]
+
+def test_counts_skip_padding_and_missing_metadata(facets):
+    assert facets.counts(np.array([[0, 4, -1]]), ["gender"]) == {"gender": {"Women": 1}}
+
+def test_counts_union_of_rows(facets):
+    counts = facets.counts(np.array([[0, 1], [1, 2]]), ["articleType"])
+    assert counts == {"articleType": {"Dresses": 2, "Tshirts": 1}}
+
+def test_faceted_index_counts_top_candidates(clip_search, facets):
+    class Exhaustive:
+        ntotal, d = 5, 1
+        def search(self, vectors, k):
+            return np.zeros((len(vectors), k), dtype=np.float32), np.tile(np.arange(k), (len(vectors), 1))
+    index = clip_search.FacetedIndex(Exhaustive(), facets, facet_k=3, columns=["gender"])
+    distances, indices = index.search(np.zeros((1, 1), dtype=np.float32), 1)
+    assert indices.tolist() == [[0]]
+    assert index.counts == {"gender": {"Women": 2, "Men": 1}}
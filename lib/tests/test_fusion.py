@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+def test_late_fusion_merges_by_weighted_distance(clip_search):
+    distances = np.array([[0.1, 0.2, 0.4], [0.1, 0.3, 0.5]], dtype=np.float32)
+    indices = np.array([[7, 3, 5], [3, 9, 7]])
+    fused, merged = clip_search.merge_ranked_lists(distances, indices, (0.5, 0.5), 4)
+    # 3: (0.2 + 0.1) / 2, 7: (0.1 + 0.5) / 2; 9 and 5 get the other list's worst distance
+    assert merged.tolist() == [3, 7, 9, 5]
+    assert fused.tolist() == pytest.approx([0.15, 0.3, 0.35, 0.45])
+
+def test_items_in_both_lists_beat_equally_close_single_list_hits(clip_search):
+    distances = np.array([[0.2, 0.2], [0.2, 0.2]], dtype=np.float32)
+    indices = np.array([[1, 2], [1, 3]])
+    _, merged = clip_search.merge_ranked_lists(distances, indices, (0.5, 0.5), 3)
+    assert merged[0] == 1
+
+def test_weights_and_padding(clip_search):
+    distances = np.array([[0.1, 0.9], [0.9, np.finfo(np.float32).max]], dtype=np.float32)
+    indices = np.array([[1, 2], [2, -1]])
+    fused, merged = clip_search.merge_ranked_lists(distances, indices, (0.0, 1.0), 2)
+    # All the weight on the second list, whose padding is ignored: 1 gets its worst distance
+    assert sorted(merged.tolist()) == [1, 2] and -1 not in merged
+    assert fused.tolist() == pytest.approx([0.9, 0.9])
+
+def test_fusion_queries(clip_search):
+    text, image = np.array([1.0, 0.0]), np.array([0.0, 1.0])
+    assert clip_search.fusion_queries(text, image, "late", 0.5).shape == (2, 2)
+    fused = clip_search.fusion_queries(text, image, "early", 0.75)
+    expected = np.array([0.75, 0.25])
+    np.testing.assert_allclose(fused, [expected / np.linalg.norm(expected)], rtol=1e-6)
+
+def test_adaptive_weight_follows_coherence(clip_search):
+    threshold = clip_search.COHERENCE_THRESHOLD
+    assert clip_search.fusion_text_weight("early", 0.5, -1.0) == 0.5
+    assert clip_search.fusion_text_weight("adaptive", 0.5, 2 * threshold) == pytest.approx(0.5)
+    assert clip_search.fusion_text_weight("adaptive", 0.5, threshold) == pytest.approx(0.25)
+    assert clip_search.fusion_text_weight("adaptive", 0.5, -0.2) == 0.0
+
+def test_fusion_request_validation(clip_search):
+    assert clip_search.multimodal_fusion({"fusion": "late", "text_weight": 0.3, "overfetch": 2}) == ("late", 0.3, 2)
+    for request in ({"fusion": "sum"}, {"text_weight": 1.5}, {"overfetch": -1}):
+        with pytest.raises(ValueError):
+            clip_search.multimodal_fusion(request)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+T = pytest.importorskip("torchvision.transforms")
+Image = pytest.importorskip("PIL.Image")
+
+from image_cache import ImageCache, file_hash, split_preprocess
+
+MEAN = (0.48145466, 0.4578275, 0.40821073)
+STD = (0.26862954, 0.26130258, 0.27577711)
+
+def preprocess(size=16):
+    return T.Compose([T.Resize(size), T.CenterCrop(size), T.ToTensor(), T.Normalize(MEAN, STD)])
+
+def test_split_preprocess():
+    crop, mean, std = split_preprocess(preprocess())
+    assert [type(step) for step in crop.transforms] == [T.Resize, T.CenterCrop]
+    assert (tuple(mean), tuple(std)) == (MEAN, STD)
+    with pytest.raises(ValueError):
+        split_preprocess(T.Compose([T.Resize(16), T.ToTensor()]))
+
+def test_normalize_matches_to_tensor_and_normalize(tmp_path):
+    cache = ImageCache(str(tmp_path), preprocess())
+    pixels = np.random.default_rng(0).integers(0, 256, (2, 16, 16, 3), dtype=np.uint8)
+    expected = torch.stack([T.Normalize(MEAN, STD)(T.ToTensor()(Image.fromarray(image))) for image in pixels])
+    batch = cache.normalize(pixels)
+    assert batch.shape == (2, 3, 16, 16) and batch.dtype == torch.float32
+    torch.testing.assert_close(batch, expected, rtol=1e-5, atol=1e-5)
+
+def test_geometry_gets_its_own_cache(tmp_path):
+    small, large = ImageCache(str(tmp_path), preprocess(16)), ImageCache(str(tmp_path), preprocess(24))
+    assert (small.width, small.height) == (16, 16)
+    assert small.path != large.path
+    assert ImageCache(str(tmp_path), preprocess(16)).path == small.path
+
+def test_sync_reuses_unchanged_rows(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for img_id, colour in (("1", "red"), ("2", "blue")):
+        Image.new("RGB", (20, 30), colour).save(images / f"{img_id}.jpg")
+    (images / "3.jpg").write_bytes(b"not a jpeg")
+    cache = ImageCache(str(tmp_path), preprocess())
+    stats = cache.sync(["1", "2", "3"], str(images), quiet=True)
+    assert (stats["decoded"], stats["failed"]) == (2, 1)
+    assert [ids for ids, _ in cache.batches(8)] == [["1", "2"]]
+
+    Image.new("RGB", (20, 30), "green").save(images / "2.jpg")
+    stats = ImageCache(str(tmp_path), preprocess()).sync(["2", "1"], str(images), quiet=True)
+    assert (stats["reused"], stats["decoded"]) == (1, 1)
+    assert file_hash(images / "2.jpg") != 0
+
+def test_batches_open_the_cache_on_disk(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    Image.new("RGB", (20, 30), "red").save(images / "1.jpg")
+    with pytest.raises(ValueError, match="No image cache"):
+        next(ImageCache(str(tmp_path), preprocess()).batches(8))
+    ImageCache(str(tmp_path), preprocess()).sync(["1"], str(images), quiet=True)
+    assert [ids for ids, _ in ImageCache(str(tmp_path), preprocess()).batches(8)] == [["1"]]
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def fake_search(clip_search, monkeypatch):
+    """Replace search_batch with one that records each batch and echoes the query"""
+    batches = []
+    release = threading.Event()
+    release.set()
+
+    def search_batch(requests, *search_args, quiet=False, prepared=None):
+        release.wait()
+        batches.append((search_args, [request["query"] for request in requests]))
+        if any(request["query"] == "boom" for request in requests):
+            raise RuntimeError("index unavailable")
+        return [{"query": request["query"], "args": search_args} for request in requests]
+
+    monkeypatch.setattr(clip_search, "search_batch", search_batch)
+    return batches, release
+
+def batcher(clip_search, **kwargs):
+    search_args = ("model", "preprocess", "index", "df", "embeddings", "cpu")
+    return clip_search.MicroBatcher(*search_args, quiet=True, **kwargs)
+
+def test_concurrent_requests_share_a_batch(clip_search, fake_search):
+    batches, release = fake_search
+    release.clear()
+    scheduler = batcher(clip_search, max_batch_size=3, max_wait_ms=200)
+    try:
+        # The first batch takes one request and blocks; the rest queue up behind it
+        futures = [scheduler.submit({"query": f"q{i}"}) for i in range(5)]
+        time.sleep(0.05)
+        release.set()
+        outputs = [future.result(timeout=5) for future in futures]
+    finally:
+        scheduler.close()
+    assert [output["query"] for output in outputs] == [f"q{i}" for i in range(5)]
+    assert all(len(queries) <= 3 for _, queries in batches)
+    assert sum(len(queries) for _, queries in batches) == 5
+    assert scheduler.batches < 5 and scheduler.mean_batch_size > 1
+
+def test_expired_deadline_skips_inference(clip_search, fake_search):
+    batches, _ = fake_search
+    scheduler = batcher(clip_search, max_wait_ms=1)
+    try:
+        future = scheduler.submit({"query": "late"}, deadline=time.monotonic() - 1)
+        with pytest.raises(TimeoutError):
+            future.result(timeout=5)
+    finally:
+        scheduler.close()
+    assert batches == []
+
+def test_batch_errors_reach_every_caller(clip_search, fake_search):
+    _, release = fake_search
+    release.clear()
+    scheduler = batcher(clip_search, max_batch_size=4, max_wait_ms=200)
+    try:
+        futures = [scheduler.submit({"query": query}) for query in ("ok", "boom")]
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+    finally:
+        scheduler.close()
+
+def test_unknown_model_is_answered_without_a_batch(clip_search, fake_search):
+    batches, _ = fake_search
+    scheduler = batcher(clip_search, max_wait_ms=1, models={"RN50": ("rn50",)})
+    try:
+        assert "is not loaded" in scheduler.submit({"query": "a", "model": "ViT-L/14"}).result(timeout=5)["error"]
+        assert scheduler.submit({"query": "b", "model": "RN50"}).result(timeout=5)["args"] == ("rn50",)
+    finally:
+        scheduler.close()
+    assert batches == [(("rn50",), ["b"])]
+
+def test_timings_include_queue_wait(clip_search, fake_search):
+    scheduler = batcher(clip_search, max_wait_ms=1)
+    try:
+        output = scheduler.submit({"query": "a", "timings": True}).result(timeout=5)
+    finally:
+        scheduler.close()
+    assert "queue_wait" in output["timings"]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from near_duplicates import cluster_near_duplicates, find_root, union_edges
+
+def test_union_find_merges_chains_under_the_smallest_position():
+    parent = np.arange(6, dtype=np.int32)
+    union_edges(parent, np.array([4, 1, 2]), np.array([5, 3, 5]))
+    assert [find_root(parent, i) for i in range(6)] == [0, 1, 2, 1, 2, 2]
+    # Joining the two groups keeps the smaller root
+    union_edges(parent, np.array([3]), np.array([4]))
+    assert {find_root(parent, i) for i in (1, 2, 3, 4, 5)} == {1}
+    assert find_root(parent, 0) == 0
+
+def near_duplicate_matrix():
+    """Rows 0, 3 and 5 are copies of one vector with tiny noise, rows 1 and 4 of another"""
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((4, 32)).astype(np.float32)
+    rows = base[[0, 1, 2, 0, 1, 0, 3]] + 1e-3 * rng.standard_normal((7, 32)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("method", ["knn", "range"])
+def test_clusters_are_labelled_by_their_smallest_row(method):
+    matrix = near_duplicate_matrix()
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    clusters = cluster_near_duplicates(matrix, index, threshold=0.99, method=method, k=4, block_size=3, quiet=True)
+    assert clusters.tolist() == [0, 1, 2, 0, 1, 0, 6]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+@pytest.fixture
+def catalogue(clip_search, monkeypatch):
+    """Four items on the unit circle, and their metadata"""
+    angles = np.radians([0, 10, 90, 180])
+    vectors = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+    ids = ["10", "11", "12", "13"]
+    index = faiss.IndexFlatL2(2)
+    index.add(vectors)
+    df = pd.DataFrame({"id": ids, "productDisplayName": [f"Item {img_id}" for img_id in ids]})
+    monkeypatch.setattr(clip_search, "enrich_product_results", lambda results, colors, quiet: results)
+    return index, df, dict(zip(ids, vectors))
+
+def test_stored_embedding_from_dict_or_matrix(clip_search, catalogue, tmp_path, monkeypatch):
+    _, _, embeddings = catalogue
+    np.testing.assert_array_equal(clip_search.stored_embedding(12, embeddings), embeddings["12"])
+    np.save(tmp_path / "image_matrix.npy", np.stack(list(embeddings.values())))
+    np.save(tmp_path / "image_ids.npy", np.array(list(embeddings)))
+    monkeypatch.setattr(clip_search, "IMAGE_MATRIX_PATH", str(tmp_path / "image_matrix.npy"))
+    monkeypatch.setattr(clip_search, "IMAGE_IDS_PATH", str(tmp_path / "image_ids.npy"))
+    clip_search.catalogue_rows.cache_clear()
+    clip_search.catalogue_matrix.cache_clear()
+    np.testing.assert_array_equal(clip_search.stored_embedding("13", None), embeddings["13"])
+    np.testing.assert_array_equal(clip_search.stored_embedding("12", None), embeddings["12"])
+    assert clip_search.catalogue_matrix.cache_info().misses == 1
+    # Another model's embeddings never fall back to CLIP_MODEL's matrix (a different dimension)
+    with pytest.raises(ValueError, match="Unknown product id"):
+        clip_search.stored_embedding("13", {"12": embeddings["12"]})
+    with pytest.raises(ValueError, match="Unknown product id"):
+        clip_search.stored_embedding("99", embeddings)
+    clip_search.catalogue_rows.cache_clear()
+    clip_search.catalogue_matrix.cache_clear()
+
+def test_sharded_embeddings_map_the_versions_matrix(clip_search, catalogue, tmp_path):
+    _, _, embeddings = catalogue
+    assert clip_search.shard_embeddings(["13", "10"], str(tmp_path)) == {"13": None, "10": None}
+    np.save(tmp_path / "image_matrix.npy", np.stack(list(embeddings.values())))
+    np.save(tmp_path / "image_ids.npy", np.array(list(embeddings)))
+    mapped = clip_search.shard_embeddings(["13", "10"], str(tmp_path))
+    assert list(mapped) == ["13", "10"]
+    np.testing.assert_array_equal(clip_search.stored_embedding("13", mapped), embeddings["13"])
+
+def test_search_excludes_the_query_items(clip_search, catalogue):
+    index, df, embeddings = catalogue
+    results = clip_search.search_by_products(["10"], None, index, df, embeddings, top_k=2, quiet=True)
+    assert [product["id"] for product in results] == ["11", "12"]
+
+def test_weights_move_the_query(clip_search, catalogue):
+    index, df, embeddings = catalogue
+    # Mostly 12 (90 degrees) with a little of 10 (0 degrees) points at 84 degrees, nearer 11 than 13
+    results = clip_search.search_by_products(["10", "12"], [0.1, 1.0], index, df, embeddings, top_k=1, quiet=True)
+    assert results[0]["id"] == "11"
+    results = clip_search.search_by_products(["10", "11"], [1.0, 1.0], index, df, embeddings, top_k=1, quiet=True)
+    assert results[0]["id"] == "12"
+    with pytest.raises(ValueError, match="cancel out"):
+        clip_search.search_by_products(["10", "10"], [1.0, -1.0], index, df, embeddings, quiet=True)
+
+def test_product_request_validation(clip_search):
+    clip_search.validate_request({"search_type": "product", "product_id": "10,11", "weights": [1, 2]})
+    assert clip_search.product_ids({"product_id": [10, "11"]}) == ["10", "11"]
+    for request in ({"search_type": "product"}, {"search_type": "product", "product_id": "10,11", "weights": "1"},
+                    {"search_type": "similar", "product_id": "10,11"}):
+        with pytest.raises(ValueError):
+            clip_search.validate_request(request)
@@ -0,0 +1,86 @@
+import base64
+import io
+import sys
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+def jpeg_bytes(size=(12, 8), colour="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, colour).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def test_image_sources(clip_search, tmp_path):
+    data = jpeg_bytes()
+    assert clip_search.request_image_data({"image_bytes": data}) == data
+    encoded = base64.b64encode(data).decode("ascii")
+    assert clip_search.request_image_data({"image_base64": encoded}) == data
+    assert clip_search.request_image_data({"image_base64": "data:image/jpeg;base64," + encoded}) == data
+    assert clip_search.request_image_data({"image_path": "x.jpg"}) is None
+
+def test_shared_memory_upload(clip_search):
+    from multiprocessing import shared_memory
+
+    data = jpeg_bytes()
+    segment = shared_memory.SharedMemory(create=True, size=len(data) + 100)
+    buffer = segment.buf
+    assert buffer is not None
+    try:
+        buffer[:len(data)] = data
+        assert clip_search.request_image_data({"image_shm": segment.name, "image_size": len(data)}) == data
+    finally:
+        if sys.version_info < (3, 13):
+            # The reader dropped the tracker's record of the segment (its POSIX name), which here is
+            # also the creator's
+            from multiprocessing import resource_tracker
+            resource_tracker.register("/" + segment.name, "shared_memory")
+        segment.close()
+        segment.unlink()
+
+def test_invalid_and_oversized_uploads(clip_search, monkeypatch):
+    with pytest.raises(ValueError, match="Invalid base64"):
+        clip_search.request_image_data({"image_base64": "not base64!"})
+    monkeypatch.setattr(clip_search, "MAX_IMAGE_BYTES", 10)
+    with pytest.raises(ValueError, match="larger than"):
+        clip_search.request_image_data({"image_bytes": jpeg_bytes()})
+    with pytest.raises(ValueError, match="larger than"):
+        clip_search.request_image_data({"image_base64": base64.b64encode(jpeg_bytes()).decode("ascii")})
+
+def test_load_query_image(clip_search, tmp_path, monkeypatch):
+    image = clip_search.load_query_image({"image_bytes": jpeg_bytes((12, 8))})
+    assert (image.mode, image.size) == ("RGB", (12, 8))
+    Image.new("L", (5, 5)).save(tmp_path / "grey.png")
+    assert clip_search.load_query_image({"image_path": str(tmp_path / "grey.png")}).mode == "RGB"
+    assert clip_search.load_query_image({"query": "red dress"}) is None
+    monkeypatch.setattr(clip_search, "MAX_IMAGE_PIXELS", 50)
+    with pytest.raises(ValueError, match="pixel limit"):
+        clip_search.load_query_image({"image_bytes": jpeg_bytes((12, 8))})
+
+def test_uploads_count_as_images(clip_search):
+    clip_search.validate_request({"search_type": "image", "image_base64": "AAAA"})
+    with pytest.raises(ValueError, match="requires an image"):
+        clip_search.validate_request({"search_type": "image", "image_bytes": b""})
+
+def test_ambiguous_files_are_reencoded_at_full_resolution(clip_search, tmp_path, monkeypatch):
+    import torch
+
+    class Model:
+        def encode_image(self, image):
+            return torch.ones(1, 4)
+
+    def preprocess(image):
+        sizes.append(image.size)
+        return torch.zeros(3, 8, 8)
+
+    sizes, passed = [], []
+    monkeypatch.setattr(clip_search, "prescreen_features", lambda features, model, device: {"verdict": "ambiguous"})
+    monkeypatch.setattr(clip_search, "validate_fashion_image",
+                        lambda image, model, preprocess, device, quiet, features: passed.append(features) or {})
+    path = tmp_path / "upload.jpg"
+    path.write_bytes(jpeg_bytes((1600, 1200)))
+    clip_search.validate_image_tiered(str(path), Model(), preprocess, "cpu", quiet=True)
+    # The screen saw a draft; the full tier gets no features, so it decodes and encodes the file itself
+    assert max(sizes[0]) < 1600 and passed == [None]
+    clip_search.validate_image_tiered(Image.open(path), Model(), preprocess, "cpu", quiet=True)
+    assert sizes[1] == (1600, 1200) and passed[1] is not None
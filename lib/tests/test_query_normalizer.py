@@ -0,0 +1,64 @@
+import pytest
+
+from query_normalizer import QueryNormalizer, edit_variants, stem
+
+NON_FASHION = {"laptop", "phone", "cat", "house", "art", "glass", "printer", "plant", "tennis", "washing machine"}
+COLORS = {"Blue": "Blue", "Navy Blue": "Navy Blue", "Burgundy": "Maroon", "Grey": "Grey", "Red": "Red"}
+
+@pytest.fixture(scope="module")
+def normalizer():
+    return QueryNormalizer(NON_FASHION, COLORS, ["dress", "shirt", "sunglasses", "glasses"])
+
+@pytest.mark.parametrize("token, expected", [
+    ("dresses", "dress"), ("watches", "watch"), ("cities", "city"), ("shirts", "shirt"),
+    ("dress", "dress"), ("bus", "bus"), ("bags", "bag"), ("tops", "top"), ("gas", "gas"),
+])
+def test_stem(token, expected):
+    assert stem(token) == expected
+
+def test_edit_variants_are_one_edit_away():
+    variants = edit_variants("cat")
+    assert {"at", "cta", "bat", "cab"} <= variants
+    assert "cat" not in variants and "tac" not in variants
+
+def test_phrases_plurals_and_typos_of_non_fashion_words(normalizer):
+    assert normalizer.normalize("Washing Machines")["non_fashion"] == ["washing machine"]
+    assert normalizer.normalize("cheap laptops")["non_fashion"] == ["laptop"]
+    assert normalizer.normalize("labtop")["non_fashion"] == ["laptop"]
+    # An extra letter in a long word
+    assert normalizer.normalize("printerr")["non_fashion"] == ["printer"]
+    assert normalizer.normalize("printers")["non_fashion"] == ["printer"]
+
+def test_short_words_are_not_typo_folded(normalizer):
+    assert normalizer.normalize("cap")["non_fashion"] == []
+    assert normalizer.normalize("bat")["non_fashion"] == []
+
+def test_protected_fashion_terms_are_matched_as_written(normalizer):
+    # "glasses" would stem to "glass", "pant" is one edit from "plant"
+    for query in ("reading glasses", "printed shirt", "black pant"):
+        assert normalizer.normalize(query)["non_fashion"] == [], query
+
+def test_longest_colour_phrase_wins(normalizer):
+    assert normalizer.normalize("navy blue shirt")["colors"] == ["Navy Blue"]
+    assert normalizer.normalize("blue and burgundy dresses")["colors"] == ["Blue", "Maroon"]
+    assert normalizer.normalize("gray top")["colors"] == ["Grey"]
+
+@pytest.mark.parametrize("query", [
+    "laptop bag", "laptop bags", "phone case", "phone cases", "cat eye sunglasses", "house dress",
+    "art deco earrings", "tennis shoes", "red phone cover",
+])
+def test_fashion_phrases_outrank_the_non_fashion_words_in_them(normalizer, query):
+    assert normalizer.normalize(query)["non_fashion"] == []
+
+def test_fashion_phrases_only_claim_their_own_words(normalizer):
+    assert normalizer.normalize("laptop bag and a laptop")["non_fashion"] == ["laptop"]
+    assert normalizer.normalize("red phone case")["colors"] == ["Red"]
+
+def test_key_is_the_joined_canonical_tokens(normalizer):
+    assert normalizer.normalize("Men's Red  DRESSES!")["key"] == "men red dress"
+    assert normalizer.normalize(None) == {"key": "", "tokens": [], "non_fashion": [], "colors": []}
+
+def test_clip_search_tables(clip_search):
+    assert clip_search.is_non_fashion_query("washng machines")
+    assert not clip_search.is_non_fashion_query("cat eye sunglasses")
+    assert clip_search.normalize_query("navy blue polo")["colors"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+@pytest.fixture
+def matrix():
+    vectors = np.random.default_rng(3).standard_normal((400, 32)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_search(matrix, queries, k):
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    return index.search(queries, k)
+
+@pytest.mark.parametrize("mode", ["fp16", "sq8", "pq"])
+def test_compressed_modes_rerank_to_exact_distances(clip_search, generate_embeddings, matrix, mode):
+    compressed = generate_embeddings.build_compressed_index(matrix, mode, pq_m=8)
+    index = clip_search.RerankedIndex(compressed, matrix, rerank_factor=8)
+    queries = matrix[:5] + 0.01
+    distances, indices = index.search(queries, 5)
+    # Whatever the first stage proposes, the returned distances are the float32 ones, in order
+    exact = ((matrix[indices] - queries[:, None, :]) ** 2).sum(axis=2)
+    np.testing.assert_allclose(distances, exact, rtol=1e-4, atol=1e-5)
+    assert (np.diff(distances, axis=1) >= 0).all()
+    _, expected = exact_search(matrix, queries, 1)
+    assert (indices[:, 0] == expected[:, 0]).all()
+
+def test_pads_like_faiss(clip_search, matrix):
+    compressed = faiss.IndexFlatL2(matrix.shape[1])
+    compressed.add(matrix[:3])
+    distances, indices = clip_search.RerankedIndex(compressed, matrix[:3]).search(matrix[:1], 5)
+    assert indices[0, 3:].tolist() == [-1, -1]
+    assert (distances[0, 3:] == np.finfo(np.float32).max).all()
+
+def test_rejects_a_mismatched_matrix(clip_search, matrix):
+    compressed = faiss.IndexFlatL2(matrix.shape[1])
+    compressed.add(matrix)
+    with pytest.raises(ValueError):
+        clip_search.RerankedIndex(compressed, matrix[:10])
+
+def test_pq_needs_training_vectors(generate_embeddings, matrix):
+    with pytest.raises(ValueError):
+        generate_embeddings.build_compressed_index(matrix[:100], "pq")
+    with pytest.raises(ValueError):
+        generate_embeddings.build_compressed_index(matrix, "opq")
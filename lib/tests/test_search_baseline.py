@@ -0,0 +1,40 @@
+import math
+
+import pytest
+
+from search_baseline import ndcg_at_k, parse_args, recall_at_k
+
+GOLDEN = ["a", "b", "c", "d", "e"]
+
+def test_recall_at_k():
+    assert recall_at_k(GOLDEN, GOLDEN, 5) == 1.0
+    assert recall_at_k(GOLDEN, ["e", "d", "x", "y", "z"], 5) == pytest.approx(0.4)
+    # Only the first k of each list count
+    assert recall_at_k(GOLDEN, ["x", "a", "b"], 2) == pytest.approx(0.5)
+    assert recall_at_k([], ["x"], 5) == 1.0
+
+def test_ndcg_is_one_only_for_the_golden_order():
+    assert ndcg_at_k(GOLDEN, GOLDEN, 5) == pytest.approx(1.0)
+    assert ndcg_at_k(GOLDEN, list(reversed(GOLDEN)), 5) < 1.0
+    assert ndcg_at_k(GOLDEN, ["x", "y", "z", "w", "v"], 5) == 0.0
+
+def test_ndcg_grades_relevance_by_golden_rank():
+    # Rank 1 is worth k, so losing it costs more than losing the last golden item
+    assert ndcg_at_k(GOLDEN, ["x", "b", "c", "d", "e"], 5) < ndcg_at_k(GOLDEN, ["a", "b", "c", "d", "x"], 5)
+
+def test_ndcg_value():
+    # Relevance 2 and 1 for k=2; the candidate swaps them
+    ideal = 2 + 1 / math.log2(3)
+    assert ndcg_at_k(["a", "b"], ["b", "a"], 2) == pytest.approx((1 + 2 / math.log2(3)) / ideal)
+
+def test_search_args_follow_the_separator():
+    args = parse_args(["compare", "--baseline", "golden.json", "--min-recall", "0.99", "--", "--torch-threads", "4"])
+    assert args.min_recall == 0.99
+    assert args.search_args == ["--torch-threads", "4"]
+    assert parse_args(["record", "--output", "golden.json"]).search_args == []
+
+def test_unknown_options_are_rejected():
+    with pytest.raises(SystemExit):
+        parse_args(["compare", "--baseline", "golden.json", "--min-recal", "0.99"])
+    with pytest.raises(SystemExit):
+        parse_args(["compare", "--baseline", "golden.json", "--torch-threads", "4"])
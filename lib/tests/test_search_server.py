@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+from concurrent.futures import Future
+
+import pytest
+
+class FakeBatcher:
+    """Stands in for MicroBatcher, answering every search at once"""
+
+    def __init__(self):
+        self.models = {}
+        self.reloader = None
+        self.mean_batch_size = 1.0
+        self.submitted = []
+
+    def submit(self, request, prepared=None, deadline=None, trace=None):
+        self.submitted.append(request)
+        future = Future()
+        future.set_result({"results": [{"id": "1", "query": request.get("query")}]})
+        return future
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def search_server(clip_search):
+    import search_server
+    return search_server
+
+@pytest.fixture
+def make_server(search_server):
+    servers = []
+
+    def make(batcher=None, **kwargs):
+        server = search_server.SearchServer(batcher or FakeBatcher(), None, decode_workers=1, quiet=True, **kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+def post(server, body, target="/search", headers=None):
+    return asyncio.run(server.dispatch("POST", target, headers or {}, body))
+
+def test_text_search(make_server):
+    status, payload = post(make_server(), json.dumps({"search_type": "text", "query": "red dress"}).encode())
+    assert status == 200 and payload["results"][0]["query"] == "red dress"
+
+def test_errors_map_to_statuses(make_server):
+    server = make_server()
+    assert post(server, b"{not json")[0] == 400
+    assert post(server, b"[1, 2]")[0] == 400
+    assert post(server, json.dumps({"search_type": "text"}).encode()) == (400, {"error": "Text search requires a query"})
+    assert post(server, json.dumps({"cursor": "gone"}).encode())[0] == 404
+    assert post(server, b"{}", target="/nowhere")[0] == 404
+    assert asyncio.run(server.dispatch("GET", "/search", {}, b""))[0] == 400
+
+def test_json_bodies_cannot_smuggle_raw_bytes(make_server):
+    server = make_server()
+    status, _ = post(server, json.dumps({"search_type": "image", "image_bytes": "x"}).encode())
+    assert status == 400 and server.batcher.submitted == []
+
+def test_saturation_is_rejected(make_server):
+    server = make_server(max_inflight=0)
+    assert post(server, json.dumps({"search_type": "text", "query": "a"}).encode())[0] == 429
+    assert server.health()["rejected"] == 1
+
+def test_requests_past_their_deadline_leave_the_batcher_running(clip_search, make_server, monkeypatch):
+    def search_batch(requests, *search_args, quiet=False, prepared=None):
+        if any(request["query"] == "slow" for request in requests):
+            time.sleep(0.3)
+        return [{"results": [{"id": "1", "query": request["query"]}]} for request in requests]
+
+    monkeypatch.setattr(clip_search, "search_batch", search_batch)
+    batcher = clip_search.MicroBatcher(None, None, None, None, None, "cpu", max_batch_size=1, max_wait_ms=1,
+                                       quiet=True)
+    server = make_server(batcher)
+
+    async def expire():
+        # One request times out mid-inference, the other while still queued behind it
+        bodies = [json.dumps({"search_type": "text", "query": query, "deadline_ms": 50}).encode()
+                  for query in ("slow", "queued")]
+        return await asyncio.gather(*(server.dispatch("POST", "/search", {}, body) for body in bodies))
+
+    assert [status for status, _ in asyncio.run(expire())] == [504, 504]
+    assert server.health()["timedOut"] == 2 and server.inflight == 0
+    status, payload = post(server, json.dumps({"search_type": "text", "query": "next"}).encode())
+    assert status == 200 and payload["results"][0]["query"] == "next"
+    assert batcher._thread.is_alive()
+
+def test_timings_and_metrics(make_server):
+    server = make_server()
+    status, payload = post(server, json.dumps({"search_type": "text", "query": "a", "timings": True}).encode())
+    assert status == 200 and "total" in payload["timings"]
+    status, metrics = asyncio.run(server.dispatch("GET", "/metrics", {}, b""))
+    assert status == 200 and 'stage="total"' in metrics
+
+def test_http_keep_alive(search_server, make_server):
+    server = make_server()
+
+    async def exchange():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps({"search_type": "text", "query": "a"}).encode()
+        responses = []
+        for connection in ("keep-alive", "close"):
+            writer.write(f"POST /search HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: {connection}\r\n\r\n"
+                         .encode() + body)
+            status = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.lower()] = value.strip()
+            payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+            responses.append((status.split()[1], headers["connection"], payload["results"][0]["id"]))
+        assert await reader.read() == b""
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return responses
+
+    assert asyncio.run(exchange()) == [(b"200", "keep-alive", "1"), (b"200", "close", "1")]
@@ -0,0 +1,36 @@
+import pytest
+
+import search_workers
+from search_workers import SearchWorker, split_cores
+
+def test_split_cores_even():
+    assert split_cores([0, 1, 2, 3, 4, 5, 6, 7], 4) == [[0, 1], [2, 3], [4, 5], [6, 7]]
+
+def test_split_cores_uneven_slices_are_contiguous_and_cover_every_core():
+    slices = split_cores([0, 1, 2, 3, 4, 5, 6], 3)
+    assert slices == [[0, 1, 2], [3, 4], [5, 6]]
+    assert sum(slices, []) == [0, 1, 2, 3, 4, 5, 6]
+
+def test_split_cores_keeps_non_contiguous_ids():
+    assert split_cores([2, 3, 8, 9], 2) == [[2, 3], [8, 9]]
+
+def test_split_cores_more_workers_than_cores_share_single_cores():
+    assert split_cores([4, 5], 5) == [[4], [5], [4], [5], [4]]
+
+def test_parse_cpu_list(clip_search):
+    assert clip_search.parse_cpu_list("0-3,8") == [0, 1, 2, 3, 8]
+    assert clip_search.parse_cpu_list(" 6, 2-3 ,,2 ") == [2, 3, 6]
+    assert clip_search.parse_cpu_list("") == []
+
+def test_requests_to_an_exited_worker_fail_instead_of_counting_as_load(tmp_path, monkeypatch):
+    script = tmp_path / "exits.py"
+    script.write_text("import sys\nsys.exit(0)\n")
+    monkeypatch.setattr(search_workers, "SCRIPT_PATH", str(script))
+    worker = SearchWorker(0, [0], quiet=True)
+    assert worker.ready.wait(10) and worker.info is None
+    worker.process.wait(10)
+    future = worker.submit(1, {"search_type": "text", "query": "red dress"})
+    with pytest.raises(RuntimeError, match="exited"):
+        future.result(timeout=10)
+    assert worker.load == 0
+    worker.close()
@@ -0,0 +1,124 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+import shard_server
+from shard_server import ShardServer
+
+def random_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture
+def shards(tmp_path):
+    """Three flat shards of 50 vectors with a manifest, each served on its own port"""
+    vectors = random_vectors(150)
+    manifest = {"dimension": 16, "shards": []}
+    servers = []
+    for shard_no in range(3):
+        rows = vectors[shard_no * 50:(shard_no + 1) * 50]
+        path = tmp_path / f"shard_{shard_no}"
+        path.mkdir()
+        index = faiss.IndexFlatL2(16)
+        index.add(rows)
+        np.save(path / "image_ids.npy", np.array([str(shard_no * 50 + i) for i in range(50)]))
+        manifest["shards"].append({"path": path.name})
+        server = ShardServer(("127.0.0.1", 0), index)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    with open(tmp_path / "shards.json", "w") as f:
+        json.dump(manifest, f)
+    yield str(tmp_path / "shards.json"), vectors, [f"127.0.0.1:{server.server_address[1]}" for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_merged_top_k_matches_a_single_index(clip_search, shards):
+    manifest_path, vectors, addresses = shards
+    sharded = clip_search.ShardedIndex(manifest_path, ",".join(addresses), quiet=True)
+    flat = faiss.IndexFlatL2(16)
+    flat.add(vectors)
+    queries = random_vectors(8, seed=1)
+
+    distances, indices = sharded.search(queries, 10)
+    expected_distances, expected_indices = flat.search(queries, 10)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+    assert sharded.ntotal == 150
+    assert sharded.ids[indices[0, 0]] == str(indices[0, 0])
+    assert sharded.missing_shards == []
+
+def test_unreachable_shard_is_skipped(clip_search, shards):
+    manifest_path, vectors, addresses = shards
+    # Nothing listens on the third address once its server is gone
+    sharded = clip_search.ShardedIndex(manifest_path, ",".join(addresses[:2] + ["127.0.0.1:1"]),
+                                       timeout_ms=200, quiet=True)
+    distances, indices = sharded.search(random_vectors(2, seed=2), 5)
+    assert sharded.missing_shards == [2]
+    assert (indices < 100).all()
+
+def test_k_beyond_the_shards_keeps_faiss_padding(clip_search, shards):
+    manifest_path, _, addresses = shards
+    sharded = clip_search.ShardedIndex(manifest_path, ",".join(addresses), quiet=True)
+    distances, indices = sharded.search(random_vectors(1, seed=3), 160)
+    assert (indices[0, :150] >= 0).all() and (indices[0, 150:] == -1).all()
+    assert sorted(indices[0, :150].tolist()) == list(range(150))
+
+def test_slow_shard_times_out(clip_search, shards):
+    manifest_path, vectors, addresses = shards
+    index = faiss.IndexFlatL2(16)
+    index.add(vectors[100:])
+    slow = ShardServer(("127.0.0.1", 0), index, delay_ms=500)
+    threading.Thread(target=slow.serve_forever, daemon=True).start()
+    try:
+        sharded = clip_search.ShardedIndex(manifest_path, ",".join(addresses[:2] + [f"127.0.0.1:{slow.server_address[1]}"]),
+                                           timeout_ms=100, quiet=True)
+        _, indices = sharded.search(random_vectors(1, seed=4), 5)
+        assert sharded.missing_shards == [2]
+        assert (indices < 100).all()
+    finally:
+        slow.shutdown()
+        slow.server_close()
+
+def test_local_launch_forwards_the_delay(shards, monkeypatch):
+    manifest_path, _, _ = shards
+    commands = []
+
+    class Process:
+        def __init__(self, command):
+            commands.append(command)
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr(shard_server.subprocess, "Popen", Process)
+    shard_server.launch_local(manifest_path, "127.0.0.1", 9300, delay_ms=250, quiet=True)
+    assert len(commands) == 3
+    assert all(command[command.index("--delay-ms") + 1] == "250" for command in commands)
+    assert [command[command.index("--port") + 1] for command in commands] == ["9300", "9301", "9302"]
+
+def test_sharded_load_collapses_duplicates(clip_search, shards, tmp_path):
+    manifest_path, vectors, addresses = shards
+    # The unsharded artifacts list the ids in another order than the shards do
+    ids = [str(i) for i in range(150)][::-1]
+    np.save(tmp_path / "image_ids.npy", np.array(ids))
+    # Items 0 and 1 (the first two shard positions) are near-duplicates
+    np.save(tmp_path / "duplicate_clusters.npy", np.array([0 if img_id in ("0", "1") else int(img_id) for img_id in ids]))
+    with open(tmp_path / "styles.csv", "w") as f:
+        f.write("id,productDisplayName\n" + "".join(f"{i},Item {i}\n" for i in range(150)))
+
+    index, df, image_embeddings = clip_search.load_search_data(str(tmp_path), manifest_path, ",".join(addresses),
+                                                               diversify=True, quiet=True)
+    assert isinstance(index, clip_search.DiversifiedIndex)
+    assert list(image_embeddings) == [str(i) for i in range(150)]
+    assert len(df) == 150
+    # Cluster ids follow the shard positions, not image_ids.npy's rows
+    assert index.clusters[0] == index.clusters[1] and len(set(index.clusters[1:].tolist())) == 149
+    # Midway between the duplicates both would rank first; only one is kept
+    _, indices = index.search((vectors[:1] + vectors[1:2]) / 2, 5)
+    assert indices[0, 0] in (0, 1)
+    assert not {0, 1} <= set(indices[0].tolist())
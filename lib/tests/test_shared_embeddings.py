@@ -0,0 +1,23 @@
+import numpy as np
+
+def test_matrix_round_trip_is_memory_mapped(clip_search, generate_embeddings, tmp_path):
+    embeddings = {"10": np.array([1.0, 0.0], dtype=np.float32), "11": np.array([0.0, 1.0], dtype=np.float64)}
+    matrix = generate_embeddings.save_embedding_matrix(embeddings, str(tmp_path))
+    assert matrix.dtype == np.float32 and matrix.flags["C_CONTIGUOUS"]
+
+    loaded = clip_search.load_image_embeddings(str(tmp_path))
+    assert list(loaded) == ["10", "11"]
+    np.testing.assert_array_equal(loaded["11"], [0.0, 1.0])
+    # Rows are views of one mapped file, so forked workers share its pages
+    assert all(isinstance(vector.base, np.memmap) or isinstance(vector, np.memmap) for vector in loaded.values())
+
+def test_pickled_embeddings_still_load(clip_search, tmp_path):
+    embeddings = {"10": np.ones(2, dtype=np.float32)}
+    np.save(tmp_path / "image_embeddings.npy", np.array(embeddings, dtype=object), allow_pickle=True)
+    loaded = clip_search.load_image_embeddings(str(tmp_path))
+    np.testing.assert_array_equal(loaded["10"], [1.0, 1.0])
+
+def test_process_memory(clip_search):
+    memory = clip_search.process_memory()
+    assert memory["rss_mb"] > 0
+    assert set(memory) <= {"rss_mb", "pss_mb", "uss_mb"}
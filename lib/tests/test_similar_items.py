@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from similar_items import neighbour_table
+
+def flat_index(matrix):
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    return index
+
+def line_matrix(count):
+    """Unit vectors at increasing angles, so each row's neighbours are the rows next to it"""
+    angles = np.linspace(0.0, 1.0, count, dtype=np.float32)
+    return np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+
+def test_neighbours_exclude_the_item_and_come_in_rank_order():
+    matrix = line_matrix(6)
+    neighbors, scores = neighbour_table(matrix, flat_index(matrix), k=2, block_size=4, quiet=True)
+    assert neighbors[0].tolist() == [1, 2]
+    assert sorted(neighbors[3].tolist()) == [2, 4]
+    assert (neighbors != np.arange(6)[:, None]).all()
+    assert scores.dtype == np.float16 and (np.diff(scores.astype(np.float32), axis=1) <= 0).all()
+
+def test_own_cluster_is_excluded_even_when_a_duplicate_stands_in(clip_search):
+    matrix = line_matrix(6)
+    # Rows 0 and 1 are near-duplicates; over the diversified index row 0's own slot may be row 1
+    clusters = np.array([0, 0, 2, 3, 4, 5])
+    index = clip_search.DiversifiedIndex(flat_index(matrix), clusters)
+    neighbors, _ = neighbour_table(matrix, index, k=2, quiet=True, clusters=clusters)
+    assert neighbors[0].tolist() == [2, 3]
+    assert neighbors[1].tolist() == [2, 3]
+
+def test_missing_neighbours_are_padded_with_finite_scores(clip_search):
+    matrix = line_matrix(4)
+    clusters = np.array([0, 0, 0, 3])
+    index = clip_search.DiversifiedIndex(flat_index(matrix), clusters)
+    neighbors, scores = neighbour_table(matrix, index, k=3, quiet=True, clusters=clusters)
+    assert neighbors[0].tolist() == [3, -1, -1]
+    # The cluster is represented by its member closest to row 3
+    assert neighbors[3].tolist() == [2, -1, -1]
+    assert np.isfinite(scores).all() and (scores[:, 1:] == 0).all()
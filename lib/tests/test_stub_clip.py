@@ -0,0 +1,30 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+Image = pytest.importorskip("PIL.Image")
+
+import stub_clip
+
+def test_load_matches_the_clip_interface():
+    model, preprocess = stub_clip.load("ViT-B/32")
+    image = preprocess(Image.new("L", (30, 40))).unsqueeze(0)
+    assert image.shape == (1, 3, 224, 224)
+    assert model.encode_image(image).shape == (1, 512)
+    assert model.encode_text(stub_clip.tokenize(["red dress"])).shape == (1, 512)
+    with pytest.raises(RuntimeError):
+        stub_clip.load("ViT-Z/99")
+
+def test_tokenize_is_deterministic_and_padded():
+    tokens = stub_clip.tokenize(["Red dress", "red DRESS now"])
+    assert tokens.shape == (2, stub_clip.CONTEXT_LENGTH)
+    assert torch.equal(tokens[0, :2], tokens[1, :2])
+    assert tokens[0, 2] == 0 and tokens[1, 2] != 0
+
+def test_encoders_are_deterministic_per_model():
+    tokens = stub_clip.tokenize("blue jeans")
+    first, _ = stub_clip.load("ViT-B/32")
+    again, _ = stub_clip.load("ViT-B/32")
+    other, _ = stub_clip.load("ViT-B/16")
+    assert torch.equal(first.encode_text(tokens), again.encode_text(tokens))
+    assert not torch.equal(first.encode_text(tokens), other.encode_text(tokens))
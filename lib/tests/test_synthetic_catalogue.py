@@ -0,0 +1,23 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("PIL")
+
+from synthetic_catalogue import CATALOGUE_TREE, COLUMNS, generate_catalogue, generate_styles
+
+def test_styles_are_deterministic_and_consistent():
+    df = generate_styles(2000, seed=5)
+    assert list(df.columns) == COLUMNS
+    assert df["id"].is_unique
+    pd.testing.assert_frame_equal(df, generate_styles(2000, seed=5))
+    assert not df.equals(generate_styles(2000, seed=6))
+    # Every article type belongs to its row's sub category, and that to its master category
+    for master, sub, article in df[["masterCategory", "subCategory", "articleType"]].drop_duplicates().itertuples(index=False):
+        assert article in CATALOGUE_TREE[master][sub]
+
+def test_catalogue_is_extended_not_rewritten(tmp_path):
+    summary = generate_catalogue(str(tmp_path), 30, image_size=(20, 24), quiet=True)
+    assert summary["images_written"] == 30
+    assert len(pd.read_csv(tmp_path / "styles.csv")) == 30
+    assert len(list((tmp_path / "images").iterdir())) == 30
+    assert generate_catalogue(str(tmp_path), 40, image_size=(20, 24), quiet=True)["images_written"] == 10
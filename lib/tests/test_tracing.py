@@ -0,0 +1,47 @@
+import pytest
+
+def test_spans_only_record_inside_tracing(clip_search):
+    with clip_search.span("outside"):
+        pass
+    with clip_search.tracing() as trace:
+        with clip_search.span("encode"):
+            pass
+        with clip_search.span("encode"):
+            pass
+    assert set(trace.stages) == {"encode", "total"}
+    assert trace.stages["total"] >= trace.stages["encode"]
+    with clip_search.tracing(False) as disabled:
+        assert disabled is None
+
+def test_traced_decorator(clip_search):
+    @clip_search.traced("work")
+    def work(value):
+        return value * 2
+
+    assert work(2) == 4
+    with clip_search.tracing() as trace:
+        assert work(3) == 6
+    assert "work" in trace.stages
+
+def test_merge_skips_the_other_total(clip_search):
+    trace, batch = clip_search.Trace(), clip_search.Trace()
+    trace.add("total", 1.0)
+    batch.add("total", 5.0)
+    batch.add("index_search", 0.002)
+    trace.merge(batch)
+    assert trace.timings_ms() == {"total": 1000.0, "index_search": 2.0}
+
+def test_histograms_render_cumulative_buckets(clip_search):
+    histograms = clip_search.StageHistograms(labels={"worker": "0"})
+    for seconds in (0.0005, 0.003, 0.003, 60.0):
+        histograms.observe("encode", seconds)
+    lines = histograms.render().splitlines()
+    assert lines[:2] == ["# HELP clip_search_stage_seconds Time spent per clip_search stage.",
+                         "# TYPE clip_search_stage_seconds histogram"]
+    assert 'clip_search_stage_seconds_bucket{stage="encode",worker="0",le="0.001"} 1' in lines
+    assert 'clip_search_stage_seconds_bucket{stage="encode",worker="0",le="0.005"} 3' in lines
+    assert 'clip_search_stage_seconds_bucket{stage="encode",worker="0",le="10.0"} 3' in lines
+    assert 'clip_search_stage_seconds_bucket{stage="encode",worker="0",le="+Inf"} 4' in lines
+    assert 'clip_search_stage_seconds_count{stage="encode",worker="0"} 4' in lines
+    total = next(line for line in lines if line.startswith("clip_search_stage_seconds_sum"))
+    assert float(total.rsplit(" ", 1)[1]) == pytest.approx(60.0065)
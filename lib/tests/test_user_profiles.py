@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import user_profiles
+from user_profiles import UserProfileStore
+
+DAY = 86400.0
+E1 = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+E2 = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+@pytest.fixture
+def store(tmp_path):
+    store = UserProfileStore(str(tmp_path / "profiles.sqlite"), half_life_days=1.0)
+    yield store
+    store.close()
+
+def test_older_interactions_decay_by_the_half_life(store):
+    store.record("u", E1, weight=1.0, timestamp=1000.0)
+    store.record("u", E2, weight=1.0, timestamp=1000.0 + DAY)
+    summary = store.summary("u")
+    assert summary["weight"] == pytest.approx(1.5)
+    assert summary["events"] == 2 and summary["updated"] == 1000.0 + DAY
+    expected = np.array([0.5, 1.0, 0.0]) / np.linalg.norm([0.5, 1.0, 0.0])
+    np.testing.assert_allclose(store.get("u"), expected, rtol=1e-6)
+
+def test_out_of_order_events_are_decayed_instead_of_the_sum(store):
+    store.record("u", E1, weight=2.0, timestamp=1000.0 + 2 * DAY)
+    store.record("u", E2, weight=4.0, timestamp=1000.0)
+    summary = store.summary("u")
+    assert summary["weight"] == pytest.approx(3.0)
+    assert summary["updated"] == 1000.0 + 2 * DAY
+    np.testing.assert_allclose(store.get("u"), [2.0 / np.sqrt(5.0), 1.0 / np.sqrt(5.0), 0.0], rtol=1e-6)
+
+def test_unknown_users_have_no_profile(store):
+    assert store.get("nobody") is None
+    assert store.summary("nobody") is None
+
+def test_reads_are_cached_for_the_ttl(store, tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(user_profiles.time, "monotonic", lambda: now[0])
+    store.record("u", E1, timestamp=1000.0)
+    assert store.get("u") is not None
+    assert store.get("v") is None
+
+    # Another process records for both users; the cached vector and the cached miss stay until the TTL
+    other = UserProfileStore(store.path, half_life_days=1.0)
+    other.record("u", E2, weight=100.0, timestamp=1000.0)
+    other.record("v", E2, timestamp=1000.0)
+    other.close()
+    np.testing.assert_allclose(store.get("u"), E1)
+    assert store.get("v") is None
+
+    now[0] += store.cache_ttl
+    assert store.get("u")[1] > 0.99
+    np.testing.assert_allclose(store.get("v"), E2)
+
+def test_recording_drops_the_users_cached_vector(store):
+    store.record("u", E1, timestamp=1000.0)
+    np.testing.assert_allclose(store.get("u"), E1)
+    store.record("u", E2, weight=3.0, timestamp=1000.0)
+    assert store.get("u")[1] > store.get("u")[0]
+
+def test_cache_keeps_the_most_recently_used_users(tmp_path):
+    store = UserProfileStore(str(tmp_path / "profiles.sqlite"), cache_size=2)
+    for user in ("a", "b", "c"):
+        store.get(user)
+    store.get("b")
+    store.get("d")
+    assert list(store._cache) == ["b", "d"]
+    store.close()
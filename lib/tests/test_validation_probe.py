@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from validation_probe import pick_thresholds, train_logistic
+
+def test_separated_scores_leave_an_ambiguous_band_between_the_cuts():
+    positives = np.linspace(0.6, 1.0, 101)
+    negatives = np.linspace(0.0, 0.3, 101)
+    accept, reject = pick_thresholds(positives, negatives, max_error=0.01)
+    assert accept == pytest.approx(0.6 + 0.4 * 0.01)
+    assert reject == pytest.approx(0.3 - 0.3 * 0.01)
+    assert (negatives >= accept).mean() == 0.0
+    assert (positives <= reject).mean() == 0.0
+
+def test_overlapping_scores_still_bound_both_error_rates():
+    rng = np.random.default_rng(0)
+    positives = rng.normal(0.6, 0.2, 2000)
+    negatives = rng.normal(0.4, 0.2, 2000)
+    accept, reject = pick_thresholds(positives, negatives, max_error=0.05)
+    assert accept >= reject
+    assert (negatives >= accept).mean() <= 0.05 + 1e-3
+    assert (positives <= reject).mean() <= 0.05 + 1e-3
+
+def test_weighted_logistic_regression_separates_unit_features():
+    rng = np.random.default_rng(1)
+    centre = np.zeros(8)
+    centre[0] = 1.0
+    features = np.concatenate([centre + 0.3 * rng.standard_normal((500, 8)), -centre + 0.3 * rng.standard_normal((20, 8))])
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    labels = np.concatenate([np.ones(500), np.zeros(20)])
+    # Balanced, as the probe trains: the 20 negatives weigh as much as the 500 positives
+    sample_weights = np.where(labels == 1, 0.5 / 500, 0.5 / 20)
+    weights, bias = train_logistic(features, labels, sample_weights, epochs=300)
+    predicted = features @ weights + bias > 0
+    assert (predicted == (labels == 1)).mean() > 0.97
+    assert predicted[labels == 0].mean() < 0.1
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+User Preference Profiles
+
+Keeps one compact preference vector per user: an exponentially-decayed,
+event-weighted mean of the image embeddings of the products they viewed,
+wishlisted, added to cart or bought. clip_search uses it to personalize
+results for requests carrying a "user_id".
+
+Profiles live in a SQLite file (one row per user: the decayed vector sum as
+a float32 blob, its total weight and last update time) with an in-memory LRU
+in front, so a search costs at most one row read per user per TTL.
+
+  record  add one interaction:  --user-id U --product-id P --event wishlist
+  ingest  add many from JSONL:  {"user_id", "product_id", "event", "timestamp"} per line
+  show    print a user's profile summary
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# How much each interaction pulls the profile towards the product
+EVENT_WEIGHTS = {
+    "view": 1.0,
+    "click": 1.0,
+    "wishlist": 3.0,
+    "cart": 4.0,
+    "purchase": 6.0,
+}
+
+DEFAULT_HALF_LIFE_DAYS = float(os.environ.get("CLIP_PROFILE_HALF_LIFE_DAYS", "14"))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain per-user preference vectors")
+    parser.add_argument("--store", type=str, help="Profile database (default: <embeddings>/user_profiles.sqlite)")
+    parser.add_argument("--half-life-days", type=float, default=DEFAULT_HALF_LIFE_DAYS,
+                        help="Interactions lose half their weight after this many days")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record one interaction")
+    record.add_argument("--user-id", type=str, required=True)
+    record.add_argument("--product-id", type=str, required=True)
+    record.add_argument("--event", type=str, default="view", choices=sorted(EVENT_WEIGHTS))
+
+    ingest = subparsers.add_parser("ingest", help="Record interactions from a JSONL file (- for stdin)")
+    ingest.add_argument("--events", type=str, default="-")
+
+    show = subparsers.add_parser("show", help="Print a user's profile summary")
+    show.add_argument("--user-id", type=str, required=True)
+
+    return parser.parse_args()
+
+class UserProfileStore:
+    """On-disk preference vectors with an in-memory LRU of normalized profiles"""
+
+    def __init__(self, path, half_life_days=DEFAULT_HALF_LIFE_DAYS, cache_size=10000, cache_ttl=60.0):
+        self.path = path
+        self.half_life = half_life_days * 86400.0
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " user_id TEXT PRIMARY KEY, vector BLOB NOT NULL, weight REAL NOT NULL,"
+            " updated REAL NOT NULL, events INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def _read(self, user_id):
+        row = self._db.execute(
+            "SELECT vector, weight, updated, events FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).copy(), row[1], row[2], row[3]
+
+    def get(self, user_id):
+        """Return the user's normalized preference vector, or None if they have no history"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and now - cached[1] < self.cache_ttl:
+                self._cache.move_to_end(user_id)
+                return cached[0]
+
+            stored = self._read(user_id)
+            vector = None
+            if stored is not None:
+                norm = np.linalg.norm(stored[0])
+                if norm > 0:
+                    vector = stored[0] / norm
+
+            # Remember misses too, so anonymous traffic doesn't hit the database every time
+            self._cache[user_id] = (vector, now)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return vector
+
+    def record(self, user_id, embedding, weight=1.0, timestamp=None):
+        """Decay the stored sum to `timestamp` and add one weighted embedding"""
+        timestamp = time.time() if timestamp is None else timestamp
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            stored = self._read(user_id)
+            if stored is None:
+                vector, total, events = weight * embedding, weight, 1
+            else:
+                # Out-of-order (older) events are decayed instead of the stored sum
+                age = timestamp - stored[2]
+                if age >= 0:
+                    decay = 0.5 ** (age / self.half_life)
+                    vector, total = stored[0] * decay + weight * embedding, stored[1] * decay + weight
+                else:
+                    decay = 0.5 ** (-age / self.half_life)
+                    vector, total = stored[0] + decay * weight * embedding, stored[1] + decay * weight
+                    timestamp = stored[2]
+                events = stored[3] + 1
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO profiles (user_id, vector, weight, updated, events) VALUES (?, ?, ?, ?, ?)",
+                (user_id, np.asarray(vector, dtype=np.float32).tobytes(), float(total), float(timestamp), events)
+            )
+            self._db.commit()
+            self._cache.pop(user_id, None)
+
+    def summary(self, user_id):
+        stored = self._read(user_id)
+        if stored is None:
+            return None
+        return {"user_id": user_id, "weight": stored[1], "updated": stored[2], "events": stored[3],
+                "dimension": int(len(stored[0]))}
+
+    def close(self):
+        self._db.close()
+
+def main():
+    args = parse_args()
+
+    import clip_search
+
+    store = UserProfileStore(args.store or clip_search.USER_PROFILES_PATH, args.half_life_days)
+
+    def record_event(user_id, product_id, event, timestamp=None):
+        if event not in EVENT_WEIGHTS:
+            raise ValueError(f"Unknown event type: {event}")
+        # The web app's analytics events carry Date.now() milliseconds
+        if timestamp is not None and timestamp > 1e12:
+            timestamp = timestamp / 1000.0
+        embedding = clip_search.stored_embedding(product_id, None)
+        store.record(str(user_id), embedding, EVENT_WEIGHTS[event], timestamp)
+
+    if args.command == "record":
+        record_event(args.user_id, args.product_id, args.event)
+        print(json.dumps(store.summary(args.user_id)))
+    elif args.command == "ingest":
+        source = sys.stdin if args.events == "-" else open(args.events)
+        recorded = skipped = 0
+        with source:
+            for line in source:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                    record_event(event["user_id"], event["product_id"], event.get("event", "view"),
+                                 event.get("timestamp"))
+                    recorded += 1
+                except (KeyError, ValueError) as e:
+                    print(f"Skipping event: {e}", file=sys.stderr)
+                    skipped += 1
+        print(json.dumps({"recorded": recorded, "skipped": skipped}))
+    elif args.command == "show":
+        print(json.dumps(store.summary(args.user_id)))
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Fashion Validation Probe
+
+Trains the linear probe behind clip_search's cheap validation tier: a logistic
+regression on CLIP image features that separates catalogue images from
+non-fashion inputs, with accept/reject thresholds picked on held-out data so
+the cheap tier only decides the cases it gets right.
+
+Positives are catalogue image embeddings (image_matrix.npy); negatives are
+real non-fashion photos from --negative-dir, which is required. Both sides are
+images: CLIP puts text and image features in separate regions, so text-prompt
+negatives would only teach the probe "image vs text" and every real photo
+would land on the fashion side. The classes are weighted equally however few
+negative photos there are; a few hundred give usable thresholds.
+
+Writes validation_probe.npz (weights, bias, accept, reject) to the artifact
+root of --model, beside versions/, so it stays in use across republished
+builds, and a JSON summary with the thresholds and how much of the held-out
+set the cheap tier decides.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the linear probe for cheap image validation")
+    parser.add_argument("--model", type=str, help="CLIP model to train the probe for (default: CLIP_MODEL)")
+    parser.add_argument("--negative-dir", type=str, required=True, help="Directory of non-fashion images used as negatives")
+    parser.add_argument("--max-positives", type=int, default=20000, help="Catalogue embeddings sampled as positives")
+    parser.add_argument("--max-error", type=float, default=0.01,
+                        help="Held-out rate of wrong accepts (and of wrong rejects) the thresholds allow")
+    parser.add_argument("--epochs", type=int, default=300, help="Gradient descent steps")
+    parser.add_argument("--l2", type=float, default=1e-3, help="Weight decay")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling and split seed")
+    parser.add_argument("--quiet", action="store_true", help="Reduce debug output")
+
+    return parser.parse_args()
+
+def image_features(model, preprocess, device, image_dir, quiet=False):
+    import torch
+    from PIL import Image
+
+    names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    features = []
+    for start in range(0, len(names), 64):
+        images = []
+        for name in names[start:start + 64]:
+            try:
+                images.append(preprocess(Image.open(os.path.join(image_dir, name)).convert("RGB")))
+            except Exception as e:
+                if not quiet:
+                    print(f"Skipping {name}: {e}", file=sys.stderr)
+        if not images:
+            continue
+        with torch.no_grad():
+            batch = model.encode_image(torch.stack(images).to(device))
+            batch /= batch.norm(dim=-1, keepdim=True)
+        features.append(batch.float().cpu().numpy())
+    return np.concatenate(features) if features else np.zeros((0, 0), dtype=np.float32)
+
+def train_logistic(features, labels, sample_weights, epochs=300, l2=1e-3):
+    """Full-batch gradient descent on the weighted logistic loss; returns (weights, bias)"""
+    weights = np.zeros(features.shape[1], dtype=np.float64)
+    bias = 0.0
+    # Unit-norm features: a fixed step converges without line search
+    rate = 2.0
+    total = sample_weights.sum()
+    for _ in range(epochs):
+        probability = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+        error = (probability - labels) * sample_weights
+        weights -= rate * (features.T @ error / total + l2 * weights)
+        bias -= rate * error.sum() / total
+    return weights.astype(np.float32), float(bias)
+
+def pick_thresholds(positive_scores, negative_scores, max_error):
+    """Accept above what at most max_error negatives reach, reject below what at most max_error positives fall to"""
+    negative_cut = float(np.quantile(negative_scores, 1.0 - max_error))
+    positive_cut = float(np.quantile(positive_scores, max_error))
+    # Well-separated classes leave an ambiguous band between the cuts; overlapping ones still honour both
+    return max(negative_cut, positive_cut), min(negative_cut, positive_cut)
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+
+    import clip
+    import torch
+    import clip_search
+
+    if args.model and args.model != clip_search.CLIP_MODEL:
+        clip_search.use_model(args.model)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, preprocess = clip.load(clip_search.CLIP_MODEL, device=device)
+    model.eval()
+
+    rng = np.random.default_rng(args.seed)
+    matrix = np.load(clip_search.IMAGE_MATRIX_PATH, mmap_mode="r")
+    rows = np.sort(rng.choice(len(matrix), size=min(args.max_positives, len(matrix)), replace=False))
+    positives = np.asarray(matrix[rows], dtype=np.float32)
+    negatives = image_features(model, preprocess, device, args.negative_dir, args.quiet)
+    # Both classes need held-out members for the thresholds
+    if len(negatives) < 2:
+        print(f"Error: {args.negative_dir} has fewer than 2 readable images to use as negatives", file=sys.stderr)
+        sys.exit(1)
+
+    features = np.concatenate([positives, negatives]).astype(np.float64)
+    labels = np.concatenate([np.ones(len(positives)), np.zeros(len(negatives))])
+
+    # Hold out a fifth of each class for the thresholds
+    held_out = np.zeros(len(labels), dtype=bool)
+    for label in (0, 1):
+        members = np.flatnonzero(labels == label)
+        held_out[rng.choice(members, size=max(1, len(members) // 5), replace=False)] = True
+    train = ~held_out
+
+    # Balance the classes so the handful of negatives count as much as the catalogue
+    sample_weights = np.where(labels == 1, 0.5 / max(1, (labels[train] == 1).sum()),
+                              0.5 / max(1, (labels[train] == 0).sum()))
+    if not args.quiet:
+        print(f"Training on {train.sum()} embeddings ({len(positives)} positive, {len(negatives)} negative)...",
+              file=sys.stderr)
+    weights, bias = train_logistic(features[train], labels[train], sample_weights[train], args.epochs, args.l2)
+
+    scores = 1.0 / (1.0 + np.exp(-(features[held_out] @ weights + bias)))
+    held_labels = labels[held_out]
+    accept, reject = pick_thresholds(scores[held_labels == 1], scores[held_labels == 0], args.max_error)
+
+    probe_path = clip_search.VALIDATION_PROBE_PATH
+    with open(probe_path + ".tmp", "wb") as f:
+        np.savez(f, weights=weights, bias=np.float32(bias), accept=np.float32(accept), reject=np.float32(reject))
+    os.replace(probe_path + ".tmp", probe_path)
+
+    decided = (scores >= accept) | (scores <= reject)
+    summary = {
+        "positives": int(len(positives)),
+        "negatives": int(len(negatives)),
+        "held_out": int(held_out.sum()),
+        "accept": accept,
+        "reject": reject,
+        "held_out_decided": float(decided.mean()),
+        "held_out_false_accept": float((scores[held_labels == 0] >= accept).mean()),
+        "held_out_false_reject": float((scores[held_labels == 1] <= reject).mean()),
+        "elapsed_s": time.perf_counter() - started,
+    }
+    with open(os.path.splitext(probe_path)[0] + ".json", "w") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,24 @@ import path from "path"
 import fs from "fs"
 import { exec } from "child_process"
 import { promisify } from "util"
-import os from "os"
 
 const execAsync = promisify(exec)
 
+// Run a command with `input` written to its stdin, so uploads never touch the disk
+function execWithInput(
+  command: string,
+  input: Buffer,
+  env?: NodeJS.ProcessEnv,
+): Promise<{ stdout: string; stderr: string }> {
+  return new Promise((resolve, reject) => {
+    const child = exec(command, { env, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
+      if (error) reject(error)
+      else resolve({ stdout, stderr })
+    })
+    child.stdin?.end(input)
+  })
+}
+
 // Define paths - using the actual dataset location
 const DATASET_PATH = process.env.DATASET_PATH || "D:/project/kaatchi-fashion-vlm/data/fashion-dataset"
 const IMAGE_FOLDER = path.join(DATASET_PATH, "images")
@@ -42,20 +56,6 @@ export async function checkEmbeddingsAvailability(): Promise<boolean> {
   }
 }
 
-// Save temporary image for processing
-export async function saveTempImage(imageBuffer: Buffer): Promise<string> {
-  const tempDir = os.tmpdir()
-  const imagePath = path.join(tempDir, `upload_${Date.now()}.jpg`)
-
-  try {
-    fs.writeFileSync(imagePath, imageBuffer)
-    return imagePath
-  } catch (error) {
-    if (isDev) console.error("[Server] Error saving temporary image:", error)
-    throw new Error("Failed to save temporary image")
-  }
-}
-
 // Update the validateFashionImage function to be more sensitive to accessories
 export async function validateFashionImage(imageBuffer: Buffer): Promise<{
   isValid: boolean
@@ -63,20 +63,16 @@ export async function validateFashionImage(imageBuffer: Buffer): Promise<{
   dominantColors?: string[]
 }> {
   try {
-    // Save the image to a temporary file for processing
-    const tempDir = os.tmpdir()
-    const imagePath = path.join(tempDir, `validate_${Date.now()}.jpg`)
-    fs.writeFileSync(imagePath, imageBuffer)
-
     try {
       // Path to the Python script
       const scriptPath = path.join(process.cwd(), "lib", "clip_search.py")
 
       // Execute a simple classification to determine if the image is fashion-related
       // Added color-detection flag to improve color extraction and a new rotation-check flag
-      const command = `python "${scriptPath}" --search-type validate --image-path "${imagePath}" --color-detection --rotation-check --quiet`
+      // The image is piped to stdin (--image-path -) instead of going through a temp file
+      const command = `python "${scriptPath}" --search-type validate --image-path - --color-detection --rotation-check --quiet`
 
-      const { stdout, stderr } = await execAsync(command)
+      const { stdout, stderr } = await execWithInput(command, imageBuffer)
 
       // Parse the validation result
       const result = JSON.parse(stdout)
@@ -215,9 +211,6 @@ export async function validateFashionImage(imageBuffer: Buffer): Promise<{
         message:
           "Unable to validate if this is a fashion image. Please try uploading a clearer image of clothing or accessories.",
       }
-    } finally {
-      // Clean up the temporary file
-      cleanupTempFile(imagePath)
     }
   } catch (error) {
     if (isDev) console.error("[Server] Error in validateFashionImage:", error)
@@ -232,7 +225,7 @@ export async function validateFashionImage(imageBuffer: Buffer): Promise<{
 export async function executeSearch(
   searchType: "text" | "image" | "multimodal",
   query?: string,
-  imagePath?: string,
+  imageBuffer?: Buffer,
   topK = 50, // Changed default from 5 to 50
   dominantColors?: string[],
 ): Promise<any> {
@@ -247,8 +240,9 @@ export async function executeSearch(
       command += ` --query "${query}"`
     }
 
-    if (imagePath) {
-      command += ` --image-path "${imagePath}"`
+    // The image is piped to stdin (--image-path -) instead of going through a temp file
+    if (imageBuffer) {
+      command += ` --image-path -`
     }
 
     // Add dominant colors if available
@@ -264,7 +258,9 @@ export async function executeSearch(
     }
 
     // Execute Python script with the modified environment
-    const { stdout, stderr } = await execAsync(command, { env })
+    const { stdout, stderr } = imageBuffer
+      ? await execWithInput(command, imageBuffer, env)
+      : await execAsync(command, { env })
 
     if (stderr && stderr.trim() !== "" && isDev) {
       // Only log stderr in development if it contains actual error messages
@@ -351,17 +347,6 @@ export async function executeSearch(
   }
 }
 
-// Clean up temporary files
-export function cleanupTempFile(filePath: string): void {
-  try {
-    if (fs.existsSync(filePath)) {
-      fs.unlinkSync(filePath)
-    }
-  } catch (error) {
-    if (isDev) console.error("[Server] Error cleaning up temporary file:", error)
-  }
-}
-
 // Update the mockSearch function to provide more realistic and detailed mock data
 export async function mockSearch(
   searchType: "text" | "image" | "multimodal",
@@ -514,19 +499,14 @@ export async function validateTextImageCoherence(
   imageBuffer: Buffer,
 ): Promise<{ isCoherent: boolean; message: string; similarity?: number }> {
   try {
-    // Save the image to a temporary file for processing
-    const tempDir = os.tmpdir()
-    const imagePath = path.join(tempDir, `coherence_${Date.now()}.jpg`)
-    fs.writeFileSync(imagePath, imageBuffer)
-
     try {
       // Path to the Python script
       const scriptPath = path.join(process.cwd(), "lib", "clip_search.py")
 
-      // Execute the coherence check
-      const command = `python "${scriptPath}" --search-type coherence --query "${query}" --image-path "${imagePath}" --quiet`
+      // Execute the coherence check, piping the image to stdin
+      const command = `python "${scriptPath}" --search-type coherence --query "${query}" --image-path - --quiet`
 
-      const { stdout, stderr } = await execAsync(command)
+      const { stdout, stderr } = await execWithInput(command, imageBuffer)
 
       // Parse the validation result
       const result = JSON.parse(stdout)
@@ -560,9 +540,6 @@ export async function validateTextImageCoherence(
     } catch (error) {
       if (isDev) console.error("[Server] Error validating text-image coherence:", error)
       return { isCoherent: true, message: "Coherence check skipped due to error" }
-    } finally {
-      // Clean up the temporary file
-      cleanupTempFile(imagePath)
     }
   } catch (error) {
     if (isDev) console.error("[Server] Error in validateTextImageCoherence:", error)